@@ -0,0 +1,50 @@
+# Benchmark: efetch parsing throughput (articles/s) versus process-pool worker count.
+#
+# Usage (from the repository root):
+#     python benchmarks/bench_parse_workers.py --articles 20000 --workers 0 1 2 4 8
+#
+# Worker count 0 is the in-process parser (PubMedArticle objects built directly); any other
+# count sends the response bodies through a ProcessPoolExecutor that returns compact records,
+# exactly as AsyncPubMed(parse_workers=N) does.
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pymed.parsing import parseArticles, parseArticleRecords, articlesFromRecords
+from fixtures import efetch_bodies
+
+
+def run(bodies, workers):
+    start = time.perf_counter()
+    count = 0
+    if workers == 0:
+        for body in bodies:
+            count += len(parseArticles(body))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for records in pool.map(parseArticleRecords, bodies):
+                count += len(articlesFromRecords(records))
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parsing throughput versus worker count')
+    parser.add_argument('--articles', type=int, default=10000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    args = parser.parse_args()
+
+    bodies = efetch_bodies(args.articles)
+    print(f'{"workers":>8} {"articles":>9} {"seconds":>8} {"articles/s":>11}')
+    for workers in args.workers:
+        count, elapsed = run(bodies, workers)
+        print(f'{workers:>8} {count:>9} {elapsed:>8.2f} {count / elapsed:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
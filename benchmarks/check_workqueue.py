@@ -0,0 +1,216 @@
+# Check the work queue backends (src/workqueue.py) without a Redis server.
+#
+# Usage (from the repository root):
+#     python benchmarks/check_workqueue.py
+#
+# The same scenario runs against the SQLite queue and against the Redis queue with an in-memory stand-in client:
+# enqueueing, leasing in order, taking over a lease that ran out, heartbeats, first-result-wins completion, releasing
+# until an item fails and re-enqueueing it, and the coordinator's side (summaries_from_queue) with a local summary
+# cache. Every failed check is printed and makes the exit status non-zero.
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from globalconf import globalconf
+from workqueue import SqliteWorkQueue, RedisWorkQueue, summaries_from_queue, PENDING, LEASED, DONE, FAILED
+
+
+class MemoryRedis:
+    # The commands RedisWorkQueue uses, on dictionaries; like redis-py, values are returned as bytes
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key, kind):
+        return self.data.setdefault(key, kind())
+
+    @staticmethod
+    def _bytes(value):
+        return None if value is None else str(value).encode('utf-8')
+
+    @staticmethod
+    def _text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def hsetnx(self, key, field, value):
+        with self.lock:
+            fields = self._get(key, dict)
+            if field in fields:
+                return 0
+            fields[field] = value
+            return 1
+
+    def hset(self, key, field, value):
+        with self.lock:
+            self._get(key, dict)[field] = value
+
+    def hget(self, key, field):
+        return self._bytes(self._get(key, dict).get(field))
+
+    def hexists(self, key, field):
+        return field in self._get(key, dict)
+
+    def hdel(self, key, field):
+        with self.lock:
+            return int(self._get(key, dict).pop(field, None) is not None)
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            fields = self._get(key, dict)
+            fields[field] = int(fields.get(field, 0)) + amount
+            return fields[field]
+
+    def rpush(self, key, value):
+        with self.lock:
+            self._get(key, list).append(value)
+
+    def lpop(self, key):
+        with self.lock:
+            values = self._get(key, list)
+            return self._bytes(values.pop(0)) if len(values) > 0 else None
+
+    def llen(self, key):
+        return len(self._get(key, list))
+
+    def zadd(self, key, mapping, xx=False):
+        with self.lock:
+            scores = self._get(key, dict)
+            for member, score in mapping.items():
+                if not xx or member in scores:
+                    scores[member] = score
+
+    def zrem(self, key, member):
+        with self.lock:
+            return int(self._get(key, dict).pop(self._text(member), None) is not None)
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        members = [member for member, score in sorted(self._get(key, dict).items(), key=lambda item: item[1])
+                   if score <= high]
+        return [self._bytes(member) for member in members[start:None if num is None else start + num]]
+
+    def zscore(self, key, member):
+        return self._get(key, dict).get(member)
+
+    def zcard(self, key):
+        return len(self._get(key, dict))
+
+    def sadd(self, key, member):
+        with self.lock:
+            self._get(key, set).add(member)
+
+    def srem(self, key, member):
+        with self.lock:
+            members = self._get(key, set)
+            if member not in members:
+                return 0
+            members.remove(member)
+            return 1
+
+    def sismember(self, key, member):
+        return member in self._get(key, set)
+
+    def close(self):
+        pass
+
+
+def check_queue(name, open_queue):
+    # Returns the descriptions of the checks that failed
+    failures = []
+
+    def check(condition, description):
+        if not condition:
+            failures.append(f'{name}: {description}')
+
+    queue = open_queue('summaries-test')
+    items = [('1', 'abstract 1'), ('2', 'abstract 2'), ('3', 'abstract 3')]
+    queue.enqueue(items)
+    queue.enqueue(items)
+    check(queue.outstanding() == 3, f'enqueueing twice queues every item once ({queue.outstanding()} outstanding)')
+
+    leased = queue.lease('w1', 2, 60)
+    check(leased == [('1', 'abstract 1'), ('2', 'abstract 2')], f'items are leased in order ({leased})')
+    leased = queue.lease('w2', 5, 60)
+    check(leased == [('3', 'abstract 3')], f'leased items are not leased again ({leased})')
+    check(queue.lease('w2', 5, 60) == [], 'nothing is left to lease')
+    check(queue.status('1') == (LEASED, None), f'a leased item is reported as leased ({queue.status("1")})')
+
+    # First result wins
+    check(queue.complete('w1', '1', 'summary 1'), 'the first result is committed')
+    check(not queue.complete('w2', '1', 'other summary'), 'a second result is ignored')
+    check(queue.status('1') == (DONE, 'summary 1'), f'the first result is kept ({queue.status("1")})')
+
+    # A lease that runs out is taken over; the heartbeat of the previous holder no longer extends it
+    queue.enqueue([('4', 'abstract 4')])
+    check(queue.lease('w1', 1, -1) == [('4', 'abstract 4')], 'a new item is leased')
+    check(queue.lease('w2', 1, 60) == [('4', 'abstract 4')], 'an item whose lease ran out is taken over')
+    queue.heartbeat('w1', ['4'], 60)
+    check(queue.lease('w3', 1, 60) == [], 'a taken-over lease stays with its new holder')
+
+    # A heartbeat keeps a lease from running out
+    queue.enqueue([('5', 'abstract 5')])
+    check(queue.lease('w1', 1, -1) == [('5', 'abstract 5')], 'a new item is leased')
+    queue.heartbeat('w1', ['5'], 60)
+    check(queue.lease('w2', 1, 60) == [], 'a lease extended by a heartbeat is not taken over')
+
+    # Released items are retried until they have failed WORK_MAX_ATTEMPTS times; enqueueing a failed item retries it
+    queue.release('w1', '3')
+    check(queue.status('3') == (LEASED, None), 'an item is only released by its holder')
+    queue.release('w2', '3')
+    for attempt in range(1, globalconf.WORK_MAX_ATTEMPTS):
+        check(queue.status('3') == (PENDING, None), f'an item released {attempt} time(s) is pending again')
+        check(queue.lease('w2', 1, 60) == [('3', 'abstract 3')], 'a released item is leased again')
+        queue.release('w2', '3')
+    check(queue.status('3') == (FAILED, None), f'an item released WORK_MAX_ATTEMPTS times has failed ({queue.status("3")})')
+    queue.enqueue([('3', 'abstract 3')])
+    check(queue.status('3') == (PENDING, None), f'a failed item is retried when enqueued again ({queue.status("3")})')
+    queue.close()
+
+    # The coordinator: summaries in the local cache are not queued, those read back from the queue are cached
+    queue = open_queue('summaries-coordinator')
+    cache = {'6': 'cached summary 6'}
+    summarized = []
+
+    def summarize(batch):
+        for pmid, abstract in batch:
+            summarized.append(pmid)
+            yield pmid, None if pmid == '8' else f'summary of {abstract}'
+
+    items = [('6', 'abstract 6'), ('7', 'abstract 7'), ('8', 'abstract 8')]
+    results = list(summaries_from_queue(queue, items, summarize, 2, 'failure', worker='coordinator',
+                                        lookup=cache.get, store=cache.__setitem__))
+    check(results == [('6', 'cached summary 6'), ('7', 'summary of abstract 7'), ('8', 'failure')],
+          f'the coordinator yields cached, queued and failed summaries in order ({results})')
+    check(queue.status('6') == (None, None), 'a cached summary is not queued')
+    check('6' not in summarized, 'a cached summary is not summarized again')
+    check(summarized.count('8') == globalconf.WORK_MAX_ATTEMPTS, f'a failing item is tried WORK_MAX_ATTEMPTS times ({summarized})')
+    check(cache.get('7') == 'summary of abstract 7', 'a summary from the queue is cached')
+    check('8' not in cache, 'a failure is not cached')
+    queue.close()
+    return failures
+
+
+def main():
+    globalconf.WORK_POLL_SECONDS = 0.01
+    directory = tempfile.mkdtemp()
+    client = MemoryRedis()
+    backends = {
+        'sqlite': lambda name: SqliteWorkQueue(os.path.join(directory, 'queue.sqlite3'), name),
+        'redis': lambda name: RedisWorkQueue(client, name),
+    }
+
+    failures = []
+    for name, open_queue in backends.items():
+        failed = check_queue(name, open_queue)
+        print(f'{name}: {"OK" if len(failed) == 0 else f"{len(failed)} failed checks"}')
+        failures += failed
+    for failure in failures:
+        print(failure)
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# Check and time the DOCX writers (src/docx_digest.py) against each other.
+#
+# Usage (from the repository root):
+#     python benchmarks/compare_docx.py --corpora small 1k
+#
+# Every article of a corpus is rendered with both writers, the way executeMain does (with summaries on most articles
+# and a near-duplicate link on some). Both documents are then read back with python-docx and compared paragraph by
+# paragraph: indent, and the text, bold and color of every run, including tabs, line breaks and page breaks. Any
+# difference is printed and makes the exit status non-zero.
+#
+# Both documents are also harvested the way train-triage harvests reviewed digests (triage.reviewed_articles), which
+# must find every article under its own title, footer links line or not.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import docx
+from docx_digest import DOCX_WRITERS
+from globalconf import globalconf
+from triage import reviewed_articles, tokenize
+from pymed.parsing import parseArticles
+from fixtures import Corpus
+
+
+def render(writer, articles, filename):
+    start = time.perf_counter()
+    document = DOCX_WRITERS[writer]()
+    for i, article in enumerate(articles):
+        authors = "; ".join(author.displayName() for author in article.authors)
+        summary = None if i % 5 == 4 else f'Summary of {article.pubmed_id}:\n\tthe main finding & <its> "caveats" '
+        duplicate_pmid = articles[0].pubmed_id if i % 7 == 6 else None
+        footer_lines = [f'{article.publication_date} - {article.journal} - {article.pubmed_id} - {article.doi}']
+        if i % 3 != 2:
+            footer_lines.append(f'Cited by {i % 4} - Related: PMID {articles[0].pubmed_id}')
+        document.add_article(article.title, authors, 'ChatGPT Summary: ', summary, duplicate_pmid,
+                             article.structuredAbstract, footer_lines)
+    document.save(filename)
+    return time.perf_counter() - start
+
+
+def layout(filename):
+    # The paragraphs of a document as (indent, runs); empty runs are dropped, so that <w:r/> and a run without text
+    # compare equal
+    paragraphs = []
+    for paragraph in docx.Document(filename).paragraphs:
+        indent = paragraph.paragraph_format.left_indent
+        runs = []
+        for run in paragraph.runs:
+            page_break = any(br.get(docx.oxml.ns.qn('w:type')) == 'page' for br in run._r.findall(docx.oxml.ns.qn('w:br')))
+            text = run.text + ('<page break>' if page_break else '')
+            if text != '':
+                runs.append((text, run.bold, None if run.font.color.rgb is None else str(run.font.color.rgb)))
+        paragraphs.append((indent, runs))
+    return paragraphs
+
+
+def harvest_differences(articles, filename):
+    # Harvest the digest as train-triage would; returns the PMIDs that are missing or whose title tokens are wrong
+    basedir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(basedir, globalconf.OUTPUT_DIRECTORY))
+    shutil.copy(filename, os.path.join(basedir, globalconf.OUTPUT_DIRECTORY, os.path.basename(filename)))
+    harvested = {pmid: [token for token in tokens if token.startswith('t:')] for pmid, tokens, _ in reviewed_articles(basedir)}
+    return [article.pubmed_id for article in articles
+            if harvested.get(article.pubmed_id) != [f't:{word}' for word in tokenize(article.title)]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the fast and the python-docx DOCX writers')
+    parser.add_argument('--corpora', nargs='+', default=['small', '1k'])
+    args = parser.parse_args()
+
+    differences = 0
+    directory = tempfile.mkdtemp()
+    for name in args.corpora:
+        corpus = Corpus(name)
+        articles = [article for body in corpus.efetch_bodies() for article in parseArticles(body)]
+
+        seconds = {}
+        layouts = {}
+        for writer in DOCX_WRITERS:
+            filename = os.path.join(directory, f'{name}_{writer}.docx')
+            seconds[writer] = render(writer, articles, filename)
+            layouts[writer] = layout(filename)
+            wrong = harvest_differences(articles, filename)
+            if len(wrong) > 0:
+                print(f'{name}: {writer} digest harvested wrong for {len(wrong)} articles, e.g. {wrong[:5]}')
+                differences += len(wrong)
+
+        expected, actual = layouts['python-docx'], layouts['fast']
+        mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+        if len(expected) != len(actual):
+            print(f'{name}: {len(actual)} paragraphs instead of {len(expected)}')
+            differences += 1
+        for i in mismatches[:5]:
+            print(f'{name}: paragraph {i} differs:\n    python-docx: {expected[i]}\n    fast:        {actual[i]}')
+        differences += len(mismatches)
+
+        print(f'{name}: {len(articles)} articles, {len(expected)} paragraphs, {len(mismatches)} differences; '
+              + ', '.join(f'{writer} {seconds[writer]:.2f} s' for writer in DOCX_WRITERS))
+
+    return 1 if differences > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# Synthetic PubMed fixtures for the benchmarks.
+#
+# The generated records follow the efetch PubmedArticle layout closely enough to exercise
+# every extractor in pymed (structured abstracts, long author lists with affiliations,
+# keywords, DOIs and dates). Generation is deterministic, so the same PMID always yields
+# the same record.
+
+import json
+import os
+import random
+from xml.etree import ElementTree
+
+FIRST_PMID = 30000000
+
+SECTIONS = ['BACKGROUND', 'METHODS', 'RESULTS', 'CONCLUSIONS']
+WORDS = ('patients randomized trial outcome cohort mortality hazard ratio confidence interval '
+         'primary care adults children diabetes hypertension inhibitor placebo follow-up '
+         'significant reduction increase risk association analysis participants').split()
+JOURNALS = ['JAMA', 'The New England journal of medicine', 'Annals of family medicine',
+            'Annals of internal medicine', 'Nature medicine']
+LASTNAMES = ['Smith', 'Nguyen', 'Garcia', 'Patel', 'Kim', 'Müller', 'Rossi', 'Okafor']
+AFFILIATIONS = ['Department of Family Medicine, University of Kansas Medical Center, Kansas City, KS, USA.',
+                'Division of General Internal Medicine, Massachusetts General Hospital, Boston, MA, USA.',
+                'Department of Epidemiology, Harvard T.H. Chan School of Public Health, Boston, MA, USA.']
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def publication_date(pmid):
+    """Return the (year, month, day) publication date of a synthetic PMID."""
+    rng = random.Random(-pmid)
+    return 2023, rng.randint(1, 12), rng.randint(1, 28)
+
+
+def links(pmid, pmids):
+    """Return the (citing PMIDs, related PMIDs) of a PMID, drawn from the PMIDs of its corpus."""
+    rng = random.Random(pmid * 7919)
+    return rng.sample(pmids, min(len(pmids), rng.randint(0, 8))), rng.sample(pmids, min(len(pmids), 10))
+
+
+def article_xml(pmid):
+    """Return the PubmedArticle XML for a single synthetic PMID."""
+    rng = random.Random(pmid)
+    n_authors = rng.choice([3, 8, 12, 40, 300]) if rng.random() < 0.05 else rng.randint(2, 12)
+    authors = ''.join(
+        f'<Author><LastName>{rng.choice(LASTNAMES)}</LastName><ForeName>Alex</ForeName><Initials>A</Initials>'
+        f'<AffiliationInfo><Affiliation>{rng.choice(AFFILIATIONS)}</Affiliation></AffiliationInfo></Author>'
+        for _ in range(n_authors)
+    )
+    abstract = ''.join(
+        f'<AbstractText Label="{label}">{" ".join(_sentence(rng, rng.randint(12, 30)) for _ in range(3))}</AbstractText>'
+        for label in SECTIONS
+    )
+    keywords = ''.join(f'<Keyword>{rng.choice(WORDS)}</Keyword>' for _ in range(4))
+    year, month, day = publication_date(pmid)
+    return (
+        f'<PubmedArticle><MedlineCitation><PMID Version="1">{pmid}</PMID><Article>'
+        f'<Journal><Title>{rng.choice(JOURNALS)}</Title></Journal>'
+        f'<ArticleTitle>{_sentence(rng, 14)}</ArticleTitle>'
+        f'<ELocationID EIdType="doi">10.1001/synthetic.{pmid}</ELocationID>'
+        f'<Abstract>{abstract}<CopyrightInformation>Copyright 2023 the authors.</CopyrightInformation></Abstract>'
+        f'<AuthorList>{authors}</AuthorList></Article>'
+        f'<MeshHeadingList><MeshHeading><DescriptorName>Humans</DescriptorName></MeshHeading></MeshHeadingList>'
+        f'<KeywordList>{keywords}</KeywordList></MedlineCitation>'
+        f'<PubmedData><History><PubMedPubDate PubStatus="pubmed"><Year>{year}</Year><Month>{month}</Month>'
+        f'<Day>{day}</Day></PubMedPubDate></History></PubmedData></PubmedArticle>'
+    )
+
+
+def efetch_body(pmids):
+    """Return an efetch response body (PubmedArticleSet) for the given PMIDs."""
+    return '<?xml version="1.0" ?><PubmedArticleSet>' + ''.join(article_xml(int(p)) for p in pmids) + '</PubmedArticleSet>'
+
+
+def pmids(count):
+    """Return `count` consecutive synthetic PMIDs as strings."""
+    return [str(FIRST_PMID + i) for i in range(count)]
+
+
+def efetch_bodies(count, batch_size=250):
+    """Return efetch bodies covering `count` synthetic articles, batch_size articles per body."""
+    ids = pmids(count)
+    return [efetch_body(ids[i:i + batch_size]) for i in range(0, count, batch_size)]
+
+
+# Corpora used by the benchmark suite. "small" is checked in under corpora/small (an esearch response and the
+# matching efetch response); the larger ones are generated on demand from the same deterministic generator.
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpora')
+CORPUS_SIZES = {'small': 25, '1k': 1000, '50k': 50000}
+
+
+class Corpus:
+    """The PMIDs of a corpus and a way to get the PubmedArticle XML of each of them."""
+
+    def __init__(self, name):
+        self.name = name
+        if name == 'small':
+            directory = os.path.join(CORPUS_DIRECTORY, 'small')
+            with open(os.path.join(directory, 'esearch.json'), encoding='utf-8') as f:
+                self.pmids = json.load(f)['esearchresult']['idlist']
+            root = ElementTree.parse(os.path.join(directory, 'efetch.xml')).getroot()
+            self._recorded = {
+                element.findtext('.//PMID'): ElementTree.tostring(element, encoding='unicode')
+                for element in root.iter('PubmedArticle')
+            }
+            self._dates = {
+                element.findtext('.//PMID'): tuple(int(element.findtext(f'.//PubMedPubDate[@PubStatus="pubmed"]/{part}'))
+                                                   for part in ('Year', 'Month', 'Day'))
+                for element in root.iter('PubmedArticle')
+            }
+        else:
+            self.pmids = pmids(CORPUS_SIZES[name])
+            self._recorded = None
+            self._dates = None
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def publication_date(self, pmid):
+        if self._dates is None:
+            self._dates = {p: publication_date(int(p)) for p in self.pmids}
+        return self._dates[str(pmid)]
+
+    def links(self, pmid):
+        return links(int(pmid), self.pmids)
+
+    def article_xml(self, pmid):
+        if self._recorded is not None:
+            return self._recorded.get(str(pmid), '')
+        return article_xml(int(pmid))
+
+    def efetch_body(self, ids):
+        return '<?xml version="1.0" ?><PubmedArticleSet>' + ''.join(self.article_xml(p) for p in ids) + '</PubmedArticleSet>'
+
+    def efetch_bodies(self, batch_size=250):
+        return [self.efetch_body(self.pmids[i:i + batch_size]) for i in range(0, len(self.pmids), batch_size)]
+
+
+def write_small_corpus():
+    """(Re)write the checked-in small corpus."""
+    directory = os.path.join(CORPUS_DIRECTORY, 'small')
+    os.makedirs(directory, exist_ok=True)
+    ids = pmids(CORPUS_SIZES['small'])
+    with open(os.path.join(directory, 'esearch.json'), 'w', encoding='utf-8') as f:
+        json.dump({'header': {'type': 'esearch', 'version': '0.3'},
+                   'esearchresult': {'count': str(len(ids)), 'retmax': str(len(ids)), 'retstart': '0', 'idlist': ids}},
+                  f, indent=1)
+    with open(os.path.join(directory, 'efetch.xml'), 'w', encoding='utf-8') as f:
+        f.write(efetch_body(ids).replace('<PubmedArticle>', '\n<PubmedArticle>'))
+
+
+if __name__ == '__main__':
+    write_small_corpus()
@@ -0,0 +1,149 @@
+# Local replay server emulating the parts of NCBI E-utilities (esearch, efetch, elink) and the OpenAI chat completions
+# endpoint that pyJournalWatcher uses, serving a benchmark corpus with configurable latency.
+#
+# Usage (from the repository root):
+#     python benchmarks/replay_server.py --corpus 1k --eutils-latency 0.05 --openai-latency 0.5
+#
+# then point globalconf.NLM_BASE_URL at http://127.0.0.1:<port> and globalconf.OPENAI_API_BASE at
+# http://127.0.0.1:<port>/v1, with the port it prints (a free one unless --port is given). benchmarks/run.py starts one in-process.
+
+import argparse
+import hashlib
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+from fixtures import Corpus
+
+ESEARCH_WINDOW = 9999
+
+
+class ReplayServer:
+    def __init__(self, corpus, eutils_latency=0.0, openai_latency=0.0, port=0):
+        self.corpus = corpus
+        self.eutils_latency = eutils_latency
+        self.openai_latency = openai_latency
+        self.requests = {}
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, content_type):
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                parameters = urllib.parse.parse_qs(url.query)
+                endpoint = url.path.rsplit('/', 1)[-1]
+                server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+                time.sleep(server.eutils_latency)
+
+                if endpoint == 'esearch.fcgi':
+                    self._reply(json.dumps(server.esearch(parameters)), 'application/json')
+                elif endpoint == 'efetch.fcgi':
+                    ids = [i for value in parameters.get('id', []) for i in value.split(',')]
+                    self._reply(server.corpus.efetch_body(ids), 'text/xml')
+                elif endpoint == 'elink.fcgi':
+                    self._reply(json.dumps(server.elink(parameters)), 'application/json')
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                server.requests['chat'] = server.requests.get('chat', 0) + 1
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(server.openai_latency)
+                self._reply(json.dumps(server.chat_completion(request)), 'application/json')
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def esearch(self, parameters):
+        retstart = int(parameters.get('retstart', ['0'])[0])
+        retmax = int(parameters.get('retmax', ['20'])[0])
+
+        # Date ranges (mindate/maxdate as YYYY/MM/DD); the corpus has one date per article, used for every datetype
+        matches = self.corpus.pmids
+        if 'mindate' in parameters and 'maxdate' in parameters:
+            low, high = (tuple(int(part) for part in parameters[name][0].split('/')) for name in ('mindate', 'maxdate'))
+            matches = [pmid for pmid in matches if low <= self.corpus.publication_date(pmid) <= high]
+
+        # Like ESearch, never return IDs beyond the first ESEARCH_WINDOW of a search
+        ids = matches[retstart:min(retstart + retmax, ESEARCH_WINDOW)]
+        return {'header': {'type': 'esearch', 'version': '0.3'},
+                'esearchresult': {'count': str(len(matches)), 'retmax': str(len(ids)),
+                                  'retstart': str(retstart), 'idlist': ids}}
+
+    def elink(self, parameters):
+        # One link set per id parameter (comma-separated IDs would be merged into one, as ELink does)
+        linksets = []
+        for value in parameters.get('id', []):
+            ids = value.split(',')
+            cited_by, related = [], []
+            for pmid in ids:
+                citing, similar = self.corpus.links(pmid)
+                cited_by += citing
+                related += similar
+            linksets.append({'dbfrom': 'pubmed', 'ids': ids, 'linksetdbs': [
+                {'dbto': 'pubmed', 'linkname': 'pubmed_pubmed', 'links': ids + related},
+                {'dbto': 'pubmed', 'linkname': 'pubmed_pubmed_citedin', 'links': cited_by},
+            ]})
+        return {'header': {'type': 'elink', 'version': '0.3'}, 'linksets': linksets}
+
+    def chat_completion(self, request):
+        # A canned, deterministic "summary" with token usage roughly proportional to the prompt
+        prompt = "\n".join(message['content'] for message in request['messages'])
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        pmids = re.findall(r'^PMID: (\d+)$', request['messages'][-1]['content'], re.MULTILINE)
+        if pmids:
+            # A packed request: one summary per PMID, as a JSON object
+            content = json.dumps({pmid: f'Replay summary {digest[:12]} of {pmid}.' for pmid in pmids})
+        else:
+            content = f'Replay summary {digest[:12]}. ' + ' '.join(prompt.split()[-120:])
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {'id': f'chatcmpl-{digest[:24]}', 'object': 'chat.completion', 'created': 0,
+                'model': request.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}}
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay server for E-utilities and chat completions')
+    parser.add_argument('--corpus', default='small', choices=['small', '1k', '50k'])
+    parser.add_argument('--port', type=int, default=0,
+                        help='Port to listen on (default: a free port, printed at startup; not the daemon port)')
+    parser.add_argument('--eutils-latency', type=float, default=0.0, help='Seconds added to every E-utilities request')
+    parser.add_argument('--openai-latency', type=float, default=0.0, help='Seconds added to every chat completion')
+    args = parser.parse_args()
+
+    server = ReplayServer(Corpus(args.corpus), args.eutils_latency, args.openai_latency, args.port)
+    print(f'Serving corpus {args.corpus} on {server.url} (port {server.port})', flush=True)
+    server.httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
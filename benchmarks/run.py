@@ -0,0 +1,196 @@
+# Reproducible benchmark suite.
+#
+# Usage (from the repository root):
+#     python benchmarks/run.py                                # small and 1k corpora, all benchmarks
+#     python benchmarks/run.py --corpora 50k --benchmarks parse query
+#     python benchmarks/run.py --save-baseline                # store the results as the new baseline
+#
+# Benchmarks:
+#     parse         parse the corpus' efetch responses into PubMedArticle objects
+#     query         PubMed.query against the replay server (esearch paging, efetch batches, parsing)
+#     execute_main  a full executeMain run against the replay server (E-utilities and chat completions), including
+#                   dedup, summarization through the cache, and the DOCX/markdown/HTML renderers; per-stage timings
+#                   come from the metrics registry
+#
+# Every benchmark runs in its own process so that its peak RSS can be measured. Results are compared with
+# benchmarks/baseline.json: lower throughput or higher peak RSS than the baseline by more than the tolerance is
+# reported as a regression and makes the exit status non-zero.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..', 'src'))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+
+from fixtures import Corpus
+from replay_server import ReplayServer
+
+BENCHMARKS = ('parse', 'query', 'execute_main')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIRECTORY, 'baseline.json')
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def bench_parse(corpus, args):
+    from pymed.parsing import parseArticles
+
+    bodies = corpus.efetch_bodies()
+    start = time.perf_counter()
+    articles = sum(len(parseArticles(body)) for body in bodies)
+    return {'articles': articles, 'seconds': time.perf_counter() - start}
+
+
+def bench_query(corpus, args):
+    from pymed import PubMed
+
+    server = ReplayServer(corpus, eutils_latency=args.eutils_latency).start()
+    pubmed = PubMed(base_url=server.url, parse_workers=args.parse_workers)
+    start = time.perf_counter()
+    articles = sum(1 for _ in pubmed.query('benchmark', max_results=len(corpus)))
+    seconds = time.perf_counter() - start
+    pubmed.close()
+    server.stop()
+    return {'articles': articles, 'seconds': seconds, 'requests': server.requests}
+
+
+def bench_execute_main(corpus, args):
+    from globalconf import globalconf
+
+    server = ReplayServer(corpus, eutils_latency=args.eutils_latency, openai_latency=args.openai_latency).start()
+    workdir = tempfile.mkdtemp(prefix='pyjournalwatch-bench-')
+
+    # Point the program at the replay server, with a fresh summary cache and no throttling or cost limit
+    globalconf.NLM_BASE_URL = server.url
+    globalconf.OPENAI_API_BASE = f'{server.url}/v1'
+    globalconf.CACHEDIR = os.path.join(workdir, 'cache')
+    globalconf.OAI_THROTTLE_SECONDS = 0
+    globalconf.MAX_COST = float('inf')
+
+    import main
+    from configuration import config
+    from metrics import METRICS
+
+    conf = config(apikey='replay', query='benchmark', reldate=7, max_results=len(corpus),
+                  basedir=os.path.join(workdir, 'output'), metrics=True, packed=args.packed)
+    start = time.perf_counter()
+    main.executeMain(conf)
+    seconds = time.perf_counter() - start
+    server.stop()
+
+    stages = {name[:-len('_seconds')]: histogram.sum for name, histogram in METRICS.histograms.items()
+              if name.endswith('_seconds')}
+    return {'articles': METRICS.counters.get('articles_total', 0), 'seconds': seconds, 'stages': stages,
+            'requests': server.requests}
+
+
+def run_child(args):
+    corpus = Corpus(args.corpus)
+    result = globals()[f'bench_{args.child}'](corpus, args)
+    result['articles_per_second'] = result['articles'] / result['seconds'] if result['seconds'] > 0 else None
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(args.result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def run_one(benchmark, corpus, args):
+    handle, result_file = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    command = [sys.executable, os.path.abspath(__file__), '--child', benchmark, '--corpus', corpus,
+               '--result-file', result_file, '--eutils-latency', str(args.eutils_latency),
+               '--openai-latency', str(args.openai_latency), '--parse-workers', str(args.parse_workers)]
+    if args.packed:
+        command.append('--packed')
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL if not args.verbose else None)
+    try:
+        if completed.returncode != 0:
+            return None
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None or result is None:
+            continue
+        if previous.get('articles_per_second') and result['articles_per_second'] < previous['articles_per_second'] * (1 - tolerance):
+            regressions.append(f'{key}: throughput {result["articles_per_second"]:.0f}/s vs baseline {previous["articles_per_second"]:.0f}/s')
+        if previous.get('peak_rss_mb') and result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{key}: peak RSS {result["peak_rss_mb"]:.0f} MB vs baseline {previous["peak_rss_mb"]:.0f} MB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pyJournalWatcher benchmark suite')
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument('--corpora', nargs='+', default=['small', '1k'], choices=['small', '1k', '50k'])
+    parser.add_argument('--eutils-latency', type=float, default=0.0, help='Seconds added to every E-utilities request')
+    parser.add_argument('--openai-latency', type=float, default=0.0, help='Seconds added to every chat completion')
+    parser.add_argument('--parse-workers', type=int, default=0, help='Process-pool parse workers for the query benchmark')
+    parser.add_argument('--packed', action='store_true', help='Pack several abstracts per chat request in execute_main')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative change before flagging a regression')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the benchmarked code')
+    parser.add_argument('--child', choices=BENCHMARKS, help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args)
+        return 0
+
+    results = {}
+    print(f'{"benchmark":<28} {"articles":>9} {"seconds":>9} {"articles/s":>11} {"peak RSS MB":>12}')
+    for corpus in args.corpora:
+        for benchmark in args.benchmarks:
+            key = f'{benchmark}/{corpus}'
+            result = results[key] = run_one(benchmark, corpus, args)
+            if result is None:
+                print(f'{key:<28} failed')
+                continue
+            print(f'{key:<28} {result["articles"]:>9} {result["seconds"]:>9.2f} '
+                  f'{result["articles_per_second"] or 0:>11.0f} {result["peak_rss_mb"]:>12.0f}')
+            for stage, seconds in sorted(result.get('stages', {}).items()):
+                print(f'    {stage:<24} {seconds:>9.3f}')
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    if args.save_baseline:
+        baseline.update({key: result for key, result in results.items() if result is not None})
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'Saved baseline to {args.baseline}')
+
+    failed = any(result is None for result in results.values())
+    return 1 if regressions or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
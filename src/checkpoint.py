@@ -0,0 +1,114 @@
+# Checkpoint journal of a single run of executeMain, so that an interrupted run (an exception, a closed laptop...) can
+# be resumed with --resume instead of re-querying NCBI and re-paying for summaries.
+#
+# The journal is a directory next to the processed PMID file holding:
+#   run.json          the run's timestamp, query settings, the size of the PMID file when the run started, the counts
+#                     of fetched articles, and the stages completed so far ("fetched", "summarized", "rendered")
+#   articles.pickle   the new articles of the run, as compact pymed records
+#   summaries.jsonl   the completed summaries, one [PMID, text] line each, appended as they arrive
+#
+# The other files are written to a temporary name and then renamed, so the journal only ever holds completed steps. The
+# processed PMID file (the ledger) is only appended to after the outputs are saved; a resumed run reads the ledger as
+# it was when the run started, so it renders exactly the same digest under the same file names.
+
+import datetime
+import json
+import os
+import pickle
+import shutil
+from globalconf import globalconf
+from pymed.parsing import articleRecords, articlesFromRecords
+
+
+class RunCheckpoint:
+    def __init__(self, directory):
+        self.directory = directory
+        self.state = None
+        if os.path.exists(self._path('run.json')):
+            with open(self._path('run.json'), 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    @staticmethod
+    def for_basedir(basedir):
+        return RunCheckpoint(os.path.join(basedir, globalconf.CHECKPOINT_DIRECTORY))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write(self, name, data):
+        # Write atomically: a crash leaves either the previous file or the new one, never half of one
+        temporary_path = self._path(name + '.tmp')
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, self._path(name))
+
+    @staticmethod
+    def _settings(conf):
+        # A checkpoint can only be resumed by a run with the same search
+        return {'query': conf.QUERY, 'reldate': str(conf.RELDATE), 'max_results': conf.MAX_RESULTS}
+
+    def age(self):
+        # Seconds since the journaled run started (from its timestamp, e.g. 2024-01-31T08-15-00_123456), or None
+        try:
+            date, time_of_day = self.state['nowstr'].split('T')
+            started = datetime.datetime.fromisoformat(date + 'T' + time_of_day.replace('-', ':').replace('_', '.'))
+        except (KeyError, ValueError):
+            return None
+        return (datetime.datetime.now() - started).total_seconds()
+
+    def resumable(self, conf):
+        # Only a recent run of the same search is continued; an old one would render a digest of a stale search
+        if self.state is None or self.state['settings'] != self._settings(conf):
+            return False
+        age = self.age()
+        return age is not None and age <= globalconf.CHECKPOINT_MAX_AGE_HOURS * 3600
+
+    def start(self, nowstr, conf, ledger_size):
+        # Begin a new journal, discarding any previous one (also a stale directory left without run.json, e.g. by a
+        # crash before it was written; whatever could not be removed of it is overwritten, or removed below)
+        self.discard()
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self._path('summaries.jsonl')):
+            os.remove(self._path('summaries.jsonl'))    # Appended to, so it would not be overwritten
+        self.state = {'nowstr': nowstr, 'settings': self._settings(conf), 'ledger_size': ledger_size, 'stages': []}
+        self._write('run.json', json.dumps(self.state, indent=2).encode('utf-8'))
+
+    def has(self, stage):
+        return self.state is not None and stage in self.state['stages']
+
+    def mark(self, stage):
+        self.state['stages'].append(stage)
+        self._write('run.json', json.dumps(self.state, indent=2).encode('utf-8'))
+
+    def save_articles(self, articles, counts):
+        # The new articles, and how many articles were fetched, already seen and skipped
+        self._write('articles.pickle', pickle.dumps(articleRecords(articles), protocol=pickle.HIGHEST_PROTOCOL))
+        self.state['counts'] = counts
+        self.mark('fetched')
+
+    def load_articles(self):
+        with open(self._path('articles.pickle'), 'rb') as f:
+            return articlesFromRecords(pickle.load(f))
+
+    def add_summary(self, pmid, summary):
+        # Summaries are appended one JSON line at a time as they are completed
+        with open(self._path('summaries.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps([pmid, summary]) + '\n')
+
+    def load_summaries(self):
+        summaries = {}
+        if not os.path.exists(self._path('summaries.jsonl')):
+            return summaries
+        with open(self._path('summaries.jsonl'), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    pmid, summary = json.loads(line)
+                except ValueError:
+                    break   # A line cut short by the interruption
+                summaries[pmid] = summary
+        return summaries
+
+    def discard(self):
+        # The run is complete (or abandoned); the journal is no longer needed
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.state = None
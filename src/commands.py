@@ -0,0 +1,270 @@
+# Command line tools that run without the GUI, e.g.:
+#
+#     python src/main.py search "SGLT2 inhibitors" --days 365
+#
+# main.py dispatches here when the first argument is one of the command names in COMMANDS; anything else starts the
+# Gooey GUI as before.
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import toml
+from globalconf import globalconf
+from search_index import SearchIndex
+from triage import train_for_basedir
+from maintenance import maintain
+from configuration import config
+from oai import summarizer_backend, summarize_for_queue, queue_name
+from workqueue import open_work_queue, run_worker
+import daemon
+from prefetch import prefetch_profile
+from resources import RunResources
+
+
+# The output directory used by the last GUI run is the default for every command
+def last_basedir():
+    lastguiconf_path = os.path.join(globalconf.DATADIR, 'lastguiconf.toml')
+    if os.path.exists(lastguiconf_path):
+        try:
+            with open(lastguiconf_path, 'r') as lastconf:
+                return toml.load(lastconf).get('BASEDIR')
+        except Exception:
+            logging.warning('Could not read the last GUI configuration file')
+    return None
+
+
+def add_search_arguments(parser):
+    parser.add_argument('query', help="Full-text query (SQLite FTS5 syntax, e.g. 'SGLT2 AND heart failure')")
+    parser.add_argument('--days', type=int, default=None, help="Only articles published in the last N days")
+    parser.add_argument('--limit', type=int, default=20, help="Maximum number of hits to show")
+
+
+def run_search(args):
+    index_path = os.path.join(args.output_dir, globalconf.SEARCH_INDEX)
+    if not os.path.exists(index_path):
+        print(f'No search index found at {index_path}')
+        return 1
+
+    since = None
+    if args.days is not None:
+        since = datetime.date.today() - datetime.timedelta(days=args.days)
+
+    index = SearchIndex(index_path)
+    hits = index.search(args.query, since=since, limit=args.limit)
+    index.close()
+
+    for hit in hits:
+        print(f'{hit["score"]:6.2f}  {hit["publication_date"]} - {hit["journal"]} - {hit["pmid"]}')
+        print(f'        {hit["title"]}')
+        print(f'        {hit["snippet"]}')
+    print(f'{len(hits)} hits')
+    return 0
+
+
+def add_train_triage_arguments(parser):
+    pass
+
+
+def run_train_triage(args):
+    model, examples = train_for_basedir(args.output_dir)
+    relevant = sum(label for _, _, label in examples)
+    print(f'Found {len(examples)} reviewed articles ({relevant} marked with an importance note)')
+    if model is None:
+        print('Need reviewed articles both with and without importance notes to train; no model written')
+        return 1
+
+    print(f'Wrote relevance model with {len(model.vocabulary)} terms to {os.path.join(args.output_dir, globalconf.TRIAGE_MODEL)}')
+    return 0
+
+
+def add_watch_arguments(parser):
+    parser.add_argument('names', nargs='*', help="Authors as 'Lastname Initials' (e.g. 'Smith JD'); defaults to the watch list")
+    parser.add_argument('--add', action='store_true', help="Add the names to the watch list of the output directory")
+    parser.add_argument('--remove', action='store_true', help="Remove the names from the watch list")
+    parser.add_argument('--days', type=int, default=None, help="Only articles published in the last N days")
+    parser.add_argument('--limit', type=int, default=50, help="Maximum number of articles to show")
+
+
+def run_watch(args):
+    # The watch list is a text file in the output directory, one author per line
+    watch_path = os.path.join(args.output_dir, globalconf.WATCHED_AUTHORS)
+    watched = []
+    if os.path.exists(watch_path):
+        with open(watch_path, 'r', encoding='utf-8') as f:
+            watched = [line.strip() for line in f if line.strip() != '']
+
+    if args.add or args.remove:
+        keys = {SearchIndex.author_key(name) for name in args.names}
+        watched = [name for name in watched if SearchIndex.author_key(name) not in keys]
+        if args.add:
+            watched += args.names
+        with open(watch_path, 'w', encoding='utf-8') as f:
+            f.write("".join(f'{name}\n' for name in watched))
+        print(f'Watching {len(watched)} authors: {"; ".join(watched)}')
+        return 0
+
+    names = args.names or watched
+    if len(names) == 0:
+        print(f'No authors given and no watch list at {watch_path}')
+        return 1
+
+    index_path = os.path.join(args.output_dir, globalconf.SEARCH_INDEX)
+    if not os.path.exists(index_path):
+        print(f'No search index found at {index_path}')
+        return 1
+
+    since = None
+    if args.days is not None:
+        since = datetime.date.today() - datetime.timedelta(days=args.days)
+
+    index = SearchIndex(index_path)
+    articles = index.articles_by_authors(names, since=since, limit=args.limit)
+    index.close()
+
+    for article in articles:
+        print(f'{article["publication_date"]} - {article["journal"]} - {article["pmid"]}')
+        print(f'        {article["title"]}')
+        print(f'        {article["authors"]}')
+    print(f'{len(articles)} articles by {"; ".join(names)}')
+    return 0
+
+
+def add_maintain_arguments(parser):
+    parser.add_argument('--no-vacuum', dest='vacuum', action='store_false',
+                        help="Only cull the caches and prune backups; do not compact the databases")
+
+
+def run_maintain(args):
+    report = maintain(basedirs=[args.output_dir], vacuum=args.vacuum)
+    summary_cache, response_cache, backups = report['summary_cache'], report['response_cache'], report['backups']
+    print(f'Summary cache: {summary_cache["expired"]} expired, {summary_cache["culled"]} evicted, {summary_cache["recompressed"]} recompressed, {summary_cache["bytes"] / 2 ** 20:.1f} MB')
+    print(f'E-utilities cache: {response_cache["removed"]} removed, {response_cache["recompressed"]} recompressed, {response_cache["bytes"] / 2 ** 20:.1f} MB')
+    print(f'Backups: {backups["removed"]} removed, {backups["kept"]} kept')
+    return 0
+
+
+def add_worker_arguments(parser):
+    parser.add_argument('--queue', required=True, help="Work queue: an SQLite file or redis://host:port/db")
+    parser.add_argument('--summarizer', choices=['openai', 'local'], default='openai')
+    parser.add_argument('--model', default='gpt-3.5-turbo', help="OpenAI model (must match the coordinating run's)")
+    parser.add_argument('--api_key', default=None, help="OpenAI API key (defaults to the last one saved in the GUI)")
+    parser.add_argument('--local_model', default=None, help="GGUF model file for the local summarizer")
+    parser.add_argument('--threads', type=int, default=None, help="CPU threads for the local summarizer")
+    parser.add_argument('--packed', action='store_true', help="Pack several abstracts per OpenAI request")
+    parser.add_argument('--idle', type=float, default=60, help="Exit after the queue has had no work for this many seconds")
+
+
+def run_worker_command(args):
+    api_key = args.api_key
+    if api_key is None and args.summarizer == 'openai':
+        lastguiconf_path = os.path.join(globalconf.DATADIR, 'lastguiconf.toml')
+        if os.path.exists(lastguiconf_path):
+            with open(lastguiconf_path, 'r') as lastconf:
+                api_key = toml.load(lastconf).get('API_KEY')
+
+    conf = config(apikey=api_key, gpt_model=args.model, summarizer=args.summarizer, local_model=args.local_model,
+                  summarizer_threads=args.threads, packed=args.packed)
+    summarizer = summarizer_backend(conf)
+    work_queue = open_work_queue(args.queue, queue_name(summarizer))
+    print(f'Working on {queue_name(summarizer)} from {args.queue}')
+    processed = run_worker(work_queue, summarize_for_queue(summarizer), summarizer.batch_size, args.idle)
+    work_queue.close()
+    summarizer.close()
+    print(f'Processed {processed} items')
+    return 0
+
+
+def add_daemon_arguments(parser):
+    parser.add_argument('--profiles', default=os.path.join(globalconf.DATADIR, globalconf.DAEMON_PROFILES),
+                        help="Directory of profile TOML files (saved configurations plus SCHEDULE_HOURS)")
+    parser.add_argument('--port', type=int, default=globalconf.DAEMON_PORT, help="Port of the control endpoint (127.0.0.1)")
+    parser.add_argument('--status', action='store_true', help="Show the status of the running daemon")
+    parser.add_argument('--run', dest='run_profile', metavar='PROFILE', default=None, help="Ask the running daemon to run a profile now")
+    parser.add_argument('--stop', action='store_true', help="Ask the running daemon to shut down after its current run")
+    parser.set_defaults(needs_output_dir=False)
+
+
+def add_prefetch_arguments(parser):
+    parser.add_argument('--profiles', default=os.path.join(globalconf.DATADIR, globalconf.DAEMON_PROFILES),
+                        help="Directory of profile TOML files (as for the daemon)")
+    parser.add_argument('--profile', dest='profile_name', default=None, help="Only prefetch for this profile")
+    parser.set_defaults(needs_output_dir=False)
+
+
+def run_prefetch(args):
+    # One prefetch pass over the profiles (e.g. from cron, when the daemon is not used)
+    profiles = daemon.load_profiles(args.profiles) if os.path.exists(args.profiles) else {}
+    if args.profile_name is not None:
+        profiles = {name: profile for name, profile in profiles.items() if name == args.profile_name}
+    if len(profiles) == 0:
+        print(f'No profiles to prefetch in {args.profiles}')
+        return 1
+
+    resources = RunResources(keep_open=True)
+    try:
+        for name, profile in profiles.items():
+            report = prefetch_profile(profile.conf, resources)
+            print(f'{name}: {report["new"]} new, {report["summarized"]} summarized, {report["failed"]} failed, {report["over_budget"]} over budget')
+            resources.release()
+    finally:
+        resources.close()
+    return 0
+
+
+def run_daemon(args):
+    # Control a running daemon...
+    if args.status or args.run_profile is not None or args.stop:
+        if args.status:
+            reply = daemon.control(args.port, 'GET', '/status')
+        elif args.run_profile is not None:
+            reply = daemon.control(args.port, 'POST', f'/run/{args.run_profile}')
+        else:
+            reply = daemon.control(args.port, 'POST', '/shutdown')
+        print(json.dumps(reply, indent=2))
+        return 0 if 'error' not in reply else 1
+
+    # ...or start one
+    if not os.path.exists(args.profiles):
+        os.makedirs(args.profiles)
+    profiles = daemon.load_profiles(args.profiles)
+    if len(profiles) == 0:
+        print(f'No profiles in {args.profiles}; copy a saved configuration (e.g. lastguiconf.toml) there first')
+        return 1
+
+    from main import executeMain
+    daemon.Daemon(profiles, executeMain, port=args.port).run()
+    return 0
+
+
+# Command name -> (help text, function adding the command's arguments, function running the command)
+COMMANDS = {
+    'search': ('Search the local full-text index of reviewed articles and summaries', add_search_arguments, run_search),
+    'train-triage': ('Train the relevance triage model from the importance notes in reviewed DOCX digests',
+                     add_train_triage_arguments, run_train_triage),
+    'watch': ('List indexed articles by watched authors, or edit the watch list', add_watch_arguments, run_watch),
+    'worker': ('Summarize abstracts from a shared work queue for other runs', add_worker_arguments, run_worker_command),
+    'maintain': ('Cull the caches, prune old backups and compact the databases', add_maintain_arguments, run_maintain),
+    'prefetch': ('Summarize new articles of the daemon profiles ahead of their digests (within the budgets)',
+                 add_prefetch_arguments, run_prefetch),
+    'daemon': ('Run profiles on their schedules in one long-running process, or control that process',
+               add_daemon_arguments, run_daemon),
+}
+
+
+def run_command(argv):
+    parser = argparse.ArgumentParser(prog='pyJournalWatch')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (help_text, add_arguments, run) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--output_dir', default=last_basedir(),
+                               help="Output directory of the profile (defaults to the last one used in the GUI)")
+        subparser.set_defaults(run=run, needs_output_dir=True)
+        add_arguments(subparser)
+
+    args = parser.parse_args(argv)
+    if args.output_dir is None and args.needs_output_dir:
+        print("Error: No output directory; specify --output_dir")
+        return 1
+    return args.run(args)
@@ -1,8 +1,9 @@
 import toml
+from query_compiler import journal_query
 
 
 class config:
-    def __init__(self, apikey=None, gpt_model="gpt-3.5-turbo", gpt_model_name="GPT-3.5", max_results = 1000, reldate=7, query=None, journals=None, writtenquery=None, basedir="."):
+    def __init__(self, apikey=None, gpt_model="gpt-3.5-turbo", gpt_model_name="GPT-3.5", max_results = 1000, reldate=7, query=None, journals=None, writtenquery=None, basedir=".", export_format=None, triage_top_k=None, triage_threshold=None, metrics=False, summarizer='openai', local_model=None, summarizer_threads=None, packed=False, resume=False, verbose=False, work_queue=None, trace=False, profile=False):
         self.GPT_MODEL = gpt_model
         self.GPT_NAME = gpt_model_name
         self.MAX_RESULTS = max_results
@@ -12,20 +13,25 @@ class config:
         self.JOURNALS = journals
         self.WRITTENQUERY=writtenquery
         self.BASEDIR = basedir
+        self.EXPORT_FORMAT = export_format
+        self.TRIAGE_TOP_K = triage_top_k
+        self.TRIAGE_THRESHOLD = triage_threshold
+        self.METRICS = metrics
+        self.SUMMARIZER = summarizer
+        self.LOCAL_MODEL = local_model
+        self.SUMMARIZER_THREADS = summarizer_threads
+        self.PACKED = packed
+        self.RESUME = resume    # Per run; not saved with the GUI configuration
+        self.VERBOSE = verbose
+        self.WORK_QUEUE = work_queue
+        self.TRACE = trace
+        self.PROFILE = profile  # Per run; not saved with the GUI configuration
 
     @staticmethod
     # Accepts a list of journals
     def build_journal_query(journal_list):
-        res = ''
-        if len(journal_list) == 0:
-            return res
-        else:
-            res = f'"{journal_list[0]}"[journal]'
-
-        for journal in journal_list[1:]:
-            res = config.concat_queries(res, f'"{journal}"[journal]')
-
-        return res
+        # A flat OR-list of the journals (see query_compiler)
+        return journal_query(journal_list)
 
     @staticmethod
     def concat_queries(query1, query2, joiner='or'):
@@ -34,6 +40,36 @@ class config:
     def __str__(self):
         return f'{self.GPT_NAME} ({self.GPT_MODEL}) with {self.API_KEY} for {self.RELDATE} days and max results {self.MAX_RESULTS} executing query: {self.QUERY}'
 
+    @staticmethod
+    # Read a configuration written by to_toml (e.g. a daemon profile); settings that are not in the file keep their
+    # defaults
+    def from_toml(path):
+        with open(path, 'r') as tomlin:
+            saved = toml.load(tomlin)
+        defaults = config()
+        return config(
+            apikey=saved.get('API_KEY'),
+            gpt_model=saved.get('GPT_MODEL', defaults.GPT_MODEL),
+            gpt_model_name=saved.get('GPT_NAME', defaults.GPT_NAME),
+            max_results=saved.get('MAX_RESULTS', defaults.MAX_RESULTS),
+            reldate=saved.get('RELDATE', defaults.RELDATE),
+            query=saved.get('QUERY'),
+            journals=saved.get('JOURNALS'),
+            writtenquery=saved.get('WRITTENQUERY'),
+            basedir=saved.get('BASEDIR', defaults.BASEDIR),
+            export_format=saved.get('EXPORT_FORMAT'),
+            triage_top_k=saved.get('TRIAGE_TOP_K'),
+            triage_threshold=saved.get('TRIAGE_THRESHOLD'),
+            metrics=saved.get('METRICS', defaults.METRICS),
+            summarizer=saved.get('SUMMARIZER', defaults.SUMMARIZER),
+            local_model=saved.get('LOCAL_MODEL'),
+            summarizer_threads=saved.get('SUMMARIZER_THREADS'),
+            packed=saved.get('PACKED', defaults.PACKED),
+            verbose=saved.get('VERBOSE', defaults.VERBOSE),
+            work_queue=saved.get('WORK_QUEUE'),
+            trace=saved.get('TRACE', defaults.TRACE)
+        )
+
     def to_toml(self, path):
         with open(path, 'w') as tomlout:
              toml.dump({
@@ -45,7 +81,18 @@ class config:
                 'API_KEY': self.API_KEY,
                 'JOURNALS': self.JOURNALS,
                 'WRITTENQUERY': self.WRITTENQUERY,
-                'BASEDIR': self.BASEDIR
+                'BASEDIR': self.BASEDIR,
+                'EXPORT_FORMAT': self.EXPORT_FORMAT,
+                'TRIAGE_TOP_K': self.TRIAGE_TOP_K,
+                'TRIAGE_THRESHOLD': self.TRIAGE_THRESHOLD,
+                'METRICS': self.METRICS,
+                'SUMMARIZER': self.SUMMARIZER,
+                'LOCAL_MODEL': self.LOCAL_MODEL,
+                'SUMMARIZER_THREADS': self.SUMMARIZER_THREADS,
+                'PACKED': self.PACKED,
+                'VERBOSE': self.VERBOSE,
+                'WORK_QUEUE': self.WORK_QUEUE,
+                'TRACE': self.TRACE
                 },
                 tomlout
              )
@@ -0,0 +1,287 @@
+# Long-running watcher: runs every profile on its own schedule in one warm process, instead of a cold process start
+# (GUI toolkit import, directory and logging setup, new caches and connections) per digest.
+#
+# A profile is a saved configuration (a TOML file like the one the GUI writes, see config.to_toml) in the
+# globalconf.DAEMON_PROFILES directory of the data directory, plus SCHEDULE_HOURS, how often it runs (default
+# DAEMON_SCHEDULE_HOURS) and PREFETCH_HOURS, how often new articles are summarized ahead of the digest (default
+# globalconf.PREFETCH_HOURS; 0 turns it off; see prefetch). The daemon
+#   - loads the profiles once and keeps the E-utilities client, caches, summarizers and indices open between runs (see
+#     resources.RunResources)
+#   - runs due digests and prefetch passes one at a time in a runner thread (they share the NCBI rate limit and the
+#     summarizer); runs are checkpointed and resumed, so a run cut short by a crash continues when the profile next runs
+#   - remembers when each profile last ran (DAEMON_STATE), so a restart keeps the schedules
+#   - serves a control endpoint on 127.0.0.1:DAEMON_PORT:
+#         GET  /status            the profiles, their schedules and last results, and the current run (JSON)
+#         POST /run/<profile>     run a profile now
+#         POST /prefetch/<profile> run a prefetch pass for a profile now
+#         POST /shutdown          stop (like SIGTERM)
+#   - on SIGTERM, SIGINT or /shutdown stops scheduling, lets the current run finish (its outputs and ledger are
+#     written), then closes the resources and flushes the logs
+
+import datetime
+import http.server
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+import toml
+import urllib.error
+import urllib.request
+from globalconf import globalconf
+from configuration import config
+from resources import RunResources
+from checkpoint import RunCheckpoint
+from logsetup import stop_logging
+from prefetch import prefetch_profile
+
+logger = logging.getLogger('daemon')
+
+
+class Profile:
+    def __init__(self, name, conf, interval_hours, prefetch_hours=None):
+        self.name = name
+        self.conf = conf
+        self.interval = interval_hours * 60 * 60
+        self.prefetch_interval = prefetch_hours * 60 * 60 if prefetch_hours else None
+        self.last_started = None    # Epoch seconds
+        self.last_finished = None
+        self.last_result = None     # 'ok', or why the run failed
+        self.last_prefetch = None
+        self.last_prefetch_result = None
+
+    def due(self, now):
+        return self.last_started is None or now - self.last_started >= self.interval
+
+    def prefetch_due(self, now):
+        # Between digests only; the digest itself summarizes whatever was not prefetched
+        if self.prefetch_interval is None or self.due(now):
+            return False
+        return self.last_prefetch is None or now - self.last_prefetch >= self.prefetch_interval
+
+    def status(self):
+        def iso(timestamp):
+            return None if timestamp is None else datetime.datetime.fromtimestamp(timestamp).isoformat(timespec='seconds')
+        return {
+            'output_dir': self.conf.BASEDIR,
+            'schedule_hours': self.interval / 3600,
+            'last_started': iso(self.last_started),
+            'last_finished': iso(self.last_finished),
+            'last_result': self.last_result,
+            'next_due': iso(self.last_started + self.interval if self.last_started is not None else time.time()),
+            'prefetch_hours': None if self.prefetch_interval is None else self.prefetch_interval / 3600,
+            'last_prefetch': iso(self.last_prefetch),
+            'last_prefetch_result': self.last_prefetch_result,
+        }
+
+
+def load_profiles(directory):
+    profiles = {}
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension != '.toml':
+            continue
+        path = os.path.join(directory, filename)
+        conf = config.from_toml(path)
+        conf.RESUME = True      # Continue a run that was cut short (by a crash) instead of starting it over
+        with open(path, 'r') as f:
+            saved = toml.load(f)
+        profiles[name] = Profile(name, conf, float(saved.get('SCHEDULE_HOURS', globalconf.DAEMON_SCHEDULE_HOURS)),
+                                 saved.get('PREFETCH_HOURS', globalconf.PREFETCH_HOURS))
+    return profiles
+
+
+class Daemon:
+    def __init__(self, profiles, execute, port=None):
+        self.profiles = profiles
+        self.execute = execute          # executeMain(conf, resources)
+        self.port = globalconf.DAEMON_PORT if port is None else port
+        self.resources = RunResources(keep_open=True)
+        self.stopping = threading.Event()
+        self.pending = queue.Queue()    # (kind, profile name) of the jobs waiting to run; kind is 'digest' or 'prefetch'
+        self.queued = set()
+        self.current = None             # The job running now
+        self.lock = threading.Lock()
+        self.state_path = os.path.join(globalconf.DATADIR, globalconf.DAEMON_STATE)
+        self._load_state()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, 'r') as f:
+            state = json.load(f)
+        for name, saved in state.items():
+            if name in self.profiles:
+                profile = self.profiles[name]
+                profile.last_started, profile.last_finished, profile.last_result = saved['last_started'], saved['last_finished'], saved['last_result']
+                profile.last_prefetch, profile.last_prefetch_result = saved.get('last_prefetch'), saved.get('last_prefetch_result')
+
+    def _save_state(self):
+        state = {name: {'last_started': p.last_started, 'last_finished': p.last_finished, 'last_result': p.last_result,
+                        'last_prefetch': p.last_prefetch, 'last_prefetch_result': p.last_prefetch_result}
+                 for name, p in self.profiles.items()}
+        with open(self.state_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def trigger(self, name, kind='digest'):
+        # Queue a job for a profile (once: a job that is already waiting is not queued again)
+        with self.lock:
+            if name not in self.profiles or self.stopping.is_set():
+                return False
+            if (kind, name) not in self.queued:
+                self.queued.add((kind, name))
+                self.pending.put((kind, name))
+            return True
+
+    def status(self):
+        def job(kind_name):
+            return f'{kind_name[0]} {kind_name[1]}'
+        with self.lock:
+            return {
+                'running': None if self.current is None else job(self.current),
+                'queued': sorted(job(queued) for queued in self.queued),
+                'stopping': self.stopping.is_set(),
+                'profiles': {name: profile.status() for name, profile in self.profiles.items()},
+            }
+
+    def stop(self):
+        if not self.stopping.is_set():
+            logger.info('Shutting down after the current run')
+        self.stopping.set()
+        self.pending.put(None)  # Wake the runner
+
+    def _run_profile(self, profile):
+        logger.info(f'Running profile {profile.name}')
+        profile.last_started = time.time()
+        self._save_state()
+        try:
+            self.execute(profile.conf, self.resources)
+            profile.last_result = 'ok'
+        except SystemExit:
+            # executeMain bails out this way (e.g. when the estimated cost is over the limit); a run stopped on purpose
+            # is not resumed by the next scheduled run, which starts over
+            RunCheckpoint.for_basedir(profile.conf.BASEDIR).discard()
+            profile.last_result = 'stopped'
+        except Exception as e:
+            logger.exception(f'Profile {profile.name} failed')
+            profile.last_result = f'failed: {str(e)}'
+        finally:
+            self.resources.release()
+            profile.last_finished = time.time()
+            self._save_state()
+        logger.info(f'Profile {profile.name} finished ({profile.last_result}) in {profile.last_finished - profile.last_started:.1f} s')
+
+    def _prefetch_profile(self, profile):
+        profile.last_prefetch = time.time()
+        try:
+            report = prefetch_profile(profile.conf, self.resources)
+            profile.last_prefetch_result = f'summarized {report["summarized"]} of {report["uncached"]}'
+        except Exception as e:
+            logger.exception(f'Prefetch for profile {profile.name} failed')
+            profile.last_prefetch_result = f'failed: {str(e)}'
+        finally:
+            self.resources.release()
+            self._save_state()
+
+    def _runner(self):
+        # Everything in the resources is opened (and so also closed) on this thread: SQLite connections and the
+        # E-utilities client's event loop stay on the thread that created them
+        while not self.stopping.is_set():
+            job = self.pending.get()
+            if job is None or self.stopping.is_set():
+                break
+            with self.lock:
+                self.queued.discard(job)
+                self.current = job
+            kind, name = job
+            try:
+                if kind == 'prefetch':
+                    self._prefetch_profile(self.profiles[name])
+                else:
+                    self._run_profile(self.profiles[name])
+            finally:
+                with self.lock:
+                    self.current = None
+        self.resources.close()
+
+    def _control_server(self):
+        daemon = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _reply(self, code, body):
+                data = json.dumps(body, indent=2).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self._reply(200, daemon.status())
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+            def do_POST(self):
+                if self.path.startswith('/run/') or self.path.startswith('/prefetch/'):
+                    kind, name = self.path[1:].split('/', 1)
+                    kind = 'digest' if kind == 'run' else kind
+                    if daemon.trigger(name, kind):
+                        self._reply(202, {'queued': f'{kind} {name}'})
+                    else:
+                        self._reply(404, {'error': f'no profile {name}, or shutting down'})
+                elif self.path == '/shutdown':
+                    daemon.stop()
+                    self._reply(202, {'stopping': True})
+                else:
+                    self._reply(404, {'error': 'not found'})
+
+        return http.server.ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+
+    def run(self):
+        # Graceful shutdown on SIGTERM / SIGINT (signal handlers can only be set from the main thread)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+            signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+
+        server = self._control_server()
+        server_thread = threading.Thread(target=server.serve_forever, name='daemon-control', daemon=True)
+        server_thread.start()
+        runner = threading.Thread(target=self._runner, name='daemon-runner')
+        runner.start()
+        logger.info(f'Watching {len(self.profiles)} profiles ({", ".join(self.profiles)}); control endpoint on http://127.0.0.1:{self.port}')
+
+        # The scheduler: queue every profile that is due, then look again every DAEMON_TICK_SECONDS
+        while not self.stopping.is_set():
+            now = time.time()
+            for name, profile in self.profiles.items():
+                if profile.due(now) and self.current != ('digest', name):
+                    self.trigger(name)
+                elif profile.prefetch_due(now) and self.current != ('prefetch', name):
+                    self.trigger(name, 'prefetch')
+            self.stopping.wait(globalconf.DAEMON_TICK_SECONDS)
+
+        # Let the current run finish (the runner then closes the resources)
+        runner.join()
+        server.shutdown()
+        server.server_close()
+        logger.info('Daemon stopped')
+        stop_logging()
+
+
+def control(port, method, path):
+    # Talk to a running daemon's control endpoint; returns the decoded JSON reply
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+    except urllib.error.URLError as e:
+        return {'error': f'no daemon answering on port {port} ({e.reason})'}
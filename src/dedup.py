@@ -0,0 +1,152 @@
+# Near-duplicate detection for articles in a digest (companion papers, commentaries, errata, preprint/published
+# pairs of the same trial, ...).
+#
+# Each article's title and abstract are reduced to a MinHash signature of word 3-gram shingles. Signatures are split
+# into LSH bands; articles that share a band bucket are candidates, and candidates whose estimated Jaccard similarity
+# reaches the threshold are treated as near-duplicates. Signatures and buckets are kept in a SQLite database in the
+# output directory, so articles are also matched against everything seen in earlier runs without scanning it all.
+
+import os
+import re
+import sqlite3
+import zlib
+import numpy as np
+from globalconf import globalconf
+
+NUM_PERMUTATIONS = 128
+BANDS = 32
+ROWS = NUM_PERMUTATIONS // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+SHINGLE_SIZE = 3
+
+# Fixed seed: signatures must be comparable across runs
+_rng = np.random.RandomState(1729)
+_A = _rng.randint(1, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def article_text(article):
+    return f'{article.title or ""} {article.abstract or ""}'
+
+
+def minhash(text):
+    # Hash every word 3-gram to 32 bits (crc32 is stable across runs, unlike hash())
+    words = re.findall(r'\w+', text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+    # Apply all the permutations at once: (a * x + b) mod p, truncated to 32 bits, minimum over the shingles
+    permuted = (np.outer(hashes, _A) + _B) % MERSENNE_PRIME & np.uint64(0xFFFFFFFF)
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_buckets(signature):
+    # One bucket per band: a hash of that band's rows
+    return [zlib.crc32(signature[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+def similarity(signature1, signature2):
+    # The fraction of equal MinHash values estimates the Jaccard similarity of the shingle sets
+    return float(np.mean(signature1 == signature2))
+
+
+class NearDuplicateIndex:
+    def __init__(self, path, threshold=globalconf.DEDUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS signatures (pmid TEXT PRIMARY KEY, signature BLOB);
+            CREATE TABLE IF NOT EXISTS buckets (band INTEGER, bucket INTEGER, pmid TEXT);
+            CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets(band, bucket);
+        ''')
+
+    @staticmethod
+    def for_basedir(basedir):
+        return NearDuplicateIndex(os.path.join(basedir, globalconf.DEDUP_INDEX))
+
+    def _stored_candidates(self, buckets):
+        # Previously indexed PMIDs sharing at least one band bucket
+        candidates = set()
+        for band, bucket in enumerate(buckets):
+            rows = self.connection.execute('SELECT pmid FROM buckets WHERE band = ? AND bucket = ?', (band, bucket))
+            candidates.update(pmid for (pmid,) in rows)
+        return candidates
+
+    def _stored_signature(self, pmid):
+        row = self.connection.execute('SELECT signature FROM signatures WHERE pmid = ?', (pmid,)).fetchone()
+        return None if row is None else np.frombuffer(row[0], dtype=np.uint32)
+
+    def cluster(self, articles, summarized=None, eligible=None):
+        """Group near-duplicate articles and add them all to the index.
+
+        Returns a dict mapping the PMID of every duplicate to the PMID of its cluster's representative. The
+        representative is an article from an earlier run if the cluster contains one that has a summary (by
+        summarized(pmid); without it, earlier articles are not used), otherwise the article in this batch with the
+        longest abstract among those that will be summarized (by eligible(pmid), if given; among all of them if none
+        will be). Articles that are not duplicates do not appear in the result.
+        """
+        signatures = {}
+        batch_buckets = {}      # (band, bucket) -> PMIDs from this batch
+        parent = {}             # Union-find over PMIDs
+
+        def find(pmid):
+            while parent.setdefault(pmid, pmid) != pmid:
+                parent[pmid] = parent[parent[pmid]]
+                pmid = parent[pmid]
+            return pmid
+
+        for article in articles:
+            pmid = article.pubmed_id
+            signature = minhash(article_text(article))
+            buckets = band_buckets(signature)
+            signatures[pmid] = signature
+            find(pmid)
+
+            # Candidates are articles from this batch or earlier runs that share a bucket
+            candidates = self._stored_candidates(buckets)
+            for band, bucket in enumerate(buckets):
+                candidates.update(batch_buckets.setdefault((band, bucket), []))
+                batch_buckets[(band, bucket)].append(pmid)
+            candidates.discard(pmid)
+
+            for candidate in candidates:
+                candidate_signature = signatures.get(candidate)
+                if candidate_signature is None:
+                    candidate_signature = self._stored_signature(candidate)
+                if candidate_signature is not None and similarity(signature, candidate_signature) >= self.threshold:
+                    parent[find(pmid)] = find(candidate)
+
+            # Persist the article for future runs
+            self.connection.execute('INSERT OR REPLACE INTO signatures(pmid, signature) VALUES (?, ?)',
+                                    (pmid, signature.tobytes()))
+            self.connection.execute('DELETE FROM buckets WHERE pmid = ?', (pmid,))
+            self.connection.executemany('INSERT INTO buckets(band, bucket, pmid) VALUES (?, ?, ?)',
+                                        [(band, bucket, pmid) for band, bucket in enumerate(buckets)])
+
+        # Collect the clusters and pick a representative for each
+        batch = {article.pubmed_id: article for article in articles}
+        clusters = {}
+        for pmid in parent:
+            clusters.setdefault(find(pmid), []).append(pmid)
+
+        duplicate_of = {}
+        for members in clusters.values():
+            if len(members) < 2:
+                continue
+            # An earlier article that was triaged out, too short or itself a duplicate has no summary to point to
+            earlier = sorted(pmid for pmid in members if pmid not in batch and summarized is not None and summarized(pmid))
+            if len(earlier) > 0:
+                representative = earlier[0]
+            else:
+                representative = max((pmid for pmid in members if pmid in batch),
+                                     key=lambda pmid: (eligible is None or eligible(pmid), len(batch[pmid].abstract or "")))
+            for pmid in members:
+                if pmid != representative and pmid in batch:
+                    duplicate_of[pmid] = representative
+
+        return duplicate_of
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,193 @@
+# DOCX output of the digests.
+#
+# Two writers produce the same layout, one page per article: bold title, author line, a red "Importance: ***"
+# placeholder for the reviewer's notes, the blue summary (or a blue link to the near-duplicate that has it), the
+# (structured) abstract, and the footer metadata.
+#   - "python-docx" builds the document with python-docx's object model (a dozen paragraph/run objects per article,
+#     each styled separately), which takes seconds for a few hundred articles
+#   - "fast" (the default, see globalconf.DOCX_WRITER) keeps a pre-built WordprocessingML fragment per article and
+#     streams them into a copy of the template package when the file is saved; python-docx is only used once, to build
+#     the template (the Normal style set to Arial 9 pt)
+#
+# benchmarks/compare_docx.py renders fixtures with both writers and checks that the documents match.
+
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from docx import Document
+from docx.shared import Pt, Inches, RGBColor
+
+RED = 'FF0000'
+BLUE = '0000FF'
+INDENT_TWIPS = 720      # Half an inch, the indent of the notes and summaries (Inches(0.5))
+
+# Characters that cannot appear in XML (python-docx would refuse them)
+INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Built once per process: the entries of the template package and the parts of its document.xml around the body
+_template = None
+
+
+def new_normal_document():
+    # A python-docx document with the digest's Normal style
+    document = Document()
+    style = document.styles['Normal']
+    style.font.name = 'Arial'
+    style.font.size = Pt(9)
+    return document
+
+
+class PythonDocxDigest:
+    def __init__(self):
+        self.document = new_normal_document()
+        self.articles = 0
+
+    def add_article(self, title, authors, summary_heading, summary, duplicate_pmid, structured_abstract, footer_lines):
+        document = self.document
+
+        # If this isn't the first article in our file, the DOCX needs a pagebreak before each article
+        self.articles += 1
+        if self.articles > 1:
+            document.add_page_break()
+
+        p = document.add_paragraph()
+        p.add_run(title).bold = True
+        document.add_paragraph(authors)
+
+        # Create a section for users to enter their own free-text notes on the article while reviewing it
+        usernotes = document.add_paragraph()                    # Create a paragraph
+        usernotes.paragraph_format.left_indent = Inches(0.5)    # Indent that paragraph
+        usernotesimprun = usernotes.add_run("Importance:")      # Call this "Importance" for the user
+        usernotesimprun.bold = True                             # Heading is bold
+        usernotesimprun.font.color.rgb = RGBColor(255, 0, 0)    # Heading is red
+        usernotesimprun = usernotes.add_run(" ***")             # Create *** as a placeholder for user remarks
+        usernotesimprun.font.color.rgb = RGBColor(255, 0, 0)    # User remarks will also be red
+
+        # If we have a summary of the article, we will also want to append this to the DOCX
+        if summary is not None:
+            gptnotes = document.add_paragraph()                 # Create new paragraph
+            gptnotes.paragraph_format.left_indent = Inches(0.5) # Indent the summary
+            gptimprun = gptnotes.add_run(summary_heading)       # Heading for the summary
+            gptimprun.bold = True                               # Heading is bold
+            gptimprun.font.color.rgb = RGBColor(0, 0, 255)      # Heading is blue
+            gptimprun2 = gptnotes.add_run(summary)              # Add the summary text
+            gptimprun2.font.color.rgb = RGBColor(0, 0, 255)     # Summary text is also blue
+
+        # If this article is a near-duplicate, point to the article that carries the summary instead
+        if duplicate_pmid is not None:
+            dupnotes = document.add_paragraph()                 # Create new paragraph
+            dupnotes.paragraph_format.left_indent = Inches(0.5) # Indent it like the summary
+            dupimprun = dupnotes.add_run('Near-duplicate of: ') # Heading for the link
+            dupimprun.bold = True                               # Heading is bold
+            dupimprun.font.color.rgb = RGBColor(0, 0, 255)      # Heading is blue
+            dupimprun2 = dupnotes.add_run(f'PMID {duplicate_pmid}') # The PMID of the summarized article
+            dupimprun2.font.color.rgb = RGBColor(0, 0, 255)     # Also blue
+
+        # For each section in the abstract (Introduction, Methods, etc.; unstructured abstracts have a single section
+        # with no heading)...
+        for abspara in structured_abstract or []:
+            ap = document.add_paragraph()           # Add a paragraph to the document
+            if abspara[0] != "":                    # If this part of the abstract has a heading (e.g. Methods)
+                ap.add_run(abspara[0]).bold = True  #   add that heading and make it bold
+                ap.add_run(": ")                    #   and also put a colon after it
+            ap.add_run(abspara[1])                  # Add the abstract section text (e.g., "We conducted a ...")
+
+        # Add metadata to the footer of the article
+        for line in footer_lines:
+            document.add_paragraph(line)
+
+    def save(self, filename):
+        self.document.save(filename)
+
+
+def run_xml(text, bold=False, color=None):
+    # One run, the way python-docx writes it: tabs and line breaks become <w:tab/> and <w:br/> between text pieces,
+    # and text with leading or trailing spaces keeps them (xml:space="preserve")
+    properties = ''
+    if bold:
+        properties += '<w:b/>'
+    if color is not None:
+        properties += f'<w:color w:val="{color}"/>'
+    if properties != '':
+        properties = f'<w:rPr>{properties}</w:rPr>'
+
+    content = []
+    for piece in re.split(r'(\t|\r\n|\n|\r)', INVALID_XML.sub('', text or '')):
+        if piece == '\t':
+            content.append('<w:tab/>')
+        elif piece in ('\r\n', '\n', '\r'):
+            content.append('<w:br/>')
+        elif piece != '':
+            preserve = ' xml:space="preserve"' if piece[0].isspace() or piece[-1].isspace() else ''
+            content.append(f'<w:t{preserve}>{escape(piece)}</w:t>')
+    return f'<w:r>{properties}{"".join(content)}</w:r>'
+
+
+def paragraph_xml(runs, indent=False):
+    properties = f'<w:pPr><w:ind w:left="{INDENT_TWIPS}"/></w:pPr>' if indent else ''
+    return f'<w:p>{properties}{"".join(runs)}</w:p>'
+
+
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+def template():
+    # The template package: every entry except the body of word/document.xml, which is streamed in on save
+    global _template
+    if _template is None:
+        package = io.BytesIO()
+        new_normal_document().save(package)
+        with zipfile.ZipFile(package) as z:
+            entries = [(info, z.read(info.filename)) for info in z.infolist()]
+        document_xml = dict((info.filename, data) for info, data in entries)['word/document.xml'].decode('utf-8')
+        body_start = document_xml.index('<w:body>') + len('<w:body>')
+        body_end = document_xml.rindex('<w:sectPr')
+        _template = (entries, document_xml[:body_start], document_xml[body_end:])
+    return _template
+
+
+class FastDocxDigest:
+    def __init__(self):
+        self.fragments = []     # One WordprocessingML fragment per article
+
+    def add_article(self, title, authors, summary_heading, summary, duplicate_pmid, structured_abstract, footer_lines):
+        paragraphs = []
+        if len(self.fragments) > 0:
+            paragraphs.append(PAGE_BREAK)
+
+        paragraphs.append(paragraph_xml([run_xml(title, bold=True)]))
+        paragraphs.append(paragraph_xml([run_xml(authors)]))
+        paragraphs.append(paragraph_xml([run_xml('Importance:', bold=True, color=RED), run_xml(' ***', color=RED)], indent=True))
+        if summary is not None:
+            paragraphs.append(paragraph_xml([run_xml(summary_heading, bold=True, color=BLUE), run_xml(summary, color=BLUE)], indent=True))
+        if duplicate_pmid is not None:
+            paragraphs.append(paragraph_xml([run_xml('Near-duplicate of: ', bold=True, color=BLUE), run_xml(f'PMID {duplicate_pmid}', color=BLUE)], indent=True))
+        for heading, text in structured_abstract or []:
+            runs = [run_xml(heading, bold=True), run_xml(': ')] if heading != "" else []
+            paragraphs.append(paragraph_xml(runs + [run_xml(text)]))
+        for line in footer_lines:
+            paragraphs.append(paragraph_xml([run_xml(line)]))
+
+        self.fragments.append(''.join(paragraphs))
+
+    def save(self, filename):
+        entries, document_head, document_tail = template()
+        with zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            for info, data in entries:
+                if info.filename != 'word/document.xml':
+                    z.writestr(info.filename, data)
+                    continue
+                # Stream the body in, article by article
+                with z.open('word/document.xml', 'w') as document_xml:
+                    document_xml.write(document_head.encode('utf-8'))
+                    for fragment in self.fragments:
+                        document_xml.write(fragment.encode('utf-8'))
+                    document_xml.write(document_tail.encode('utf-8'))
+
+
+DOCX_WRITERS = {'fast': FastDocxDigest, 'python-docx': PythonDocxDigest}
+
+
+def new_docx_digest(writer='fast'):
+    return DOCX_WRITERS[writer]()
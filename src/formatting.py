@@ -0,0 +1,38 @@
+# Text of an article as it appears in the digests, shared by executeMain and the prefetcher (which has to summarize
+# exactly the text a digest would)
+
+
+# Compile the abstract of an article as plain text and as markdown
+def format_abstract(article):
+    abstract_plain_paragraphs = []  # The abstract in plain text
+    abstract_md_paragraphs = []     # The abstract in markdown text
+    if article.structuredAbstract is not None:       # If there is a structured abstract
+        for abspara in article.structuredAbstract:   # For each item in the structured abstract
+            plainpara = ""          # Accumuator for the current line (plain text)
+            mdpara = ""             # Accumulator for the current line (markdown text)
+            if abspara[0] != "":    # If the structured abstract has a heading
+                plainpara += f'{abspara[0]}: '  # Annotate the heading (plain text), e.g., "Methods"
+                mdpara += f'**{abspara[0]}**: ' # Annotate the heading (markdown)
+            plainpara += abspara[1]             # Then add the body for this part of the abstract (e.g.,
+                                                # "We conducted a multicenter randomized controlled..."
+                                                # (plain text format)
+            mdpara += abspara[1]                # Body for this part of the abstract in markdown
+            abstract_plain_paragraphs.append(plainpara) # Append this line to the growing abstract (plain text)
+            abstract_md_paragraphs.append(mdpara)       # Append this line to the growing abstract (markdown)
+
+    abstract_plain = "\n\n".join(abstract_plain_paragraphs) # Concatenate the abstract lines with newlines between sections
+    abstract_md = "\n\n".join(abstract_md_paragraphs)       # And concatenate for the markdown format
+    return abstract_plain, abstract_md
+
+
+# Compile the citing and related articles of an article (from elink) as plain text and as markdown; None if unknown
+def format_links(article):
+    links = getattr(article, 'links', None)
+    if links is None:
+        return None
+    plain = f'Cited by {len(links["cited_by"])}'                                      # e.g., "Cited by 12"
+    md = f'**Cited by:** {len(links["cited_by"])}'
+    if len(links['related']) > 0:                                                       # List the related articles
+        plain += ' - Related: ' + ', '.join(f'PMID {pmid}' for pmid in links['related'])
+        md += ' - **Related:** ' + ', '.join(f'[PMID {pmid}](https://pubmed.ncbi.nlm.nih.gov/{pmid})' for pmid in links['related'])
+    return plain, md
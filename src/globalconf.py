@@ -4,14 +4,67 @@ import os
 class globalconf:
     # These are 'hard-coded' global configuration options that are not specifiable the command line
     CACHE_OPEN_AI = '.CACHE_OPENAI'
+    CACHE_OPEN_AI_SIZE_LIMIT = 2 ** 28
+    CACHE_OPEN_AI_EVICTION = 'lru'      # 'lru' (least recently used) or 'age' (oldest first) beyond the size limit
+    CACHE_OPEN_AI_MAX_AGE_DAYS = None   # Summaries older than this expire; None keeps them until evicted
+    CACHE_EUTILS = '.CACHE_EUTILS'   # Responses of PubMed E-utilities requests
+    CACHE_EUTILS_SIZE_LIMIT = 2 ** 30
+    CACHE_COMPRESSION_LEVEL = 3         # zstd (or zlib) level of the cached summaries and responses
     NLM_TOOL_NAME = "pyJournalWatcher Program being run by unknown user"
     NLM_EMAIL = "not-specified@example.com"
     PMID_FILE = 'processed_pmids.txt'
+    SEARCH_INDEX = 'search_index.sqlite3'
+    DEDUP_INDEX = 'dedup_index.sqlite3'
+    TRIAGE_MODEL = 'relevance_model.npz'
+    WATCHED_AUTHORS = 'watched_authors.txt'
     BACKUP_PREFIX = 'processed_pmids-'
+    BACKUP_KEEP = 50                # Backups of the PMID file kept regardless of age...
+    BACKUP_MAX_AGE_DAYS = 180       # ...and any younger than this
+    MAINTENANCE_INTERVAL_DAYS = 7   # Storage maintenance runs in the background this often; None disables it
     OUTSUFFIX = ''
     OUTPUT_DIRECTORY = 'ToReview'
+    CHECKPOINT_DIRECTORY = '.checkpoint'
+    CHECKPOINT_MAX_AGE_HOURS = 48   # An unfinished run older than this is started over instead of resumed
+    METRICS_DIRECTORY = 'metrics'
+    METRICS_TEXTFILE = 'pyjournalwatch.prom'
+    PROFILE_INTERVAL_SECONDS = 0.005    # Sampling interval of --profile
     OAI_LOWER_THRESHOLD = 800
     MAX_COST = 5
+    OAI_THROTTLE_SECONDS = 2    # Pause before every OpenAI request
+    NLM_BASE_URL = "https://eutils.ncbi.nlm.nih.gov"
+    LINK_ENRICHMENT = True      # Annotate articles with their citing and related articles (elink)
+    RELATED_ARTICLES = 3        # Related articles listed per article
+    DOCX_WRITER = 'fast'        # 'fast' (streamed WordprocessingML) or 'python-docx' (object model); see docx_digest
+    OPENAI_API_BASE = None      # None uses the openai package default
+    OAI_PACK_TOKENS = 3000      # Budget (abstracts plus expected summaries) of a packed OpenAI request
+    OAI_PACK_MAX_ABSTRACTS = 6  # Most abstracts in one packed OpenAI request
+    OAI_PROMPT_COMPACTION = True    # Strip boilerplate from abstracts and fit them to a budget before summarizing
+    OAI_PROMPT_MAX_TOKENS = 700     # Token budget of one compacted abstract (None for no budget)
+    PIPELINE_QUEUE_DEPTH = 16   # Summaries generated ahead of the renderer
+    WORK_LEASE_SECONDS = 300    # A work queue lease runs out unless the worker renews it (every third of this)
+    WORK_POLL_SECONDS = 2       # Wait between looks at an empty work queue
+    WORK_MAX_ATTEMPTS = 3       # Failed summarizations of an item before it is given up on
+    LOCAL_BATCH_SIZE = 8        # Abstracts handed to the local summarizer at once
+    LOCAL_CONTEXT = 4096        # Context window (tokens) of the local model
+    LOCAL_MAX_TOKENS = 300      # Longest local summary, in tokens
+    DEDUP_THRESHOLD = 0.5       # Estimated Jaccard similarity of title+abstract shingles for near-duplicates
+
+    LOG_FILE = 'pubmed-api.log'     # JSON lines, rotated
+    LOG_MAX_BYTES = 10 * 2 ** 20
+    LOG_BACKUPS = 5
+    LOG_LEVELS = {'pymed': 'INFO', 'oai': 'INFO', 'render': 'INFO'}  # Per subsystem (see logsetup)
+
+    DAEMON_PROFILES = 'profiles'        # Directory (in the data directory) of the daemon's profile TOML files
+    DAEMON_STATE = 'daemon_state.json'  # When each profile last ran (in the data directory)
+    DAEMON_PORT = 8765                  # Control endpoint, on 127.0.0.1 only
+    DAEMON_TICK_SECONDS = 30            # How often the daemon checks for due profiles
+    DAEMON_SCHEDULE_HOURS = 24          # Default interval between runs of a profile
+
+    PREFETCH_HOURS = 3                  # Default interval between prefetch passes of a daemon profile (0 = none)
+    PREFETCH_WINDOW_DAYS = 2            # A prefetch pass searches the articles of the last N days
+    PREFETCH_MAX_SUMMARIES_PER_HOUR = 60    # Prefetch budgets, across all profiles
+    PREFETCH_MAX_COST_PER_DAY = 1.0         # (estimated dollars)
+    PREFETCH_BUDGET = 'prefetch_budget.json'    # What prefetching has spent (in the data directory)
 
     DATADIR = appdirs.user_data_dir('pyjournalwatch', 'kumcfm')
     LOGDIRECTORY = appdirs.user_log_dir('pyjournalwatch', 'kumcfm')
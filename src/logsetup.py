@@ -0,0 +1,89 @@
+# Logging for the whole program.
+#
+# Every logger hands its records to a QueueHandler on the root logger, which only puts them on an in-memory queue; a
+# QueueListener thread does the actual writing, so disk and console I/O stay off the hot path. The listener writes:
+#   - a size-capped, rotating log file with one JSON object per record (globalconf.LOG_FILE in the log directory)
+#   - human-readable INFO-and-above messages on stdout (which the GUI shows)
+#
+# Verbosity is set per subsystem: "pymed" (E-utilities requests and parsing), "oai" (summarization) and "render"
+# (writing the digests); everything else logs at INFO. Records below a subsystem's level are discarded before they are
+# even formatted.
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from globalconf import globalconf
+
+SUBSYSTEMS = ('pymed', 'oai', 'render')
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line: time, level, logger, message, thread and, if any, the exception
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(levels=None):
+    # Route all logging through a queue to a background writer; safe to call more than once
+    global _listener
+    if _listener is not None:
+        set_levels(levels)
+        return
+
+    # Make sure the logging directory exists
+    if not os.path.exists(globalconf.LOGDIRECTORY):
+        os.makedirs(globalconf.LOGDIRECTORY)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(globalconf.LOGDIRECTORY, globalconf.LOG_FILE),
+        maxBytes=globalconf.LOG_MAX_BYTES,
+        backupCount=globalconf.LOG_BACKUPS,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(logging.INFO)
+    set_levels(levels)
+
+
+def set_levels(levels=None):
+    # levels: subsystem -> level name (e.g. {'pymed': 'DEBUG'}); subsystems not given use globalconf.LOG_LEVELS
+    merged = dict(globalconf.LOG_LEVELS)
+    merged.update(levels or {})
+    for subsystem in SUBSYSTEMS:
+        logging.getLogger(subsystem).setLevel(merged.get(subsystem, 'INFO').upper())
+
+
+def stop_logging():
+    # Flush whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,38 +1,113 @@
 # Daniel J. Parente, MD PhD
 # University of Kansas Medical Center
 
-from oai import summary_from_cache_or_create
-from pymed import PubMed
-from docx import Document
-from docx.shared import Pt, Inches, RGBColor
+from oai import estimated_cost, cache_key, summary_model, iter_summaries, summarize_for_queue, queue_name, summary_cache_access, FAILURE_SUMMARY
+from workqueue import open_work_queue, summaries_from_queue, profile_lock
+from pymed.export import exportArticles, exportAvailable, FORMATS as EXPORT_FORMATS
+from docx_digest import new_docx_digest
 import datetime
 import logging
+import time
 import sys
 import markdown
 from gooey import Gooey, GooeyParser
 import toml
 from configuration import config
+from query_compiler import compile_query
 from globalconf import globalconf
+from checkpoint import RunCheckpoint
+from pipeline import classify_articles, drain, in_background
+from triage import RelevanceModel, triage
+from metrics import METRICS
+from tracing import TRACER
+from profiling import SamplingProfiler
+from logsetup import setup_logging, set_levels, SUBSYSTEMS
+from maintenance import start_background_maintenance
+from resources import RunResources
+from formatting import format_abstract, format_links
+import commands
 import os
 
-# Set up logging
-# Make sure the logging directory exists
-if not os.path.exists(globalconf.LOGDIRECTORY):
-    os.makedirs(globalconf.LOGDIRECTORY)
-logging.basicConfig(filename=os.path.join(globalconf.LOGDIRECTORY,'pubmed-api.log'),
-                    level=logging.DEBUG,
-                    format='%(asctime)s:%(levelname)s:%(message)s')
-root = logging.getLogger()
-root.setLevel(logging.DEBUG)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-root.addHandler(handler)
-
-def executeMain(conf):
+# Set up logging (queued, with a background writer; see logsetup)
+setup_logging()
+render_logger = logging.getLogger('render')
+
+# Pass (pmid, summary) pairs through, journaling every completed summary in the checkpoint as soon as it arrives (failed
+# summaries are not journaled, so a resumed run tries them again)
+def checkpointed_summaries(summaries, checkpoint):
+    with METRICS.timer('summarize'):
+        for pmid, summary in summaries:
+            if summary != FAILURE_SUMMARY:
+                checkpoint.add_summary(pmid, summary)
+            yield pmid, summary
+
+
+def executeMain(conf, resources=None):
     print(f'Got configuration: {conf}')
 
+    # Connections, caches, the summarizer and the indices come from the run's resources (the daemon keeps one set open
+    # across runs; a one-off run opens its own and closes them at the end)
+    if resources is None:
+        resources = RunResources()
+
+    # Verbose runs log every request, summary and rendered article
+    set_levels({subsystem: 'DEBUG' for subsystem in SUBSYSTEMS} if conf.VERBOSE else None)
+
+    # Start collecting metrics for this run (if requested; otherwise the instrumentation does nothing)
+    METRICS.reset(enabled=conf.METRICS)
+    run_started = time.perf_counter()
+
+    # Record trace spans of every timed stage (and with --profile, sample the stacks of all threads) for this run
+    TRACER.reset(enabled=conf.TRACE or conf.PROFILE)
+    profiler = SamplingProfiler().start() if conf.PROFILE else None
+
+    run_info = {}
+    try:
+        run_digest(conf, resources, run_info)
+    finally:
+        # Stop the profiler and export the trace even when the run is cut short (the cost limit, an error): otherwise
+        # the sampling thread outlives the run, and in the daemon goes on sampling later runs
+        nowstr = run_info.get('nowstr') or datetime.datetime.now().isoformat().replace(":", '-').replace('.','_')
+        metrics_directory = os.path.join(conf.BASEDIR, globalconf.METRICS_DIRECTORY)
+        export_trace(conf, profiler, metrics_directory, nowstr)
+
+    # Export the metrics of this run
+    if conf.METRICS:
+        METRICS.observe('run_seconds', time.perf_counter() - run_started)
+        lookups = METRICS.counters.get('oai_cache_hits', 0) + METRICS.counters.get('oai_cache_misses', 0)
+        if lookups > 0:
+            METRICS.set_gauge('oai_cache_hit_ratio', METRICS.counters.get('oai_cache_hits', 0) / lookups)
+        if METRICS.counters.get('oai_prompt_tokens_uncompacted', 0) > 0:
+            METRICS.set_gauge('oai_prompt_tokens_saved_ratio', METRICS.counters['oai_prompt_tokens_saved'] / METRICS.counters['oai_prompt_tokens_uncompacted'])
+        for cache in ('oai_cache', 'pymed_cache'):
+            if METRICS.counters.get(f'{cache}_stored_bytes', 0) > 0:
+                METRICS.set_gauge(f'{cache}_compression_ratio', METRICS.counters[f'{cache}_raw_bytes'] / METRICS.counters[f'{cache}_stored_bytes'])
+        metrics_filename = os.path.join(metrics_directory, f'metrics_{nowstr}.json')
+        print(f'Writing file {metrics_filename}')
+        METRICS.export(metrics_filename, os.path.join(metrics_directory, globalconf.METRICS_TEXTFILE))
+
+
+# Write the profile and the trace of a run next to its metrics, and stop profiling and tracing
+def export_trace(conf, profiler, metrics_directory, nowstr):
+    if (conf.METRICS or TRACER.enabled) and not os.path.exists(metrics_directory):
+        os.makedirs(metrics_directory)
+    if profiler is not None:
+        profiler.stop()
+        profile_filename = os.path.join(metrics_directory, f'profile_{nowstr}.folded')
+        print(f'Writing file {profile_filename}')
+        profiler.write_folded(profile_filename)
+    if TRACER.enabled:
+        trace_filename = os.path.join(metrics_directory, f'trace_{nowstr}.json')
+        print(f'Writing file {trace_filename}')
+        TRACER.export(trace_filename)
+        TRACER.reset(enabled=False)
+
+
+# One digest run of executeMain; the run's timestamp goes into run_info as soon as it is known
+def run_digest(conf, resources, run_info):
+    # Cull the caches and prune old backups alongside the run, if that is due
+    maintenance_thread = start_background_maintenance()
+
     pmid_file = os.path.join(conf.BASEDIR, globalconf.PMID_FILE)
     backup_prefix = globalconf.BACKUP_PREFIX
     outsuffix = globalconf.OUTSUFFIX
@@ -44,25 +119,34 @@ def executeMain(conf):
         if not os.path.exists(needed_dir):
             os.makedirs(needed_dir)
 
-    # Get a pubmed object
-    pubmed = PubMed(tool=globalconf.NLM_TOOL_NAME, email=globalconf.NLM_EMAIL)
-
     # Get the query
     query = conf.QUERY
 
-    # Get the curernt time and date
-    nowstr = datetime.datetime.now().isoformat().replace(":", '-').replace('.','_')
+    # Make sure the pmid file exists
+    with open(pmid_file, 'a') as f:
+        pass
+
+    # Every run keeps a checkpoint journal until its outputs are saved; with --resume, an unfinished run of the same
+    # search continues from its last completed step (under its original timestamp) instead of starting over
+    checkpoint = RunCheckpoint.for_basedir(conf.BASEDIR)
+    resuming = conf.RESUME and checkpoint.resumable(conf)
+    if resuming:
+        nowstr = checkpoint.state['nowstr']
+        logging.info(f'Resuming the run from {nowstr} (completed: {", ".join(checkpoint.state["stages"]) or "nothing"})')
+    else:
+        if conf.RESUME:
+            logging.warning(f'No unfinished run of this search from the last {globalconf.CHECKPOINT_MAX_AGE_HOURS} hours to resume; starting a new run')
+        elif checkpoint.state is not None:
+            logging.warning(f'Discarding the checkpoint of an unfinished run from {checkpoint.state["nowstr"]} (use --resume to continue it)')
 
-    # Execute the query against the API
-    results = pubmed.query(query, max_results=conf.MAX_RESULTS, reldate=conf.RELDATE)
+        # Get the curernt time and date
+        nowstr = datetime.datetime.now().isoformat().replace(":", '-').replace('.','_')
+        checkpoint.start(nowstr, conf, os.path.getsize(pmid_file))
+    run_info['nowstr'] = nowstr
 
     # Keep track of how many are new as we iterate through the file
     new = 0
 
-    # Make sure the pmid file exists
-    with open(pmid_file, 'a') as f:
-        pass
-
     # Make a copy of the processed pmids file (as a backup)
     with open(pmid_file, 'r') as f:
         backup_filename = os.path.join(conf.BASEDIR, globalconf.BACKUP_DIRECTORY, f'{backup_prefix}{nowstr}.txt.bak')
@@ -70,46 +154,115 @@ def executeMain(conf):
             for x in f.readlines():
                 print(x.replace("\r\n", "").replace("\n", ""), file=bak)
 
-    # Get a list of preciously processed PMIDs
+    # Get a list of preciously processed PMIDs (as they were when this run started, if it is resumed)
     seen_pmids = {}
-    with open(pmid_file, 'r') as f:
-        seen_pmids = { x.replace("\r\n", "").replace("\n","") : 1 for x in f.readlines() }
+    # (ledger_size is in bytes, so the ledger is read as bytes: text mode would count characters after newline
+    # translation and read past it where the ledger has CRLF line endings)
+    with open(pmid_file, 'rb') as f:
+        ledger = f.read(checkpoint.state['ledger_size']).decode('utf-8')
+        seen_pmids = { x.strip() : 1 for x in ledger.splitlines() }
 
     # Create new (docx) document
-    document = Document()
-    style = document.styles['Normal']
-    style.font.name = 'Arial'
-    style.font.size = Pt(9)
+    document = new_docx_digest(globalconf.DOCX_WRITER)
 
     # Already create lists of lines for the markdown and markdown simple output formats
     markdown_lines = []
     markdown_lines_simple = []
 
-    # Transform results (an enumerable) into a list, so we can use list comprehensions to process it
-    results = [ x for x in results]
-
-    # Filter out articles that we've already seen or that have null abstracts (and thus will be skipped for now)
-    already_seen_list = [x for x in results if x.pubmed_id in seen_pmids]
-    skippable_list = [x for x in results if (x.abstract is None and x.pubmed_id not in seen_pmids) ]
+    # Get a pubmed object; repeated searches and fetches are answered from a persistent response cache
+    pubmed = resources.pubmed()
 
-    # Everything remaining we will need to potentially process
-    remaining = [x for x in results if x not in already_seen_list and x not in skippable_list]
+    if checkpoint.has('fetched'):
+        # The articles were fetched (and exported) before the run was interrupted
+        remaining = checkpoint.load_articles()
+        counts = checkpoint.state['counts']
+        logging.info(f'Loaded {len(remaining)} articles from the checkpoint')
+    else:
+        # Execute the query against the API
+        with METRICS.timer('search'):
+            results = pubmed.query(query, max_results=conf.MAX_RESULTS, reldate=conf.RELDATE)
+
+        # Stream the results: articles that we've already seen or that have null abstracts (and thus will be skipped
+        # for now) are counted and dropped as they go past; everything remaining we will need to potentially process
+        counts = {'total': 0, 'already_seen': 0, 'skipped': 0}
+        remaining = []
+        articles = classify_articles(results, seen_pmids, counts, remaining)
+        with METRICS.timer('fetch'):
+            if conf.EXPORT_FORMAT is not None and not exportAvailable():
+                # Saved profiles may ask for an export on a machine without pyarrow; the digest matters more
+                logging.warning('Columnar export needs the optional pyarrow package (pip install pyarrow); skipping it')
+                print('Warning: pyarrow is not installed; skipping the columnar export')
+                drain(articles)
+            elif conf.EXPORT_FORMAT is not None:
+                # Optionally export every fetched article as a columnar table for analytics (row group by row group)
+                export_filename = os.path.join(conf.BASEDIR, globalconf.OUTPUT_DIRECTORY, f'Articles_{nowstr}{outsuffix}{EXPORT_FORMATS[conf.EXPORT_FORMAT]}')
+                if exportArticles(articles, export_filename, format=conf.EXPORT_FORMAT) > 0:
+                    print(f'Wrote file {export_filename}')
+                else:
+                    os.remove(export_filename)
+            else:
+                drain(articles)
+        checkpoint.save_articles(remaining, counts)
 
     # Keep track of this information in a log
-    logging.info(f'Total results: {len(results)}')
-    logging.info(f'Already seen: {len(already_seen_list)}')
-    logging.info(f'Skippable: {len(skippable_list)}')
+    logging.info(f'Total results: {counts["total"]}')
+    logging.info(f'Already seen: {counts["already_seen"]}')
+    logging.info(f'Skippable: {counts["skipped"]}')
     logging.info(f'New: {len(remaining)}')
 
-    already_seen = len(already_seen_list)
-    skipped = len(skippable_list)
-
-    # Estimate the cost
-    cost_per_1k = 0.002 if conf.GPT_MODEL == "gpt-3.5-turbo" else 0.06
-    estimate_cost = len(remaining) * 800 * cost_per_1k / 1000.0
-    # Hard stop: If the cost exceeds a maximum, bail out
+    already_seen = counts['already_seen']
+    skipped = counts['skipped']
+    METRICS.increment('articles_total', counts['total'])
+    METRICS.increment('articles_already_seen', already_seen)
+    METRICS.increment('articles_skipped', skipped)
+
+    # If a relevance model has been trained for this output directory, put the most relevant articles first and only
+    # summarize the top ones (by count and/or score); the rest still appear in the digest with their abstracts
+    summarize_pmids = None  # None means summarize everything
+    relevance_model = RelevanceModel.for_basedir(conf.BASEDIR)
+    if relevance_model is not None:
+        with METRICS.timer('triage'):
+            remaining, summarize_pmids = triage(relevance_model, remaining, top_k=conf.TRIAGE_TOP_K, threshold=conf.TRIAGE_THRESHOLD)
+        logging.info(f'Relevance triage selected {len(summarize_pmids)} of {len(remaining)} for summarization')
+
+    # Group near-duplicates (companion papers, errata, preprint/published pairs...), within this run and against
+    # earlier runs; only one article per group is summarized, the others link to it
+    # (an article from an earlier run only stands for its group if it has a cached summary to link to; one from this
+    # run preferably if it is going to be summarized: selected by triage, with an abstract long enough)
+    dedup_index = resources.dedup_index(conf.BASEDIR)
+    summary_cache = resources.summary_cache()
+    model = summary_model(conf)
+    eligible_pmids = {x.pubmed_id for x in remaining if (summarize_pmids is None or x.pubmed_id in summarize_pmids)
+                      and len(format_abstract(x)[0]) > globalconf.OAI_LOWER_THRESHOLD}
+    with METRICS.timer('dedup'):
+        duplicate_of = dedup_index.cluster(remaining, summarized=lambda pmid: cache_key(pmid, model) in summary_cache,
+                                           eligible=lambda pmid: pmid in eligible_pmids)
+    METRICS.increment('articles_near_duplicate', len(duplicate_of))
+    logging.info(f'Near-duplicates: {len(duplicate_of)}')
+
+    # Annotate the articles with their citing and related articles: a few batched elink requests per run (link sets
+    # are cached per article, so recently enriched articles need none); the digest is still written without them if
+    # the requests fail
+    if globalconf.LINK_ENRICHMENT and len(remaining) > 0:
+        with METRICS.timer('enrich'):
+            try:
+                links = pubmed.getLinks([x.pubmed_id for x in remaining], related=globalconf.RELATED_ARTICLES)
+            except Exception as e:
+                logging.warning(f'Could not retrieve citing and related articles: {str(e)}')
+                links = {}
+        for article in remaining:
+            article.links = links.get(article.pubmed_id)
+        logging.info(f'Citing and related articles found for {len(links)} articles')
+
+    to_summarize = [x for x in remaining if x.pubmed_id not in duplicate_of and (summarize_pmids is None or x.pubmed_id in summarize_pmids)]
+
+    # Estimate the cost (a local model costs nothing per token)
+    estimate_cost = estimated_cost(conf, len(to_summarize))
+    # Hard stop: If the cost exceeds a maximum, bail out (and drop the checkpoint: resuming the run would only stop
+    # here again)
     if estimate_cost > globalconf.MAX_COST:
         logging.info('Hardcoded maximum estimated cost limit exceeded. Bailing out. Consider reducing lookback period or narrowing query.')
+        checkpoint.discard()
         exit()
 
     # This used to be an interactive discussion with the user; commented out for now
@@ -118,144 +271,138 @@ def executeMain(conf):
     #    logging.info('Bailing out per user request')
     #    exit()
 
-    # Open the PMID file to append processed pmids to
-    with open(pmid_file, 'a') as f:
-        # For each article in the file...
-        for i, article in enumerate(remaining):
-            # Extract and format information from the article
-            article_id = article.pubmed_id
-            title = article.title
-            journal = article.journal
-            doi = article.doi
-            publication_date = article.publication_date
-            abstract = article.abstract
-            sabstract = article.structuredAbstract
-
-            # Calculate the author string
-            authstrings = []
-            for author in article.authors:
-                lname = author['lastname']
-                fname_docx = author['firstname']
-                nameinit = author['initials']
-                authstr = f'{lname}, {fname_docx} {nameinit}'
-                authstrings.append(authstr)
-            authors = "; ".join(authstrings)
-
-            # We're processing this article, so it's a "new" article in our output
-            new += 1
-
-            # If this isn't the first article in our file, the DOCX needs a pagebreak before each article
-            if new > 1:
-                document.add_page_break()
-
-            # Compile the abstract and markdown abstract
-            abstract_plain_paragraphs = []  # The abstract in plain text
-            abstract_md_paragraphs = []     # The abstract in markdown text
-            if sabstract is not None:       # If there is a structured abstract
-                for abspara in sabstract:   # For each item in the structured abstract
-                    plainpara = ""          # Accumuator for the current line (plain text)
-                    mdpara = ""             # Accumulator for the current line (markdown text)
-                    if abspara[0] != "":    # If the structured abstract has a heading
-                        plainpara += f'{abspara[0]}: '  # Annotate the heading (plain text), e.g., "Methods"
-                        mdpara += f'**{abspara[0]}**: ' # Annotate the heading (markdown)
-                    plainpara += abspara[1]             # Then add the body for this part of the abstract (e.g.,
-                                                        # "We conducted a multicenter randomized controlled..."
-                                                        # (plain text format)
-                    mdpara += abspara[1]                # Body for this part of the abstract in markdown
-                    abstract_plain_paragraphs.append(plainpara) # Append this line to the growing abstract (plain text)
-                    abstract_md_paragraphs.append(mdpara)       # Append this line to the growing abstract (markdown)
-
-            abstract_plain = "\n\n".join(abstract_plain_paragraphs) # Concatenate the abstract lines with newlines between sections
-            abstract_md = "\n\n".join(abstract_md_paragraphs)       # And concatenate for the markdown format
-
-            # Prepare to obtain an OpenAI summary
-            oai_summary = None
-            # Only obtain an OpenAI summary if the abstract has enough characters
-            # (no sense in 'summarizing' a 100-character abstract
-            if len(abstract_plain) > globalconf.OAI_LOWER_THRESHOLD:
-                # Send a call to summarize this article (or pull it from a cache of prior abstracts
-                # (the ache pull is based on article_id, not the abstract text)
-                oai_summary = summary_from_cache_or_create(
-                    article_id,
-                    abstract_plain,
-                    conf.API_KEY,
-                    model=conf.GPT_MODEL,
-                    baseDirectory=conf.BASEDIR,
-                    simple_instructions=False
-                )
-
-            # Output in DOCX format
-            p = document.add_paragraph()
-            p.add_run(article.title).bold = True
-            document.add_paragraph(authors)
-
-            # In the DOCX file, create a section for users to enter their own free-text notes on the article
-            # while reviewing it
-            usernotes = document.add_paragraph()                    # Create a paragraph
-            usernotes.paragraph_format.left_indent = Inches(0.5)    # Indent that paragraph
-            usernotesimprun = usernotes.add_run("Importance:")      # Call this "Importance" for the user
-            usernotesimprun.bold = True                             # Heading is bold
-            usernotesimprun.font.color.rgb = RGBColor(255, 0, 0)    # Heading is red
-            usernotesimprun = usernotes.add_run(" ***")             # Create *** as a placeholder for user remarks
-            usernotesimprun.font.color.rgb = RGBColor(255, 0, 0)    # User remarks will also be red
-
-            # If we have a summary of the article, we will also want to append this to the DOCX
-            if oai_summary is not None:
-                gptnotes = document.add_paragraph()                 # Create new paragraph
-                gptnotes.paragraph_format.left_indent = Inches(0.5) # Indent the summary
-                gptimprun = gptnotes.add_run(f'{conf.GPT_NAME} Summary: ')  # Heading for the summary
-                gptimprun.bold = True                                       # Heading is bold
-                gptimprun.font.color.rgb = RGBColor(0, 0, 255)              # Heading is blue
-                gptimprun2 = gptnotes.add_run(oai_summary)                  # Add the summary text
-                gptimprun2.font.color.rgb = RGBColor(0, 0, 255)             # Summary text is also blue
-
-            # If there is an abstract, we'll need to add this as well
-            if sabstract is not None:
-                # For each section in the abstract (Introduction, Methods, etc.)...
-                # (For unstructured abstracts there is a single section with no heading)
-                for abspara in sabstract:
-                    ap = document.add_paragraph()           # Add a paragraph to the documenbt
-                    if abspara[0] != "":                    # If this part of the abstract has a heading (e.g. Methods)
-                        ap.add_run(abspara[0]).bold = True  #   add that heading and make it bold
-                        ap.add_run(": ")                    #   and also put a colon after it
-
-                    ap.add_run(abspara[1])                  # Add the abstract section text (e.g., "We conducted a ...")
-
-            # Add metadata to the footer of the article
-            document.add_paragraph(f'{publication_date} - {journal} - {article_id} - {doi}')
-
-            # Writing this in markdown and plaintext format is much fewer lines, do that in the two blocks below
-
-            # Write markdown format
-            markdown_lines.append(f'\n')                    # New line for new article
-            markdown_lines.append(f'## {article.title}')    # Article title
-            markdown_lines.append(f'{authors}')             # Author string
-            if oai_summary is not None:                     # Add the GPT summary, if it exists
-                markdown_lines.append(f'\n### {conf.GPT_NAME} Summary: ')   # Header line
-                markdown_lines.append(f'{oai_summary}')                     # Body of the summary
-            markdown_lines.append('\n### Abstract')         # Add the abstract header
-            markdown_lines.append(abstract_md)              # Add the abstract itself
-            # Add metadata (including hyperlinks!)
-            markdown_lines.append(f'\n{publication_date} - {journal} - [{article_id}](https://pubmed.ncbi.nlm.nih.gov/{article_id}) - [{doi}](https://dx.doi.org/{doi})')
-
-            # And in the abbreviated simple format (which omits the abstracts, unless there is no GPT summary, typically
-            # because the article is too short, in which case it includes the full text of the abstract)
-            markdown_lines_simple.append(f'\n')                 # New line for new article
-            markdown_lines_simple.append(f'## {article.title}') # Article title
-            markdown_lines_simple.append(f'{authors}')          # Author string
-            # If there is an GPT summary, show (only) it, otherwise show the abstract full text
-            if oai_summary is not None:
-                # GPT summary
-                markdown_lines_simple.append(f'\n### {conf.GPT_NAME} Summary') # GPT summary header line
-                markdown_lines_simple.append(f'{oai_summary}')                 # Summary text
-            else:
-                markdown_lines_simple.append('\n### Abstract')                 # Abstract summary header line
-                markdown_lines_simple.append(abstract_md)                      # Abstract summary body text
-            # And add metadata (including hyperlinks)
-            markdown_lines_simple.append(f'\n{publication_date} - {journal} - [{article_id}](https://pubmed.ncbi.nlm.nih.gov/{article_id}) - [{doi}](https://dx.doi.org/{doi})')
+    # Summaries are generated in a background thread while the articles are rendered, at most PIPELINE_QUEUE_DEPTH
+    # summaries ahead of the renderer; the backend still gets them in batches
+    # Only obtain a summary if the abstract has enough characters (no sense in 'summarizing' a 100-character abstract)
+    # (the cache pull is based on article_id, not the abstract text)
+    # (summaries completed before an interruption come from the checkpoint)
+    summaries = checkpoint.load_summaries()
+    summary_items = []
+    for article in to_summarize:
+        abstract_plain, _ = format_abstract(article)
+        if len(abstract_plain) > globalconf.OAI_LOWER_THRESHOLD and article.pubmed_id not in summaries:
+            summary_items.append((article.pubmed_id, abstract_plain))
+    pending_summaries = {pmid for pmid, _ in summary_items}
+    work_queue = None
+    if len(summary_items) > 0:
+        summarizer = resources.summarizer(conf)
+        if conf.WORK_QUEUE is not None:
+            # Share the summarization with "worker" processes through the work queue (this run works on it too);
+            # summaries in the local cache are used without queueing them, and those from the queue are cached
+            work_queue = open_work_queue(conf.WORK_QUEUE, queue_name(summarizer))
+            lookup, store = summary_cache_access(resources.summary_cache(), summarizer)
+            summaries_source = summaries_from_queue(work_queue, summary_items,
+                                                    summarize_for_queue(summarizer, cache=resources.summary_cache()),
+                                                    summarizer.batch_size, FAILURE_SUMMARY, lookup=lookup, store=store)
+        else:
+            summaries_source = iter_summaries(summary_items, summarizer, cache=resources.summary_cache())
+        summary_stream = in_background(checkpointed_summaries(summaries_source, checkpoint), globalconf.PIPELINE_QUEUE_DEPTH)
+
+    # Open the full-text search index; every article in this digest is (re-)indexed with its summary
+    search_index = resources.search_index(conf.BASEDIR)
+
+    # PMIDs that go into this digest; they are added to the PMID file once the outputs are saved
+    processed_pmids = []
+
+    # For each article in the file...
+    for i, article in enumerate(remaining):
+        # Extract and format information from the article
+        article_id = article.pubmed_id
+        title = article.title
+        journal = article.journal
+        doi = article.doi
+        publication_date = article.publication_date
+        abstract = article.abstract
+        sabstract = article.structuredAbstract
+
+        # Calculate the author string ("Last, First I; ...")
+        authors = "; ".join(author.displayName() for author in article.authors)
+
+        # We're processing this article, so it's a "new" article in our output
+        new += 1
+
+        # Compile the abstract and markdown abstract
+        abstract_plain, abstract_md = format_abstract(article)
+
+        # And the citing and related articles (None if they could not be retrieved)
+        article_links = format_links(article)
+
+        # The summary of this article, if it was summarized
+        if article_id in pending_summaries:
+            # Wait for the summarizer to get to this article (summaries arrive in the order of the articles)
+            for pmid, summary in summary_stream:
+                summaries[pmid] = summary
+                if pmid == article_id:
+                    break
+        oai_summary = summaries.get(article_id)
+        # Near-duplicates are not summarized; they point to the article that is
+        duplicate_pmid = duplicate_of.get(article_id)
+
+        # Time the rendering of this article (DOCX and markdown)
+        render_started = time.perf_counter()
+
+        # Output in DOCX format (one page per article; see docx_digest)
+        footer_lines = [f'{publication_date} - {journal} - {article_id} - {doi}']   # Metadata in the footer
+        if article_links is not None:
+            footer_lines.append(article_links[0])       # "Cited by N - Related: PMID ..."
+        with METRICS.timer('render_docx'):
+            document.add_article(article.title, authors, f'{conf.GPT_NAME} Summary: ', oai_summary, duplicate_pmid, sabstract, footer_lines)
+        markdown_started = time.perf_counter()
+
+        # Writing this in markdown and plaintext format is much fewer lines, do that in the two blocks below
+
+        # Write markdown format
+        markdown_lines.append(f'\n')                    # New line for new article
+        markdown_lines.append(f'## {article.title}')    # Article title
+        markdown_lines.append(f'{authors}')             # Author string
+        if oai_summary is not None:                     # Add the GPT summary, if it exists
+            markdown_lines.append(f'\n### {conf.GPT_NAME} Summary: ')   # Header line
+            markdown_lines.append(f'{oai_summary}')                     # Body of the summary
+        if duplicate_pmid is not None:                  # Or link to the near-duplicate that has the summary
+            markdown_lines.append(f'\n**Near-duplicate of:** [PMID {duplicate_pmid}](https://pubmed.ncbi.nlm.nih.gov/{duplicate_pmid})')
+        markdown_lines.append('\n### Abstract')         # Add the abstract header
+        markdown_lines.append(abstract_md)              # Add the abstract itself
+        # Add metadata (including hyperlinks!)
+        markdown_lines.append(f'\n{publication_date} - {journal} - [{article_id}](https://pubmed.ncbi.nlm.nih.gov/{article_id}) - [{doi}](https://dx.doi.org/{doi})')
+        if article_links is not None:                   # Citing and related articles
+            markdown_lines.append(f'\n{article_links[1]}')
+
+        # And in the abbreviated simple format (which omits the abstracts, unless there is no GPT summary, typically
+        # because the article is too short, in which case it includes the full text of the abstract)
+        markdown_lines_simple.append(f'\n')                 # New line for new article
+        markdown_lines_simple.append(f'## {article.title}') # Article title
+        markdown_lines_simple.append(f'{authors}')          # Author string
+        # If there is an GPT summary, show (only) it, otherwise show the abstract full text
+        if oai_summary is not None:
+            # GPT summary
+            markdown_lines_simple.append(f'\n### {conf.GPT_NAME} Summary') # GPT summary header line
+            markdown_lines_simple.append(f'{oai_summary}')                 # Summary text
+        elif duplicate_pmid is not None:
+            # Near-duplicate: link to the article that has the summary
+            markdown_lines_simple.append(f'\n**Near-duplicate of:** [PMID {duplicate_pmid}](https://pubmed.ncbi.nlm.nih.gov/{duplicate_pmid})')
+        else:
+            markdown_lines_simple.append('\n### Abstract')                 # Abstract summary header line
+            markdown_lines_simple.append(abstract_md)                      # Abstract summary body text
+        # And add metadata (including hyperlinks)
+        markdown_lines_simple.append(f'\n{publication_date} - {journal} - [{article_id}](https://pubmed.ncbi.nlm.nih.gov/{article_id}) - [{doi}](https://dx.doi.org/{doi})')
+        if article_links is not None:
+            markdown_lines_simple.append(f'\n{article_links[1]}')
 
-            # Save this to the PMID file, so that we know we reviewed and output this file
-            print(article_id, file=f)
+        TRACER.add('render_markdown', markdown_started, time.perf_counter())
+        METRICS.observe('render_article_seconds', time.perf_counter() - render_started)
+        render_logger.debug('Rendered %s in %.3f s', article_id, time.perf_counter() - render_started)
+        METRICS.increment('articles_new')
+
+        # Add the article and its summary to the search index
+        search_index.add_article(article, oai_summary)
+
+        # Remember to save this to the PMID file, so that we know we reviewed and output this file
+        processed_pmids.append(article_id)
+
+    resources.release()
+    if work_queue is not None:
+        work_queue.close()
+    checkpoint.mark('summarized')
 
     # Print some output statistics for the user
     print(f'New {new}')
@@ -270,13 +417,14 @@ def executeMain(conf):
         # Save the DOCX file
         fname_docx = f'{fname_prefix}.docx'     # Calcualte the filename
         print(f'Writing file {fname_docx}')     # Alert the user
-        document.save(fname_docx)               # Save the DOCX file
+        with METRICS.timer('save_docx'):
+            document.save(fname_docx)           # Save the DOCX file
 
         # Write the markdown formatted file (note this MUST occur before the HTML file write below, because that uses
         # this file to create the HTML file)
         markdown_filename = fname_prefix + '.md'    # Calculate the filename
         print(f'Writing file {markdown_filename}')  # Alert the user
-        with open(markdown_filename, 'w', encoding='utf-8') as mdfile:  # Write the file out (encoding matters to avoid errors)
+        with open(markdown_filename, 'w', encoding='utf-8') as mdfile, METRICS.timer('save_markdown'):  # Write the file out (encoding matters to avoid errors)
             mdfile.write("\n".join(markdown_lines[1:])) # Write every line of the markdown file except the first one (which is an extraneous newline before the first abstract)
 
         # Likewise, write the 'simple' file that includes only the GPT summaries, and not the abstracts (unless the
@@ -288,7 +436,7 @@ def executeMain(conf):
 
         # Convert the markdown file to HTML
         htmlname = fname_prefix + '.html'
-        with open(markdown_filename, 'r', encoding='utf-8') as mdfile:
+        with open(markdown_filename, 'r', encoding='utf-8') as mdfile, METRICS.timer('save_html'):
             # User the markdown package to convert the markdown format into an HTML format
             html = markdown.markdown(mdfile.read()).replace("\r\n", "\n")
 
@@ -302,6 +450,21 @@ def executeMain(conf):
     else:
         print("No updates to write") # If there weren't any updates, instead tell the user we didn't write any files
 
+    checkpoint.mark('rendered')
+
+    # Now that the outputs are saved, add this digest's PMIDs to the PMID file (skipping any that a previous attempt
+    # of this run, or another run on this output directory, already added) and drop the checkpoint
+    with profile_lock(conf.BASEDIR):
+        with open(pmid_file, 'r') as f:
+            ledger = { x.replace("\r\n", "").replace("\n","") for x in f.readlines() }
+        with open(pmid_file, 'a') as f:
+            f.write("".join(f'{article_id}\n' for article_id in processed_pmids if article_id not in ledger))
+    checkpoint.discard()
+
+    # Let background maintenance finish before the program exits
+    if maintenance_thread is not None:
+        maintenance_thread.join()
+
     # That's it. Program complete.
 
 
@@ -375,6 +538,88 @@ def main():
                                help="Select GPT-3.5 or GPT-4 model to use",
                                metavar="GPT model")
 
+    default_export = 'none'
+    if 'EXPORT_FORMAT' in lastgui:
+        default_export = lastgui['EXPORT_FORMAT']
+
+    advanced_options = parser.add_argument_group("Advanced Options")
+    advanced_options.add_argument('--export',
+                                  choices=['none'] + sorted(EXPORT_FORMATS),
+                                  default=default_export,
+                                  help="Also export all fetched articles as a columnar table (requires pyarrow)",
+                                  metavar="Columnar export")
+
+    default_top_k = lastgui.get('TRIAGE_TOP_K', 0)
+    default_threshold = lastgui.get('TRIAGE_THRESHOLD', 0.0)
+    advanced_options.add_argument('--triage_top_k',
+                                  type=int,
+                                  default=default_top_k,
+                                  help="With a trained relevance model, only summarize the N most relevant articles (0 = no limit)",
+                                  metavar="Summarize top N")
+    advanced_options.add_argument('--triage_threshold',
+                                  type=float,
+                                  default=default_threshold,
+                                  help="With a trained relevance model, only summarize articles scoring at least this (0-1; 0 = no threshold)",
+                                  metavar="Relevance threshold")
+
+    advanced_options.add_argument('--metrics',
+                                  action='store_true',
+                                  default=False,
+                                  help="Write per-stage timings and counters (JSON and Prometheus textfile) after each run",
+                                  metavar="Collect metrics",
+                                  gooey_options={'initial_value': lastgui.get('METRICS', False)})
+    advanced_options.add_argument('--trace',
+                                  action='store_true',
+                                  default=False,
+                                  help="Write a Chrome trace (JSON) of every timed stage, request and renderer after each run",
+                                  metavar="Trace",
+                                  gooey_options={'initial_value': lastgui.get('TRACE', False)})
+    advanced_options.add_argument('--profile',
+                                  action='store_true',
+                                  default=False,
+                                  help="Also sample the whole run's call stacks and write them as flame graph data (folded stacks)",
+                                  metavar="Profile")
+    advanced_options.add_argument('--resume',
+                                  action='store_true',
+                                  default=False,
+                                  help=f"Continue an interrupted run of the same search (from the last {globalconf.CHECKPOINT_MAX_AGE_HOURS} hours) from its last completed step",
+                                  metavar="Resume")
+    advanced_options.add_argument('--verbose',
+                                  action='store_true',
+                                  default=False,
+                                  help="Log every E-utilities request, summary and rendered article (slower)",
+                                  metavar="Verbose logging",
+                                  gooey_options={'initial_value': lastgui.get('VERBOSE', False)})
+    advanced_options.add_argument('--work_queue',
+                                  type=str,
+                                  default=lastgui.get('WORK_QUEUE') or '',
+                                  help="Share summarization with 'worker' processes: an SQLite file or redis://host:port/db (empty = off)",
+                                  metavar="Work queue")
+
+    summarizer_options = parser.add_argument_group("Summarizer",
+                                                   "Summarize with OpenAI, or offline with a local GGUF model on the CPU")
+    summarizer_options.add_argument('--summarizer',
+                                    choices=['openai', 'local'],
+                                    default=lastgui.get('SUMMARIZER', 'openai'),
+                                    help="Where summaries are generated (the summary cache is used either way)",
+                                    metavar="Summarizer backend")
+    summarizer_options.add_argument('--local_model',
+                                    widget="FileChooser",
+                                    gooey_options={'initial_value': lastgui.get('LOCAL_MODEL') or ''},
+                                    help="GGUF model file for the local summarizer (requires llama-cpp-python)",
+                                    metavar="Local model")
+    summarizer_options.add_argument('--summarizer_threads',
+                                    type=int,
+                                    default=lastgui.get('SUMMARIZER_THREADS') or 0,
+                                    help="CPU threads for the local summarizer (0 = all cores)",
+                                    metavar="Threads")
+    summarizer_options.add_argument('--packed',
+                                    action='store_true',
+                                    default=False,
+                                    help="Send several abstracts per OpenAI request (fewer prompt tokens and requests)",
+                                    metavar="Packed requests",
+                                    gooey_options={'initial_value': lastgui.get('PACKED', False)})
+
     journal_group = parser.add_argument_group(
         "Common Journals",
         "Select from common family medicine journals"
@@ -428,21 +673,24 @@ def main():
     args = parser.parse_args()
 
     journallist = [x[2] for x in journals if getattr(args, x[0])]
-    journalquery = config.build_journal_query(journallist)
 
-    fullQuery = journalquery
-    if args.query is not None and args.query != '':
-        if fullQuery == '':
-            fullQuery = args.query
-        else:
-            fullQuery = config.concat_queries(args.query, journalquery)
+    # Compile the journals and the ad hoc query into one flat search term
+    fullQuery = compile_query(journallist, args.query)
 
     if fullQuery == '':
         print("Error: No journals or queries specified; bailing out")
         exit(-1)
 
+    if args.export != 'none' and not exportAvailable():
+        print("Error: The columnar export needs the pyarrow package (pip install pyarrow); choose 'none' or install it.")
+        exit(-1)
+
+    if args.summarizer == 'local' and not args.local_model:
+        print("Error: The local summarizer needs a model file.")
+        exit(-1)
+
     api_key = args.api_key
-    if api_key is None or api_key == 'xxx-obtain-api-key-from-openai':
+    if args.summarizer == 'openai' and (api_key is None or api_key == 'xxx-obtain-api-key-from-openai'):
         print("Error: No API key specified. Obtain one from OpenAI.com and specify it here.")
         exit(-1)
     elif api_key == use_last_saved_api_key:
@@ -463,6 +711,8 @@ def main():
     if args.model is not None and args.model == 'gpt-4':
         gpt_model = "gpt-4"
         gpt_model_name = "GPT-4"
+    if args.summarizer == 'local':
+        gpt_model_name = os.path.splitext(os.path.basename(args.local_model))[0]
 
     conf = config(
         apikey=api_key,
@@ -473,7 +723,20 @@ def main():
         query=fullQuery,
         writtenquery=args.query,
         journals=journallist,
-        basedir=output_dir
+        basedir=output_dir,
+        export_format=None if args.export == 'none' else args.export,
+        triage_top_k=args.triage_top_k if args.triage_top_k > 0 else None,
+        triage_threshold=args.triage_threshold if args.triage_threshold > 0 else None,
+        metrics=args.metrics,
+        summarizer=args.summarizer,
+        local_model=args.local_model,
+        summarizer_threads=args.summarizer_threads if args.summarizer_threads > 0 else None,
+        packed=args.packed,
+        resume=args.resume,
+        verbose=args.verbose,
+        work_queue=args.work_queue or None,
+        trace=args.trace,
+        profile=args.profile
     )
 
     # Save last known GUI configuration
@@ -483,4 +746,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Command line tools (e.g. "search") run without the GUI
+    if len(sys.argv) > 1 and sys.argv[1] in commands.COMMANDS:
+        sys.exit(commands.run_command(sys.argv[1:]))
     main()
@@ -0,0 +1,149 @@
+# Storage maintenance: keeps the caches and the backup directory from growing without bound.
+#
+#   - The OpenAI summary cache and the E-utilities response cache drop expired entries and are culled down to their
+#     size limits (least recently used or oldest first, see globalconf.CACHE_OPEN_AI_EVICTION). Entries stored before
+#     the caches were compressed, or before a compression dictionary was trained for them, are rewritten in the
+#     current format (once; see pymed.codec.recompress). Then their SQLite databases are vacuumed.
+#   - Backups of the processed PMID file are kept if they are among the BACKUP_KEEP newest or younger than
+#     BACKUP_MAX_AGE_DAYS; the rest are deleted.
+#   - For a profile (output directory), the full-text search index is optimized and it and the near-duplicate index
+#     are vacuumed.
+#
+# It runs as the "maintain" command, and executeMain starts it in a background thread when it has not run for
+# MAINTENANCE_INTERVAL_DAYS. The background run skips vacuuming, which needs exclusive access to the databases.
+
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+from globalconf import globalconf
+from oai import open_cache
+from pymed import ResponseCache
+from pymed.codec import recompress
+from search_index import SearchIndex
+
+logger = logging.getLogger('maintenance')
+
+# The last time maintenance ran, as the modification time of this file in the data directory
+STAMP_FILE = 'last_maintenance'
+
+
+def vacuum_database(path):
+    # Rebuild an SQLite database file to reclaim the space of deleted rows
+    if not os.path.exists(path):
+        return
+    connection = sqlite3.connect(path, timeout=60)
+    try:
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+
+
+def directory_size(directory):
+    total = 0
+    for parent, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(parent, name)) for name in files)
+    return total
+
+
+def maintain_summary_cache(vacuum=True):
+    cache = open_cache()
+    expired = cache.expire()
+    culled = cache.cull()
+    recompressed = recompress(cache)['rewritten']
+    directory = cache.directory
+    cache.close()
+    if vacuum:
+        vacuum_database(os.path.join(directory, 'cache.db'))
+    return {'expired': expired, 'culled': culled, 'recompressed': recompressed, 'bytes': directory_size(directory)}
+
+
+def maintain_response_cache(vacuum=True):
+    directory = os.path.join(globalconf.CACHEDIR, globalconf.CACHE_EUTILS)
+    cache = ResponseCache(directory, size_limit=globalconf.CACHE_EUTILS_SIZE_LIMIT, compression_level=globalconf.CACHE_COMPRESSION_LEVEL)
+    removed = cache.cull()
+    recompressed = cache.recompress()['rewritten']
+    cache.close()
+    if vacuum:
+        vacuum_database(os.path.join(directory, 'cache.db'))
+    return {'removed': removed, 'recompressed': recompressed, 'bytes': directory_size(directory)}
+
+
+def prune_backups(directory=globalconf.BACKUP_DIRECTORY, keep=None, max_age_days=None):
+    keep = globalconf.BACKUP_KEEP if keep is None else keep
+    max_age_days = globalconf.BACKUP_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.exists(directory):
+        return {'kept': 0, 'removed': 0}
+
+    backups = [os.path.join(directory, name) for name in os.listdir(directory)
+               if name.startswith(globalconf.BACKUP_PREFIX) and name.endswith('.bak')]
+    backups.sort(key=os.path.getmtime, reverse=True)
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+
+    removed = 0
+    for i, path in enumerate(backups):
+        if i >= keep and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return {'kept': len(backups) - removed, 'removed': removed}
+
+
+def maintain_profile(basedir, vacuum=True):
+    # The per-profile databases are only compacted; they hold one row per reviewed article and are not culled
+    if not vacuum:
+        return {}
+    index_path = os.path.join(basedir, globalconf.SEARCH_INDEX)
+    if os.path.exists(index_path):
+        index = SearchIndex(index_path)
+        index.optimize()
+        index.close()
+    vacuum_database(os.path.join(basedir, globalconf.DEDUP_INDEX))
+    return {'bytes': sum(os.path.getsize(os.path.join(basedir, name))
+                         for name in (globalconf.SEARCH_INDEX, globalconf.DEDUP_INDEX)
+                         if os.path.exists(os.path.join(basedir, name)))}
+
+
+def maintain(basedirs=(), vacuum=True):
+    # Run every maintenance task; returns a report of what was done, by task
+    started = time.perf_counter()
+    report = {
+        'summary_cache': maintain_summary_cache(vacuum),
+        'response_cache': maintain_response_cache(vacuum),
+        'backups': prune_backups(),
+    }
+    for basedir in basedirs:
+        report[f'profile {basedir}'] = maintain_profile(basedir, vacuum)
+
+    # Remember when maintenance last ran
+    with open(os.path.join(globalconf.DATADIR, STAMP_FILE), 'w') as f:
+        f.write(datetime.datetime.now().isoformat())
+
+    logger.info(f'Storage maintenance finished in {time.perf_counter() - started:.1f} s: {report}')
+    return report
+
+
+def maintenance_due():
+    if globalconf.MAINTENANCE_INTERVAL_DAYS is None:
+        return False
+    stamp = os.path.join(globalconf.DATADIR, STAMP_FILE)
+    if not os.path.exists(stamp):
+        return True
+    return time.time() - os.path.getmtime(stamp) > globalconf.MAINTENANCE_INTERVAL_DAYS * 24 * 60 * 60
+
+
+def start_background_maintenance():
+    # Start maintenance (without vacuuming) in a background thread if it is due; returns the thread, or None
+    if not maintenance_due():
+        return None
+
+    def run():
+        try:
+            maintain(vacuum=False)
+        except Exception as e:
+            logger.warning(f'Background storage maintenance failed: {str(e)}')
+
+    thread = threading.Thread(target=run, name='maintenance', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,144 @@
+# Per-run metrics: counters, gauges and histograms (timers are histograms of seconds) for every stage of the watcher.
+#
+# A single registry, METRICS, is shared by main.py and oai.py and handed to pymed. It is disabled by default; while
+# disabled, increment/observe return immediately and timer() hands back one shared no-op context manager, so the
+# instrumentation costs a function call and nothing else. executeMain enables and resets it at the start of a run
+# (if requested) and exports it as JSON and as a Prometheus textfile at the end.
+#
+# Timers also record their blocks as trace spans while the tracer (see tracing) is enabled, even if the metrics are not.
+
+import contextlib
+import json
+import math
+import os
+import re
+import time
+from tracing import TRACER
+
+# Histogram bucket upper bounds; they cover both durations in seconds and sizes (bytes, tokens, articles)
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300,
+           1000, 10000, 100000, 1000000, 10000000, math.inf)
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    __slots__ = ('count', 'sum', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'min': self.min if self.count else None, 'max': self.max if self.count else None,
+                'mean': self.sum / self.count if self.count else None}
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        self.metrics.observe(f'{self.name}_seconds', end - self.start)
+        TRACER.add(self.name, self.start, end)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.reset(enabled)
+
+    def reset(self, enabled=None):
+        if enabled is not None:
+            self.enabled = enabled
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def timer(self, name):
+        # Records the duration of the with-block into the "<name>_seconds" histogram (and as a trace span)
+        if not self.enabled and not TRACER.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+        }
+
+    def to_prometheus(self, prefix='pyjournalwatch'):
+        def metric_name(name):
+            return f'{prefix}_' + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines += [f'# TYPE {metric_name(name)}_total counter', f'{metric_name(name)}_total {value}']
+        for name, value in sorted(self.gauges.items()):
+            lines += [f'# TYPE {metric_name(name)} gauge', f'{metric_name(name)} {value}']
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {metric_name(name)} histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{metric_name(name)}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f'{metric_name(name)}_sum {histogram.sum}', f'{metric_name(name)}_count {histogram.count}']
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path, prometheus_path):
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        # Write the textfile atomically; the node_exporter textfile collector may read it at any moment
+        temporary_path = prometheus_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary_path, prometheus_path)
+
+
+# The registry shared by the whole program
+METRICS = Metrics()
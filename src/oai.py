@@ -1,98 +1,526 @@
 import os.path
 from globalconf import globalconf
 import openai
+import json
 from datetime import datetime
 import time
 import logging
+import re
 from diskcache import Cache
+from metrics import METRICS
+from pymed import CompressedDisk
 import os
 
+logger = logging.getLogger('oai')
+
+# The local backend is optional; it needs llama-cpp-python and a GGUF model file
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+# The summarization instructions
+EXPERT_INSTRUCT = 'The following is the abstract of a medical research article. In a paragraph, summarize the most important points for a practicing physician. If possible, include details of the study design, total number of participants, major results, and important conclusions. For this summary paragraph, use no more than 150 words. Include quantitative information when possible.'
+LAY_INSTRUCT = 'The following is the abstract of a medical research article. In a paragraph, summarize the most important points for an intelligent layperson who is not a physician. Use simple and clear words. Avoid jargon. Emphasize aspects that are new and important. For this summary paragraph, use no more than 150 words.'
+
+# Added to the instructions when several abstracts are packed into one request
+PACKED_INSTRUCT = 'You will be given several abstracts, each preceded by a line "PMID: <number>". Summarize each abstract separately, following the instructions above. Respond with only a JSON object whose keys are the PMIDs (as strings) and whose values are the summary paragraphs.'
+
+# Completion tokens to budget for every summary in a packed request (150 words, plus the JSON around it)
+PACKED_COMPLETION_TOKENS = 250
+
+# What the digest shows when an abstract could not be summarized, by any backend (never cached, so the next run retries)
+FAILURE_SUMMARY = "Summarization failure"
+
+_encodings = {}
+
+# Estimate the number of tokens of a text for a model; tiktoken may need to download its encoding, so fall back to
+# roughly four characters per token when it is unavailable
+def count_tokens(text, model="gpt-3.5-turbo"):
+    if model not in _encodings:
+        try:
+            import tiktoken
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            _encodings[model] = None
+    encoding = _encodings[model]
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+# Cut a text down to its first max_tokens tokens (about four characters per token without tiktoken)
+def truncate_tokens(text, max_tokens, model="gpt-3.5-turbo"):
+    count_tokens('', model)     # Load the encoding
+    encoding = _encodings[model]
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+# Split (pmid, abstract) pairs into packs whose abstracts and expected summaries fit a token budget
+def pack_abstracts(items, max_tokens, max_abstracts, model="gpt-3.5-turbo"):
+    packs = []
+    pack = []
+    pack_tokens = 0
+    for pmid, abstract_content in items:
+        tokens = count_tokens(abstract_content, model) + PACKED_COMPLETION_TOKENS
+        if pack and (pack_tokens + tokens > max_tokens or len(pack) >= max_abstracts):
+            packs.append(pack)
+            pack = []
+            pack_tokens = 0
+        pack.append((pmid, abstract_content))
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+# Extract the {pmid: summary} object from a packed response; returns only the entries that are non-empty summaries of
+# requested PMIDs
+def parse_packed_response(content, pmids):
+    # Tolerate code fences or a sentence around the object
+    start, end = content.find('{'), content.rfind('}')
+    if start < 0 or end < start:
+        return {}
+    try:
+        parsed = json.loads(content[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {str(pmid): parsed[str(pmid)].strip() for pmid in pmids
+            if isinstance(parsed.get(str(pmid)), str) and parsed[str(pmid)].strip() != ''}
+
 # This just creates a dummy 'summary' for testing purposes, avoiding OpenAI API calls
 def create_summary_dummy(abstract_content):
-    logging.info('Dummy summary requested')
+    logger.info('Dummy summary requested')
     print("=======")
     print(abstract_content)
     return abstract_content[0:100]
 
-def summary_from_cache_or_create(pmid, abstract_content, apikey, model="gpt-3.5-turbo", baseDirectory = '', simple_instructions=False):
-    # Get the cache
-
-    cache_path = os.path.join(globalconf.CACHEDIR, globalconf.CACHE_OPEN_AI)
-    cache = Cache(cache_path)
-    k = f'{pmid}_{model}'   # Calculate a key based on PMID and the GPT model (so, for example, if a GPT-3.5-turbo
-                            # summary was cached, and a gpt-4 summary was requested; this is a cache miss)
-
+def cache_key(pmid, model, simple_instructions=False):
+    # Calculate a key based on PMID and the model (so, for example, if a GPT-3.5-turbo summary was cached, and a gpt-4
+    # summary was requested; this is a cache miss)
+    k = f'{pmid}_{model}'
     # If we are using simple instructions, add this to the key
     if simple_instructions:
         k = k + "_simple"
+    return k
 
-    result = cache.get(k)   # Try to get the result from the cache
-    if result is None:
-        # If not in cache, query the API to create a new summary
-        logging.info(f'Cache miss for {pmid} with {model} and will query OpenAI')
-        return create_summary(pmid, abstract_content, apikey, model=model, cache=cache)
-    else:
-        # Otherwise return the summary
-        logging.info(f'Cache hit for {pmid} with {model}; returning from cache')
-        return result
+# diskcache eviction policies for the cache size limit: least recently used first, or oldest first
+EVICTION_POLICIES = {'lru': 'least-recently-used', 'age': 'least-recently-stored'}
 
+# Summaries are stored compressed (zstd with a dictionary trained on the cache when zstandard is installed, zlib
+# otherwise; see pymed.codec); summaries cached before that are read as they are until maintenance rewrites them
+def open_cache():
+    cache = Cache(os.path.join(globalconf.CACHEDIR, globalconf.CACHE_OPEN_AI),
+                  size_limit=globalconf.CACHE_OPEN_AI_SIZE_LIMIT,
+                  eviction_policy=EVICTION_POLICIES[globalconf.CACHE_OPEN_AI_EVICTION],
+                  disk=CompressedDisk, disk_codec_level=globalconf.CACHE_COMPRESSION_LEVEL)
+    cache.disk.codec.instrument(METRICS, 'oai_cache')
+    return cache
 
-# Get a summary of the article using the OpenAI API; note this WILL NOT work with GPT-3 models which use the
-# completion endpoints. The below example assumes you are using the ChatCompletions endpoint (e.g., GPT-3.5 or 4)
-def create_summary(pmid, abstract_content, apikey, model="gpt-3.5-turbo", cache=None, simple_instructions=False):
-    openai.api_key = apikey # Specify the API key
+def cache_expire():
+    # Seconds a new summary is kept, or None to keep it until it is evicted
+    if globalconf.CACHE_OPEN_AI_MAX_AGE_DAYS is None:
+        return None
+    return globalconf.CACHE_OPEN_AI_MAX_AGE_DAYS * 24 * 60 * 60
 
-    # The summarization instructions
-    expert_instruct = 'The following is the abstract of a medical research article. In a paragraph, summarize the most important points for a practicing physician. If possible, include details of the study design, total number of participants, major results, and important conclusions. For this summary paragraph, use no more than 150 words. Include quantitative information when possible.'
-    lay_instruct = 'The following is the abstract of a medical research article. In a paragraph, summarize the most important points for an intelligent layperson who is not a physician. Use simple and clear words. Avoid jargon. Emphasize aspects that are new and important. For this summary paragraph, use no more than 150 words.'
 
-    instruct = expert_instruct
-    if simple_instructions:
-        instruct = lay_instruct
+# Prompt compaction: abstracts are sent to the summarizer without what a summary has no use for, in as few tokens as
+# they can be:
+#   - sections about trial registration, funding, conflicts of interest and copyright are dropped, as are copyright
+#     statements (to the end of their paragraph) and sentences or parentheses citing a registry identifier
+#   - whitespace is collapsed, all-caps section labels are written in sentence case (fewer tokens) and sections are
+#     separated by one newline instead of a blank line
+#   - an abstract still over OAI_PROMPT_MAX_TOKENS is truncated section by section: sentences go from the end of the
+#     background sections first, then of the methods and other sections, and results and conclusions last; an
+#     unstructured abstract loses the sentences after its first, keeping its last two
+# The digest still shows the full abstract; only the prompt is compacted (the summary cache is keyed by PMID).
 
-    # I've noticed occassional random and unexpected failures from the OpenAI endpoint, so wrap this in a try/catch
-    # so that one abstract failing summarization doesn't abort the entire program
-    try:
-        logging.info("Preparing to run OpenAI query (sleeping 2 seconds)...")
-        time.sleep(2)   # Include a short delay to prevent submitting too many queries at once and allowing the user
-                        # time to cancel the program
-        logging.info(f'Running OpenAI query against {model}...')    # Inform the user
+# Headings of the sections that are dropped
+DROPPED_SECTIONS = re.compile(r'^(clinical |study )?(trial )?(registration|registry)|^funding|^sources? of funding|^conflicts? of interest|^competing interests?|^disclosures?|^copyright', re.IGNORECASE)
+# Identifiers of clinical trial and systematic review registries
+REGISTRY_ID = re.compile(r'\b(NCT\d{8}|ISRCTN\d{8}|ACTRN\d{14}|ChiCTR[-A-Z]*\d+|CRD\d{11}|DRKS\d{8}|UMIN\d{9}|jRCT\w+|CTRI/\d{4}/\d+/\d+|EudraCT[ :]*\d{4}-\d{6}-\d{2})\b', re.IGNORECASE)
+# Where a copyright statement starts
+COPYRIGHT = re.compile(r'\s*(\bcopyright\b\s*(©|\(c\)|\d{4})|©|\bthis article is protected by copyright\b|\ball rights reserved\b)', re.IGNORECASE)
+# A section label, as format_abstract writes it ("Methods: ...")
+SECTION_LABEL = re.compile(r'^([A-Za-z][A-Za-z ,&/-]{0,60}): ')
+# Between sentences ("p < 0.05" and "vs. placebo" do not end one)
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+(?=[A-Z(\[])')
+
+# Order in which sections give way to the token budget, by words of their labels (unlisted sections come third)
+TRUNCATION_PRIORITY = [
+    ('background', 'introduction', 'context', 'rationale', 'importance', 'purpose', 'objective', 'aim'),
+    ('method', 'design', 'setting', 'participant', 'patient', 'intervention', 'measure', 'exposure', 'data source'),
+]
+KEPT_SECTIONS = ('result', 'finding', 'conclusion', 'interpretation')
+
+def _truncation_priority(label):
+    label = label.lower()
+    if any(word in label for word in KEPT_SECTIONS):
+        return len(TRUNCATION_PRIORITY) + 1
+    for priority, words in enumerate(TRUNCATION_PRIORITY):
+        if any(word in label for word in words):
+            return priority
+    return len(TRUNCATION_PRIORITY)
+
+# Split a plain-text abstract into [label, sentences] sections, without the dropped sections and the boilerplate
+def _abstract_sections(abstract_content):
+    sections = []
+    for paragraph in re.split(r'\n\s*\n', abstract_content):
+        label = ''
+        match = SECTION_LABEL.match(paragraph.strip())
+        if match is not None:
+            label = match.group(1).strip()
+            paragraph = paragraph.strip()[match.end():]
+            if DROPPED_SECTIONS.match(label):
+                continue
+            if label.isupper():
+                label = label.capitalize()
+
+        # A copyright statement runs to the end of its paragraph
+        copyright = COPYRIGHT.search(paragraph)
+        if copyright is not None:
+            paragraph = paragraph[:copyright.start()]
+        paragraph = re.sub(r'\s*\([^()]*\)', lambda m: '' if REGISTRY_ID.search(m.group(0)) else m.group(0), paragraph)
+        paragraph = re.sub(r'\s+', ' ', paragraph).strip()
+
+        sentences = [s for s in SENTENCE_BREAK.split(paragraph) if s != '' and REGISTRY_ID.search(s) is None]
+        if len(sentences) > 0:
+            sections.append([label, sentences])
+    return sections
+
+def _join_sections(sections):
+    return '\n'.join((f'{label}: ' if label else '') + ' '.join(sentences) for label, sentences in sections)
+
+# Compact the text of an abstract for a prompt (see above); max_tokens None means no budget
+def compact_abstract(abstract_content, max_tokens=None, model="gpt-3.5-turbo"):
+    sections = _abstract_sections(abstract_content)
+    if len(sections) == 0:
+        return re.sub(r'\s+', ' ', abstract_content).strip()
+    compact = _join_sections(sections)
+    if max_tokens is None or count_tokens(compact, model) <= max_tokens:
+        return compact
+
+    # Tokens of every sentence (and label), so the truncation does not have to count the whole text again
+    counts = [[count_tokens(sentence, model) for sentence in sentences] for _, sentences in sections]
+    total = sum(count_tokens(label, model) + 1 for label, _ in sections if label) + sum(map(sum, counts))
+    unstructured = len(sections) == 1 and sections[0][0] == ''
+    while total > max_tokens:
+        if unstructured:
+            # The first sentence says what was studied; the last ones what was found
+            sentences = sections[0][1]
+            if len(sentences) <= 3:
+                break
+            del sentences[1]
+            total -= counts[0].pop(1)
+            continue
+
+        # The last sentence of the section that gives way first (the earliest, among sections of equal priority)
+        candidates = [i for i in range(len(sections)) if len(sections[i][1]) > 0]
+        if len(candidates) <= 1 and len(sections[candidates[0]][1]) <= 1:
+            break
+        i = min(candidates, key=lambda i: (_truncation_priority(sections[i][0]), i))
+        sections[i][1].pop()
+        total -= counts[i].pop()
+        if len(sections[i][1]) == 0:
+            total -= count_tokens(sections[i][0], model) + 1 if sections[i][0] else 0
+            del sections[i], counts[i]
+
+    compact = _join_sections(sections)
+    if count_tokens(compact, model) > max_tokens:
+        compact = truncate_tokens(compact, max_tokens, model)
+    return compact
+
+# Compact the (pmid, abstract) pairs of a batch for a backend's model, counting the prompt tokens saved
+def compact_items(items, model):
+    if not globalconf.OAI_PROMPT_COMPACTION:
+        return items
+    compacted = []
+    before = after = 0
+    for pmid, abstract_content in items:
+        compact = compact_abstract(abstract_content, globalconf.OAI_PROMPT_MAX_TOKENS, model)
+        before += count_tokens(abstract_content, model)
+        after += count_tokens(compact, model)
+        compacted.append((pmid, compact))
+    METRICS.increment('oai_prompt_tokens_uncompacted', before)
+    METRICS.increment('oai_prompt_tokens_saved', before - after)
+    logger.info(f'Compacted {len(items)} abstracts from {before} to {after} tokens ({before - after} saved)')
+    return compacted
+
+
+# A summarizer backend turns a batch of (pmid, abstract) pairs into summaries. 'model' names the backend's model in
+# cache keys, and batch_size is how many abstracts it is handed at once. summarize_batch returns one summary per pair,
+# in order, with None for abstracts that could not be summarized.
+class SummarizerBackend:
+    model = None
+    batch_size = 1
+
+    def summarize_batch(self, items, simple_instructions=False):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Summaries from the OpenAI API; note this WILL NOT work with GPT-3 models which use the completion endpoints. This
+# assumes you are using the ChatCompletions endpoint (e.g., GPT-3.5 or 4)
+#
+# In packed mode, several abstracts share one request (and one copy of the instructions), up to a token budget; the
+# model answers with a JSON object keyed by PMID, and any abstract missing from a valid answer is summarized alone.
+class OpenAIBackend(SummarizerBackend):
+    def __init__(self, apikey, model="gpt-3.5-turbo", packed=False):
+        self.apikey = apikey
+        self.model = model
+        self.packed = packed
+        if packed:
+            self.batch_size = globalconf.OAI_PACK_MAX_ABSTRACTS * 4 # Several packs per batch
+
+    def chat(self, instruct, content):
+        openai.api_key = self.apikey # Specify the API key
+        if globalconf.OPENAI_API_BASE is not None:
+            openai.api_base = globalconf.OPENAI_API_BASE    # Alternative endpoint (e.g., the benchmark replay server)
+
+        logger.info(f"Preparing to run OpenAI query (sleeping {globalconf.OAI_THROTTLE_SECONDS} seconds)...")
+        with METRICS.timer('oai_throttle_sleep'):
+            # Include a short delay to prevent submitting too many queries at once and allowing the user time to
+            # cancel the program
+            time.sleep(globalconf.OAI_THROTTLE_SECONDS)
+        logger.info(f'Running OpenAI query against {self.model}...')    # Inform the user
 
         # Execute the request against the ChatCompletions endpoint
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": instruct},
-                {"role": "user", "content": abstract_content},
-            ]
-        )
+        with METRICS.timer('oai_request'):
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": instruct},
+                    {"role": "user", "content": content},
+                ]
+            )
 
         # Process the response
         tokens_used = response['usage']['total_tokens'] # Keep track of tokens used
-        res = response['choices'][0]['message']         # Get the response message
-        content = res['content']                        # Get the summary out of the response
+        METRICS.increment('oai_requests')
+        METRICS.increment('oai_prompt_tokens', response['usage']['prompt_tokens'])
+        METRICS.increment('oai_completion_tokens', response['usage']['completion_tokens'])
+        METRICS.observe('oai_total_tokens', tokens_used)
+        logger.info(f'Recieved OpenAI Response and used {tokens_used} tokens') # Inform the user
+
+        return response['choices'][0]['message']
+
+    def summarize(self, pmid, abstract_content, simple_instructions=False):
+        instruct = LAY_INSTRUCT if simple_instructions else EXPERT_INSTRUCT
+
+        # I've noticed occassional random and unexpected failures from the OpenAI endpoint, so wrap this in a try/catch
+        # so that one abstract failing summarization doesn't abort the entire program
+        try:
+            res = self.chat(instruct, abstract_content)     # Get the response message
+            content = res['content']                        # Get the summary out of the response
+
+            stime = datetime.now().strftime('%Y-%m-%d %H-%M-%S')    # Keep track of the time and date
+
+            # During debugging, we were logging these queries, but not in production
+            #with open(f'queries/output-{stime}.txt', 'w', encoding='utf-8') as f:
+            #    print(res, file=f)
+            #    print("======", file=f)
+            #    print(content, file=f)
+
+            # Return the summary
+            return content
+        except Exception as e:
+            logger.error(f'OpenAI failure: {str(e)}')
+            METRICS.increment('oai_failures')
+            return None
+
+    def summarize_pack(self, pack, simple_instructions=False):
+        # One request for all the abstracts of the pack; returns {pmid: summary} for the ones that came back valid
+        instruct = (LAY_INSTRUCT if simple_instructions else EXPERT_INSTRUCT) + '\n\n' + PACKED_INSTRUCT
+        content = "\n\n".join(f'PMID: {pmid}\n{abstract_content}' for pmid, abstract_content in pack)
+        try:
+            res = self.chat(instruct, content)
+        except Exception as e:
+            logger.error(f'OpenAI failure for a pack of {len(pack)} abstracts: {str(e)}')
+            METRICS.increment('oai_failures')
+            return {}
+        METRICS.increment('oai_packed_requests')
+        METRICS.observe('oai_pack_size', len(pack))
+        return parse_packed_response(res['content'], [pmid for pmid, _ in pack])
+
+    def summarize_batch(self, items, simple_instructions=False):
+        if not self.packed:
+            return [self.summarize(pmid, abstract_content, simple_instructions) for pmid, abstract_content in items]
+
+        summaries = {}
+        for pack in pack_abstracts(items, globalconf.OAI_PACK_TOKENS, globalconf.OAI_PACK_MAX_ABSTRACTS, self.model):
+            if len(pack) > 1:
+                summaries.update(self.summarize_pack(pack, simple_instructions))
+
+            # Anything the packed answer left out (or got wrong) is summarized on its own
+            for pmid, abstract_content in pack:
+                if str(pmid) not in summaries:
+                    if len(pack) > 1:
+                        logger.info(f'No valid packed summary for {pmid}; summarizing it alone')
+                        METRICS.increment('oai_pack_fallbacks')
+                    summaries[str(pmid)] = self.summarize(pmid, abstract_content, simple_instructions)
+        return [summaries[str(pmid)] for pmid, _ in items]
+
+
+# Summaries from a local GGUF model run on the CPU by llama.cpp: no network, no per-token cost. The model is loaded
+# once and kept for the whole run; every batch is generated back to back with the configured number of threads, and
+# prompt evaluation is batched in chunks of n_batch tokens.
+class LocalBackend(SummarizerBackend):
+    def __init__(self, model_path, threads=None, batch_size=None, context=None):
+        if Llama is None:
+            raise ImportError('The local summarizer requires llama-cpp-python (pip install llama-cpp-python)')
+
+        self.model = local_model_name(model_path)
+        self.batch_size = batch_size or globalconf.LOCAL_BATCH_SIZE
+        threads = threads or os.cpu_count()
+
+        logger.info(f'Loading local model {model_path} with {threads} threads...')
+        with METRICS.timer('local_load'):
+            self.llm = Llama(
+                model_path=model_path,
+                n_ctx=context or globalconf.LOCAL_CONTEXT,
+                n_threads=threads,
+                n_threads_batch=threads,
+                n_batch=512,
+                verbose=False
+            )
+
+    def summarize(self, pmid, abstract_content, simple_instructions=False):
+        instruct = LAY_INSTRUCT if simple_instructions else EXPERT_INSTRUCT
+        try:
+            with METRICS.timer('local_generate'):
+                response = self.llm.create_chat_completion(
+                    messages=[
+                        {"role": "system", "content": instruct},
+                        {"role": "user", "content": abstract_content},
+                    ],
+                    max_tokens=globalconf.LOCAL_MAX_TOKENS,
+                    temperature=0.2
+                )
+            METRICS.increment('local_requests')
+            METRICS.increment('local_prompt_tokens', response['usage']['prompt_tokens'])
+            METRICS.increment('local_completion_tokens', response['usage']['completion_tokens'])
+            return response['choices'][0]['message']['content'].strip()
+        except Exception as e:
+            logger.error(f'Local summarization failure for {pmid}: {str(e)}')
+            METRICS.increment('local_failures')
+            return None
 
-        logging.info(f'Recieved OpenAI Response and used {tokens_used} tokens') # Inform the user
+    def summarize_batch(self, items, simple_instructions=False):
+        logger.info(f'Summarizing {len(items)} abstracts with {self.model}...')
+        return [self.summarize(pmid, abstract_content, simple_instructions) for pmid, abstract_content in items]
 
-        stime = datetime.now().strftime('%Y-%m-%d %H-%M-%S')    # Keep track of the time and date
+    def close(self):
+        self.llm = None
 
-        # If we're using a cache
-        if cache is not None:
-            k = f'{pmid}_{model}'   # Calculate the cache key
-            if simple_instructions:
-                k = k + "_simple"
 
-            cache.set(k, content)
+# Estimated cost in dollars of summarizing 'count' abstracts (about 800 tokens each; a local model costs nothing per
+# token)
+def estimated_cost(conf, count):
+    if conf.SUMMARIZER == 'local':
+        return 0
+    cost_per_1k = 0.002 if conf.GPT_MODEL == "gpt-3.5-turbo" else 0.06
+    return count * 800 * cost_per_1k / 1000.0
 
-        # During debugging, we were logging these queries, but not in production
-        #with open(f'queries/output-{stime}.txt', 'w', encoding='utf-8') as f:
-        #    print(f'== Tokens: {tokens_used} ==', file=f)
-        #    print(res, file=f)
-        #    print("======", file=f)
-        #    print(content, file=f)
+# The name of a local model in cache keys
+def local_model_name(model_path):
+    return 'local-' + os.path.splitext(os.path.basename(model_path))[0]
+
+# The model name the configured backend caches its summaries under (without loading it)
+def summary_model(conf):
+    return local_model_name(conf.LOCAL_MODEL) if conf.SUMMARIZER == 'local' else conf.GPT_MODEL
+
+# Pick the summarizer backend selected in the configuration
+def summarizer_backend(conf):
+    if conf.SUMMARIZER == 'local':
+        return LocalBackend(conf.LOCAL_MODEL, threads=conf.SUMMARIZER_THREADS)
+    return OpenAIBackend(conf.API_KEY, model=conf.GPT_MODEL, packed=conf.PACKED)
+
+
+# Summarize many abstracts, yielding (pmid, summary) pairs in the order of the items as they become available: cached
+# summaries are used as they are, the rest go to the backend in batches of its batch_size and are cached as they come
+# back (cache: an open summary cache to use, e.g. one kept open by the daemon; by default one is opened and closed)
+def iter_summaries(items, backend, simple_instructions=False, cache=None):
+    shared_cache = cache is not None
+    if not shared_cache:
+        cache = open_cache()
+    pending = []    # (pmid, summary or None) waiting for the current batch, in order
+    misses = []
+    try:
+        for pmid, abstract_content in items:
+            result = cache.get(cache_key(pmid, backend.model, simple_instructions))   # Try to get the result from the cache
+            if result is None:
+                misses.append((pmid, abstract_content))
+                METRICS.increment('oai_cache_misses')
+            else:
+                METRICS.increment('oai_cache_hits')
+            pending.append((pmid, result))
+
+            if len(misses) >= backend.batch_size:
+                yield from _complete_batch(pending, misses, cache, backend, simple_instructions)
+                pending, misses = [], []
+        yield from _complete_batch(pending, misses, cache, backend, simple_instructions)
+    finally:
+        if not shared_cache:
+            cache.close()
+
+def _complete_batch(pending, misses, cache, backend, simple_instructions):
+    created = {}
+    if len(misses) > 0:
+        with METRICS.timer('oai_summarize_batch'):
+            contents = backend.summarize_batch(compact_items(misses, backend.model), simple_instructions)
+        for (pmid, _), content in zip(misses, contents):
+            if content is None:
+                created[pmid] = FAILURE_SUMMARY
+            else:
+                cache.set(cache_key(pmid, backend.model, simple_instructions), content, expire=cache_expire())
+                created[pmid] = content
+    for pmid, result in pending:
+        yield pmid, created[pmid] if result is None else result
+
+# A summarize function for the work queue: like iter_summaries, but with None for abstracts that failed
+def summarize_for_queue(backend, simple_instructions=False, cache=None):
+    def summarize(items):
+        for pmid, summary in iter_summaries(items, backend, simple_instructions, cache=cache):
+            yield pmid, None if summary == FAILURE_SUMMARY else summary
+    return summarize
+
+# Reading and filling an open summary cache by PMID for summaries that do not come from iter_summaries (e.g. those
+# read back from the work queue); returns lookup(pmid) -> summary or None, and store(pmid, summary)
+def summary_cache_access(cache, backend, simple_instructions=False):
+    def lookup(pmid):
+        summary = cache.get(cache_key(pmid, backend.model, simple_instructions))
+        METRICS.increment('oai_cache_misses' if summary is None else 'oai_cache_hits')
+        return summary
+
+    def store(pmid, summary):
+        cache.set(cache_key(pmid, backend.model, simple_instructions), summary, expire=cache_expire())
+    return lookup, store
+
+# The name of the work queue for a backend's summaries (one queue per model and instruction set)
+def queue_name(backend, simple_instructions=False):
+    return 'summaries-' + cache_key('', backend.model, simple_instructions).lstrip('_')
+
+# Summarize many abstracts at once; returns a dictionary of PMID -> summary
+def summaries_from_cache_or_create(items, backend, simple_instructions=False):
+    return dict(iter_summaries(items, backend, simple_instructions))
+
+def summary_from_cache_or_create(pmid, abstract_content, apikey, model="gpt-3.5-turbo", baseDirectory = '', simple_instructions=False):
+    # A single abstract through the OpenAI backend
+    backend = OpenAIBackend(apikey, model=model)
+    return summaries_from_cache_or_create([(pmid, abstract_content)], backend, simple_instructions)[pmid]
+
+
+# Get a summary of the article using the OpenAI API (and store it in the cache, if one is given)
+def create_summary(pmid, abstract_content, apikey, model="gpt-3.5-turbo", cache=None, simple_instructions=False):
+    [(_, abstract_content)] = compact_items([(pmid, abstract_content)], model)
+    content = OpenAIBackend(apikey, model=model).summarize(pmid, abstract_content, simple_instructions)
+    if content is None:
+        return FAILURE_SUMMARY
 
-        # Return the summary
-        return content
-    except Exception as e:
-        logging.error(f'OpenAI failure: {str(e)}')
-        return "OpenAI summarization failure"
+    # If we're using a cache
+    if cache is not None:
+        cache.set(cache_key(pmid, model, simple_instructions), content, expire=cache_expire())
+    return content
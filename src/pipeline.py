@@ -0,0 +1,80 @@
+# Streaming stages used by executeMain, so that memory is bounded by queue depths rather than by the number of results.
+#
+#   fetch      pymed's query iterator, which already keeps at most a few efetch batches in flight
+#   classify   classify_articles: counts and drops articles already seen or without an abstract as they stream past,
+#              keeping only the new ones (without their XML)
+#   summarize  in_background: summaries are generated in a worker thread, at most `depth` ahead of the renderer
+#   render     the main thread, which consumes the summaries in order
+
+import collections
+import queue
+import threading
+
+_DONE = object()
+
+
+def classify_articles(articles, seen_pmids, counts, remaining):
+    # Passes every article through (for consumers such as the columnar export) and appends the new ones with an
+    # abstract to 'remaining'; counts['total'], counts['already_seen'] and counts['skipped'] are updated on the way
+    for article in articles:
+        counts['total'] += 1
+        if article.pubmed_id in seen_pmids:
+            counts['already_seen'] += 1
+        elif article.abstract is None:
+            counts['skipped'] += 1
+        else:
+            # The parsed fields are all we need from here on; drop the XML element
+            if hasattr(article, 'xml'):
+                article.xml = None
+            remaining.append(article)
+        yield article
+
+
+def drain(iterable):
+    # Run a generator pipeline to completion, discarding what comes out of its last stage
+    collections.deque(iterable, maxlen=0)
+
+
+def in_background(iterable, depth):
+    # Iterate over 'iterable' in a worker thread, handing its items over through a queue of at most 'depth' items, so
+    # the producer runs ahead of the consumer by no more than that. Exceptions in the worker are raised in the consumer.
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # Returns False once the consumer has gone away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    # The worker starts right away, not on the first request for an item
+    worker = threading.Thread(target=produce, name='pipeline-stage', daemon=True)
+    worker.start()
+    return _consume(items, stop)
+
+
+def _consume(items, stop):
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # If the consumer stops early, the worker exits after its current item
+        stop.set()
@@ -0,0 +1,115 @@
+# Pre-summarization: fills the summary cache with the summaries of new articles as they appear during the week, so the
+# scheduled digest only renders cache hits.
+#
+# A prefetch pass searches a profile's query over the last PREFETCH_WINDOW_DAYS only, drops the articles already in
+# its ledger or without an abstract (as executeMain does), and summarizes the rest that are not cached yet. Near-
+# duplicate grouping and relevance triage are left to the digest, so a prefetch may summarize an article the digest
+# would not; the budgets bound what that can cost:
+#   - PREFETCH_MAX_SUMMARIES_PER_HOUR    new summaries per clock hour, across all profiles
+#   - PREFETCH_MAX_COST_PER_DAY          estimated dollars per day, across all profiles
+# What was spent is kept in PREFETCH_BUDGET in the data directory, so separate passes (and processes) share it.
+# Articles over budget are left for the next pass (or the digest).
+#
+# The daemon runs a pass for each profile every PREFETCH_HOURS (from its TOML, or globalconf) between digests; the
+# "prefetch" command runs one pass over the profiles, e.g. from cron.
+
+import datetime
+import json
+import logging
+import os
+from globalconf import globalconf
+from oai import estimated_cost, iter_summaries, cache_key, FAILURE_SUMMARY
+from pipeline import classify_articles, drain
+from formatting import format_abstract
+from workqueue import profile_lock
+
+logger = logging.getLogger('prefetch')
+
+
+class PrefetchBudget:
+    def __init__(self, path=None):
+        self.path = os.path.join(globalconf.DATADIR, globalconf.PREFETCH_BUDGET) if path is None else path
+
+    def _load(self):
+        now = datetime.datetime.now()
+        day, hour = now.strftime('%Y-%m-%d'), now.strftime('%Y-%m-%dT%H')
+        spent = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                spent = json.load(f)
+        # Start counting again in a new day / hour
+        if spent.get('day') != day:
+            spent['day'], spent['cost'] = day, 0.0
+        if spent.get('hour') != hour:
+            spent['hour'], spent['summaries'] = hour, 0
+        return spent
+
+    def allowance(self, conf):
+        # How many more abstracts may be summarized now
+        spent = self._load()
+        allowed = max(0, globalconf.PREFETCH_MAX_SUMMARIES_PER_HOUR - spent['summaries'])
+        unit_cost = estimated_cost(conf, 1)
+        if unit_cost > 0:
+            allowed = min(allowed, max(0, int((globalconf.PREFETCH_MAX_COST_PER_DAY - spent['cost']) / unit_cost)))
+        return allowed
+
+    def spend(self, conf, count):
+        spent = self._load()
+        spent['summaries'] += count
+        spent['cost'] += estimated_cost(conf, count)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(spent, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def prefetch_profile(conf, resources, budget=None):
+    # One prefetch pass for a profile; returns counts of what it found and did
+    budget = PrefetchBudget() if budget is None else budget
+
+    # The ledger of PMIDs already in a digest of this profile
+    pmid_file = os.path.join(conf.BASEDIR, globalconf.PMID_FILE)
+    seen_pmids = set()
+    if os.path.exists(pmid_file):
+        with profile_lock(conf.BASEDIR):
+            with open(pmid_file, 'r') as f:
+                seen_pmids = { x.strip() for x in f.readlines() }
+
+    # New articles with an abstract in the last few days
+    pubmed = resources.pubmed()
+    counts = {'total': 0, 'already_seen': 0, 'skipped': 0}
+    remaining = []
+    drain(classify_articles(pubmed.query(conf.QUERY, max_results=conf.MAX_RESULTS, reldate=globalconf.PREFETCH_WINDOW_DAYS),
+                            seen_pmids, counts, remaining))
+
+    # Those that a digest would summarize and that are not in the summary cache yet
+    summarizer = resources.summarizer(conf)
+    cache = resources.summary_cache()
+    items = []
+    for article in remaining:
+        abstract_plain, _ = format_abstract(article)
+        if len(abstract_plain) > globalconf.OAI_LOWER_THRESHOLD and cache_key(article.pubmed_id, summarizer.model) not in cache:
+            items.append((article.pubmed_id, abstract_plain))
+
+    # Summarize as many as the budgets allow (into the cache), charging every summary as it comes back
+    allowed = budget.allowance(conf)
+    batch = items[:allowed]
+    summarized = 0
+    failed = 0
+    try:
+        for _, summary in iter_summaries(batch, summarizer, cache=cache):
+            budget.spend(conf, 1)
+            if summary == FAILURE_SUMMARY:
+                failed += 1
+            else:
+                summarized += 1
+    finally:
+        # If the pass is cut short (e.g. by an error in the middle of a request), the request that was under way is
+        # charged too
+        unfinished = min(summarizer.batch_size, len(batch) - summarized - failed)
+        if unfinished > 0:
+            budget.spend(conf, unfinished)
+
+    report = {'new': len(remaining), 'uncached': len(items), 'summarized': summarized, 'failed': failed,
+              'over_budget': max(0, len(items) - allowed)}
+    logger.info(f'Prefetch for {conf.BASEDIR}: {report}')
+    return report
@@ -0,0 +1,74 @@
+# Sampling profiler for whole runs (--profile).
+#
+# A background thread takes the stack of every other thread every PROFILE_INTERVAL_SECONDS (sys._current_frames, so
+# nothing is instrumented and the program runs at nearly full speed) and counts identical stacks. The result is
+# written as "folded" stacks, one line per distinct stack ("thread;module:function;...;module:function count"), which
+# flamegraph.pl, speedscope (https://www.speedscope.app) and inferno turn into flame graphs; the functions that were
+# on top of the stack most often are logged as a quick summary.
+
+import collections
+import logging
+import os
+import sys
+import threading
+from globalconf import globalconf
+
+logger = logging.getLogger('profiling')
+
+
+class SamplingProfiler:
+    def __init__(self, interval=None):
+        self.interval = globalconf.PROFILE_INTERVAL_SECONDS if interval is None else interval
+        self.stacks = collections.Counter()     # Folded stack -> number of samples
+        self.samples = 0
+        self._labels = {}                       # Code object -> "module:function"
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = self._labels[code] = f'{module}:{code.co_name}'
+        return label
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def top_functions(self, count=15):
+        # (function, share of samples) for the functions most often on top of a stack
+        on_top = collections.Counter()
+        for stack, samples in self.stacks.items():
+            on_top[stack.rsplit(';', 1)[-1]] += samples
+        total = sum(on_top.values()) or 1
+        return [(function, samples / total) for function, samples in on_top.most_common(count)]
+
+    def write_folded(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, samples in sorted(self.stacks.items()):
+                f.write(f'{stack} {samples}\n')
+        logger.info(f'Profile of {self.samples} samples; most often running: '
+                    + ', '.join(f'{function} {share:.0%}' for function, share in self.top_functions(8)))
@@ -1,4 +1,8 @@
 from .api import PubMed
+from .aio import AsyncPubMed
+from .author import Author
+from .cache import ResponseCache
+from .codec import CompressedDisk, StorageCodec
 from .version import __version__
 
-__all__ = ["PubMed", "__version__"]
+__all__ = ["PubMed", "AsyncPubMed", "Author", "ResponseCache", "CompressedDisk", "StorageCodec", "__version__"]
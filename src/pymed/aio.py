@@ -0,0 +1,648 @@
+import asyncio
+import aiohttp
+import collections
+import contextlib
+import datetime
+import json
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+from typing import AsyncIterator, Union
+
+from .helpers import batches
+from .parsing import parseArticles, parseArticleRecords, articlesFromRecords
+from .ratelimit import AsyncRateLimiter
+
+
+# Base url for all queries
+BASE_URL = "https://eutils.ncbi.nlm.nih.gov"
+
+# ESearch only returns the first 9,999 IDs of a search, however retstart is set
+ESEARCH_WINDOW = 9999
+
+# Lower bound for date-sharded searches (the oldest records in PubMed)
+EARLIEST_DATE = datetime.date(1781, 1, 1)
+
+# Date type reldate filters on when the parameters do not set one (the Entrez date); sharded searches split on it
+DEFAULT_DATETYPE = "edat"
+
+# Number of PMIDs sent in one elink request (one link set is returned per PMID)
+ELINK_BATCH_SIZE = 100
+
+# Number of related articles kept per link set (the most similar ones first)
+RELATED_KEPT = 20
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPubMed(object):
+    """ Asyncio-native wrapper around the PubMed API.
+    """
+
+    def __init__(
+        self: object,
+        tool: str = "my_tool",
+        email: str = "my_email@example.com",
+        max_connections: int = 10,
+        rate_limit: int = 3,
+        parse_workers: int = 0,
+        queue_depth: int = 4,
+        metrics: object = None,
+        base_url: str = BASE_URL,
+        cache: object = None,
+    ) -> None:
+        """ Initialization of the object.
+
+            Parameters:
+                - tool              String, name of the tool that is executing the query.
+                                    This parameter is not required but kindly requested by
+                                    PMC (PubMed Central).
+                - email             String, email of the user of the tool. This parameter
+                                    is not required but kindly requested by PMC (PubMed Central).
+                - max_connections   Int, size of the HTTP connection pool.
+                - rate_limit        Int, maximum number of requests per second (NCBI allows
+                                    3 per second without an API key).
+                - parse_workers     Int, number of worker processes used to parse efetch
+                                    responses. 0 (the default) parses in a thread of the
+                                    current process; use more for large backfills.
+                - queue_depth       Int, maximum number of downloaded responses waiting to be
+                                    parsed when parse_workers is used.
+                - metrics           Object, optional metrics registry providing increment(name,
+                                    value), observe(name, value) and timer(name).
+                - base_url          Str, E-utilities server (e.g. a local replay server for
+                                    benchmarks).
+                - cache             ResponseCache, optional persistent cache of responses;
+                                    cached requests are answered without using the network.
+
+            Returns:
+                - None
+        """
+
+        # Store the input parameters
+        self.tool = tool
+        self.email = email
+        self.base_url = base_url
+
+        # Keep track of the rate limit
+        self._rateLimiter = AsyncRateLimiter(max_requests=rate_limit, period=1.0)
+
+        # The HTTP session is created lazily, inside the running event loop
+        self._maxConnections = max_connections
+        self._session = None
+
+        # The parsing process pool is also created lazily
+        self._parseWorkers = parse_workers
+        self._queueDepth = queue_depth
+        self._parsePool = None
+
+        # Optional instrumentation and response cache
+        self._metrics = metrics
+        self._cache = cache
+
+        # Define the standard / default query parameters
+        self.parameters = {"tool": tool, "email": email, "db": "pubmed"}
+
+    def _timer(self: object, name: str) -> object:
+        """ Helper method that times a block into the metrics registry, if there is one.
+        """
+
+        return contextlib.nullcontext() if self._metrics is None else self._metrics.timer(name)
+
+    def _count(self: object, name: str, value: float = 1) -> None:
+        """ Helper method that increments a counter in the metrics registry, if there is one.
+        """
+
+        if self._metrics is not None:
+            self._metrics.increment(name, value)
+
+    async def __aenter__(self: object) -> "AsyncPubMed":
+        return self
+
+    async def __aexit__(self: object, *exc_info) -> None:
+        await self.close()
+
+    async def close(self: object) -> None:
+        """ Close the pooled HTTP connections.
+        """
+
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+        if self._parsePool is not None:
+            self._parsePool.shutdown()
+        self._parsePool = None
+
+    async def query(
+        self: object, query: str, max_results: int = 100, reldate: int = None
+    ) -> AsyncIterator:
+        """ Method that executes a query against PubMed and yields the parsed articles.
+
+            Parameters:
+                - query         Str, query to be executed against the PubMed database.
+                - max_results   Int, the maximum number of results to retrieve.
+                - reldate       Int, only return articles from the last reldate days.
+
+            Returns:
+                - articles      Async iterator of PubMedArticle / PubMedBookArticle objects.
+        """
+
+        # Retrieve the article IDs for the query
+        article_ids = await self._getArticleIds(query=query, max_results=max_results, reldate=reldate)
+
+        # Get the articles themselves
+        async for article in self._iterArticles(article_ids):
+            yield article
+
+    async def getTotalResultsCount(self: object, query: str) -> int:
+        """ Helper method that returns the total number of results that match the query.
+
+            Parameters:
+                - query                 String, the query to send to PubMed
+
+            Returns:
+                - total_results_count   Int, total number of results for the query in PubMed
+        """
+
+        # Get the default parameters
+        parameters = self.parameters.copy()
+
+        # Add specific query parameters
+        parameters["term"] = query
+        parameters["retmax"] = 1
+
+        # Make the request (request a single article ID for this search)
+        response = await self._get(url="/entrez/eutils/esearch.fcgi", parameters=parameters)
+
+        # Get from the returned meta data the total number of available results for the query
+        return int(response.get("esearchresult", {}).get("count"))
+
+    async def getLinks(self: object, article_ids: list, related: int = 5) -> dict:
+        """ Method that retrieves the citing and related articles of articles.
+
+            The link sets of many articles are requested at once, ELINK_BATCH_SIZE PMIDs per
+            elink request, and are cached per article, so an article that was enriched
+            recently costs no request at all.
+
+            Parameters:
+                - article_ids   List, article IDs.
+                - related       Int, maximum number of related articles per article.
+
+            Returns:
+                - links         Dict, article ID -> {"cited_by": [PMIDs of citing articles],
+                                "related": [PMIDs of the most similar articles]}. Articles
+                                that elink did not answer for are left out.
+        """
+
+        links = {}
+        missing = []
+        for article_id in dict.fromkeys(str(article_id) for article_id in article_ids):
+            cached = None if self._cache is None else self._cache.getLinks(article_id)
+            if cached is not None:
+                links[article_id] = cached
+            else:
+                missing.append(article_id)
+        self._count("pymed_elink_cache_hits", len(links))
+
+        # Request the batches concurrently; the rate limiter spaces out the requests
+        responses = await asyncio.gather(
+            *(self._getLinkSets(batch) for batch in batches(missing, ELINK_BATCH_SIZE))
+        )
+        for response in responses:
+            for article_id, linkset in response.items():
+                if self._cache is not None:
+                    self._cache.setLinks(article_id, linkset)
+                links[article_id] = linkset
+
+        return {
+            article_id: {"cited_by": linkset["cited_by"], "related": linkset["related"][:related]}
+            for article_id, linkset in links.items()
+        }
+
+    async def _getLinkSets(self: object, article_ids: list) -> dict:
+        """ Helper method that requests the PubMed link sets of a batch of article IDs.
+
+            Parameters:
+                - article_ids   List, article IDs.
+
+            Returns:
+                - links         Dict, article ID -> {"cited_by": list, "related": list}.
+        """
+
+        # Get the default parameters; repeated id parameters return one link set per ID
+        # (a comma-separated list would merge them)
+        parameters = self.parameters.copy()
+        parameters["dbfrom"] = "pubmed"
+        parameters["cmd"] = "neighbor"
+        parameters["id"] = article_ids
+
+        # Make the request
+        response = await self._get(url="/entrez/eutils/elink.fcgi", parameters=parameters)
+
+        links = {}
+        for linkset in response.get("linksets", []):
+            ids = [str(article_id) for article_id in linkset.get("ids", [])]
+            if len(ids) != 1:
+                continue
+            cited_by = []
+            related = []
+            for linksetdb in linkset.get("linksetdbs", []):
+                if linksetdb.get("linkname") == "pubmed_pubmed_citedin":
+                    cited_by = [str(link) for link in linksetdb.get("links", [])]
+                elif linksetdb.get("linkname") == "pubmed_pubmed":
+                    # The article itself is its own closest neighbor
+                    related = [str(link) for link in linksetdb.get("links", []) if str(link) != ids[0]]
+            links[ids[0]] = {"cited_by": cited_by, "related": related[:RELATED_KEPT]}
+
+        return links
+
+    async def _getSession(self: object) -> aiohttp.ClientSession:
+        """ Helper method that returns the pooled HTTP session, creating it if needed.
+        """
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._maxConnections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _get(
+        self: object, url: str, parameters: dict, output: str = "json"
+    ) -> Union[dict, str]:
+        """ Generic helper method that makes a request to PubMed.
+
+            Parameters:
+                - url           Str, last part of the URL that is requested (will
+                                be combined with the base url)
+                - parameters    Dict, parameters to use for the request; list values
+                                are sent as repeated parameters
+                - output        Str, type of output that is requested (defaults to
+                                JSON but can be used to retrieve XML)
+
+            Returns:
+                - response      Dict / str, if the response is valid JSON it will
+                                be parsed before returning, otherwise a string is
+                                returend
+        """
+
+        # Set the response mode
+        parameters["retmode"] = output
+
+        # Expand list values into repeated parameters (the way requests encodes them)
+        query = []
+        for key, value in parameters.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            query += [(key, str(v)) for v in values]
+
+        # Name the endpoint for the metrics, e.g. "esearch"
+        endpoint = url.rsplit("/", 1)[-1].split(".")[0]
+
+        # The whole request (cache lookup, rate limit wait, download) is one span of the trace
+        with self._timer(f"pymed_{endpoint}_get"):
+            # Answer from the cache if possible (E-utilities responses are UTF-8)
+            body = None if self._cache is None else self._cache.get(url, query)
+            encoding = "utf-8"
+            if body is not None:
+                self._count(f"pymed_{endpoint}_cache_hits")
+            else:
+                session = await self._getSession()
+
+                # Make sure the rate limit is not exceeded
+                with self._timer("pymed_rate_limit_wait"):
+                    await self._rateLimiter.acquire()
+
+                # Make the request to PubMed
+                with self._timer(f"pymed_{endpoint}_request"):
+                    async with session.get(f"{self.base_url}{url}", params=query) as response:
+                        # Check for any errors
+                        response.raise_for_status()
+
+                        body = await response.read()
+                        encoding = response.charset or "utf-8"
+
+                self._count(f"pymed_{endpoint}_requests")
+                logger.debug("GET %s returned %d bytes", response.url, len(body))
+                self._count(f"pymed_{endpoint}_bytes", len(body))
+
+                if self._cache is not None:
+                    self._cache.set(url, query, body.decode(encoding).encode("utf-8"))
+
+        # Return the response
+        if output == "json":
+            return json.loads(body.decode(encoding))
+        else:
+            return body.decode(encoding)
+
+    async def _fetchArticles(self: object, article_ids: list) -> str:
+        """ Helper method that downloads the efetch XML for a batch of article IDs.
+        """
+
+        # Get the default parameters
+        parameters = self.parameters.copy()
+        parameters["id"] = article_ids
+
+        # Make the request
+        return await self._get(
+            url="/entrez/eutils/efetch.fcgi", parameters=parameters, output="xml"
+        )
+
+    async def _parseArticles(self: object, response: str) -> list:
+        """ Helper method that parses an efetch response off the event loop.
+        """
+
+        loop = asyncio.get_running_loop()
+        with self._timer("pymed_parse"):
+            articles = await loop.run_in_executor(None, parseArticles, response)
+        self._count("pymed_articles_parsed", len(articles))
+        return articles
+
+    async def _getArticles(self: object, article_ids: list) -> AsyncIterator:
+        """ Helper method that retrieves the content of a batch of article IDs.
+
+            Parameters:
+                - article_ids   List, article IDs.
+
+            Returns:
+                - articles      Async iterator of article objects.
+        """
+
+        with self._timer("pymed_get_articles"):
+            response = await self._fetchArticles(article_ids)
+            articles = await self._parseArticles(response)
+        for article in articles:
+            yield article
+
+    async def _iterArticles(self: object, article_ids: list) -> AsyncIterator:
+        """ Helper method that retrieves all articles in batches of 250, downloading
+            the next batch while the current one is being parsed.
+
+            Parameters:
+                - article_ids   List, article IDs.
+
+            Returns:
+                - articles      Async iterator of article objects.
+        """
+
+        if self._parseWorkers > 0:
+            async for article in self._iterArticlesPooled(article_ids):
+                yield article
+            return
+
+        article_batches = list(batches(article_ids, 250))
+        download = None
+
+        try:
+            for index, batch in enumerate(article_batches):
+                if download is None:
+                    download = asyncio.ensure_future(self._fetchArticles(batch))
+                response = await download
+
+                # Start the next download before parsing this batch
+                download = None
+                if index + 1 < len(article_batches):
+                    download = asyncio.ensure_future(
+                        self._fetchArticles(article_batches[index + 1])
+                    )
+
+                for article in await self._parseArticles(response):
+                    yield article
+        finally:
+            # Do not leave a download running if the caller stops iterating early
+            if download is not None:
+                download.cancel()
+
+    async def _iterArticlesPooled(self: object, article_ids: list) -> AsyncIterator:
+        """ Helper method that retrieves all articles in batches of 250, parsing the
+            responses in a process pool. Downloads feed the pool through a bounded queue,
+            so at most queue_depth responses wait in memory; articles are yielded in
+            batch order.
+
+            Parameters:
+                - article_ids   List, article IDs.
+
+            Returns:
+                - articles      Async iterator of article objects (without their XML element).
+        """
+
+        loop = asyncio.get_running_loop()
+        if self._parsePool is None:
+            self._parsePool = ProcessPoolExecutor(max_workers=self._parseWorkers)
+
+        queue = asyncio.Queue(maxsize=self._queueDepth)
+
+        async def download():
+            # Put every response on the queue, followed by None (done) or the error
+            try:
+                for batch in batches(article_ids, 250):
+                    await queue.put(await self._fetchArticles(batch))
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+
+        downloader = asyncio.ensure_future(download())
+        parsing = collections.deque()
+        downloaded = False
+
+        try:
+            while not downloaded or parsing:
+                # Keep every worker busy, without waiting on the network if parsed batches are ready
+                while not downloaded and len(parsing) < self._parseWorkers:
+                    if parsing and queue.empty():
+                        break
+                    response = await queue.get()
+                    if response is None:
+                        downloaded = True
+                    elif isinstance(response, Exception):
+                        raise response
+                    else:
+                        parsing.append(loop.run_in_executor(self._parsePool, parseArticleRecords, response))
+
+                if parsing:
+                    with self._timer("pymed_parse_wait"):
+                        records = await parsing.popleft()
+                    self._count("pymed_articles_parsed", len(records))
+                    for article in articlesFromRecords(records):
+                        yield article
+        finally:
+            downloader.cancel()
+            for future in parsing:
+                future.cancel()
+
+    async def _getArticleIds(
+        self: object, query: str, max_results: int, reldate: int = None
+    ) -> list:
+        """ Helper method to retrieve the article IDs for a query.
+
+            ESearch only returns the first ESEARCH_WINDOW IDs of a search. When more results
+            are wanted, the IDs of the first page are kept and the rest of the search is split
+            into date ranges (of the date type reldate filters on) that each fit in the window;
+            those shards are searched in parallel, newest first, until max_results IDs are found,
+            and merged with the first page without duplicates.
+
+            Parameters:
+                - query         Str, query to be executed against the PubMed database.
+                - max_results   Int, the maximum number of results to retrieve (-1 for all).
+                - reldate       Int, only return articles from the last reldate days.
+
+            Returns:
+                - article_ids   List, article IDs as a list.
+        """
+
+        # Create a placeholder for the retrieved IDs
+        article_ids = []
+
+        # Get the default parameters
+        parameters = self.parameters.copy()
+
+        # Add specific query parameters
+        parameters["term"] = query
+        parameters["retmax"] = ESEARCH_WINDOW
+        if reldate is not None:
+            parameters["reldate"] = reldate
+
+        # Calculate a cut off point based on the max_results parameter
+        if 0 <= max_results < parameters["retmax"]:
+            parameters["retmax"] = max_results
+
+        # Make the first request to PubMed
+        response = await self._get(url="/entrez/eutils/esearch.fcgi", parameters=parameters)
+
+        # Add the retrieved IDs to the list
+        article_ids += response.get("esearchresult", {}).get("idlist", [])
+
+        # Get information from the response
+        total_result_count = int(response.get("esearchresult", {}).get("count"))
+        retrieved_count = int(response.get("esearchresult", {}).get("retmax"))
+
+        # If no max is provided (-1) we'll try to retrieve everything
+        if max_results == -1:
+            max_results = total_result_count
+
+        # More results than ESearch can page through: shard the search by date
+        if min(total_result_count, max_results) > ESEARCH_WINDOW:
+            article_ids += await self._getShardedArticleIds(
+                query=query, reldate=reldate, limit=max_results - len(article_ids), known=set(article_ids)
+            )
+            return article_ids[:max_results]
+
+        # If not all articles are retrieved, continue to make requests untill we have everything
+        while retrieved_count < total_result_count and retrieved_count < max_results:
+
+            # Calculate a cut off point based on the max_results parameter
+            if (max_results - retrieved_count) < parameters["retmax"]:
+                parameters["retmax"] = max_results - retrieved_count
+
+            # Start the collection from the number of already retrieved articles
+            parameters["retstart"] = retrieved_count
+
+            # Make a new request
+            response = await self._get(
+                url="/entrez/eutils/esearch.fcgi", parameters=parameters
+            )
+
+            # Add the retrieved IDs to the list
+            page = response.get("esearchresult", {}).get("idlist", [])
+            article_ids += page
+
+            # Get information from the response
+            retrieved_count += int(response.get("esearchresult", {}).get("retmax"))
+
+            # Stop if the server returns nothing more
+            if len(page) == 0:
+                break
+
+        # Return the response
+        return article_ids
+
+    async def _getShardedArticleIds(
+        self: object, query: str, reldate: int = None, limit: int = None, known: set = frozenset()
+    ) -> list:
+        """ Helper method that retrieves the article IDs for a query by date shards.
+
+            Parameters:
+                - query         Str, query to be executed against the PubMed database.
+                - reldate       Int, only return articles from the last reldate days.
+                - limit         Int, stop searching older shards once this many new IDs are
+                                found (None for all).
+                - known         Set, IDs already retrieved, which are left out.
+
+            Returns:
+                - article_ids   List, new article IDs (newest shards first, without duplicates).
+        """
+
+        today = datetime.date.today()
+        start = EARLIEST_DATE if reldate is None else today - datetime.timedelta(days=int(reldate))
+
+        # Some dates can lie in the future (publication dates of articles published ahead of their issue)
+        end = datetime.date(today.year + 1, 12, 31)
+
+        article_ids = await self._searchDateRange(query=query, start=start, end=end, limit=limit, known=known)
+        return list(dict.fromkeys(article_ids))
+
+    async def _searchDateRange(
+        self: object, query: str, start: datetime.date, end: datetime.date, limit: int = None,
+        known: set = frozenset()
+    ) -> list:
+        """ Helper method that retrieves the article IDs of a query within a date range (of the
+            date type reldate filters on), splitting the range further while it holds more than
+            ESEARCH_WINDOW results.
+
+            Parameters:
+                - query         Str, query to be executed against the PubMed database.
+                - start         Date, first date of the range.
+                - end           Date, last date of the range.
+                - limit         Int, stop searching older sub-ranges once this many new IDs are
+                                found (None for all).
+                - known         Set, IDs already retrieved, which are left out.
+
+            Returns:
+                - article_ids   List, new article IDs (newest sub-ranges first).
+        """
+
+        parameters = self.parameters.copy()
+        parameters["term"] = query
+        parameters.setdefault("datetype", DEFAULT_DATETYPE)
+        parameters["mindate"] = start.strftime("%Y/%m/%d")
+        parameters["maxdate"] = end.strftime("%Y/%m/%d")
+        parameters["retmax"] = ESEARCH_WINDOW
+
+        response = await self._get(url="/entrez/eutils/esearch.fcgi", parameters=parameters)
+        article_ids = [
+            article_id for article_id in response.get("esearchresult", {}).get("idlist", [])
+            if article_id not in known
+        ]
+        count = int(response.get("esearchresult", {}).get("count"))
+        self._count("pymed_esearch_shards")
+
+        if count <= ESEARCH_WINDOW:
+            return article_ids
+
+        # A single day cannot be split any further
+        days = (end - start).days + 1
+        if days == 1:
+            logger.warning(
+                f"{count} results dated {start} exceed the ESearch window; "
+                f"only {len(article_ids)} are retrieved"
+            )
+            return article_ids
+
+        # Split into enough equal sub-ranges that each should fit, and search them in parallel, newest first. With a
+        # limit, only as many sub-ranges are searched at a time as should still be needed to reach it
+        pieces = min(days, count // ESEARCH_WINDOW + 2)
+        bounds = [start + datetime.timedelta(days=days * i // pieces) for i in range(pieces + 1)]
+        ranges = [(bounds[i], bounds[i + 1] - datetime.timedelta(days=1)) for i in reversed(range(pieces))]
+        per_range = max(1, count // pieces)
+
+        article_ids = []
+        while ranges and (limit is None or len(article_ids) < limit):
+            remaining = None if limit is None else limit - len(article_ids)
+            wave = len(ranges) if remaining is None else -(-remaining // per_range)
+            shards = await asyncio.gather(
+                *[
+                    self._searchDateRange(query=query, start=s, end=e, limit=remaining, known=known)
+                    for s, e in ranges[:wave]
+                ]
+            )
+            ranges = ranges[wave:]
+            article_ids += [article_id for shard in shards for article_id in shard]
+        return article_ids
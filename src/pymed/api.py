@@ -1,26 +1,25 @@
-import datetime
-import requests
-import itertools
+import asyncio
 
-import xml.etree.ElementTree as xml
+from typing import Iterator, Union
 
-from typing import Union
-
-from .helpers import batches
-from .article import PubMedArticle
-from .book import PubMedBookArticle
-
-
-# Base url for all queries
-BASE_URL = "https://eutils.ncbi.nlm.nih.gov"
+from .aio import AsyncPubMed, BASE_URL
 
 
 class PubMed(object):
     """ Wrapper around the PubMed API.
+
+        This is a thin synchronous wrapper that drives an AsyncPubMed client on
+        a private event loop; use AsyncPubMed directly from asynchronous code.
     """
 
     def __init__(
-        self: object, tool: str = "my_tool", email: str = "my_email@example.com"
+        self: object,
+        tool: str = "my_tool",
+        email: str = "my_email@example.com",
+        parse_workers: int = 0,
+        metrics: object = None,
+        base_url: str = BASE_URL,
+        cache: object = None,
     ) -> None:
         """ Initialization of the object.
 
@@ -30,6 +29,12 @@ class PubMed(object):
                             PMC (PubMed Central).
                 - email     String, email of the user of the tool. This parameter
                             is not required but kindly requested by PMC (PubMed Central).
+                - parse_workers
+                            Int, number of worker processes used to parse efetch
+                            responses (0 parses in-process).
+                - metrics   Object, optional metrics registry (see AsyncPubMed).
+                - base_url  Str, E-utilities server (see AsyncPubMed).
+                - cache     ResponseCache, optional persistent response cache.
 
             Returns:
                 - None
@@ -39,38 +44,48 @@ class PubMed(object):
         self.tool = tool
         self.email = email
 
-        # Keep track of the rate limit
-        self._rateLimit = 2
-        self._requestsMade = []
+        # The asynchronous client does the actual work on a private event loop
+        self._client = AsyncPubMed(
+            tool=tool, email=email, parse_workers=parse_workers, metrics=metrics, base_url=base_url,
+            cache=cache
+        )
+        self._loop = asyncio.new_event_loop()
 
         # Define the standard / default query parameters
-        self.parameters = {"tool": tool, "email": email, "db": "pubmed"}
+        self.parameters = self._client.parameters
+
+    def __enter__(self: object) -> "PubMed":
+        return self
 
-    def query(self: object, query: str, max_results: int = 100, reldate : int = None):
-        """ Method that executes a query agains the GraphQL schema, automatically
-            inserting the PubMed data loader.
+    def __exit__(self: object, *exc_info) -> None:
+        self.close()
+
+    def close(self: object) -> None:
+        """ Close the pooled HTTP connections and the private event loop.
+        """
+
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self._client.close())
+            self._loop.close()
+
+    def query(self: object, query: str, max_results: int = 100, reldate : int = None) -> Iterator:
+        """ Method that executes a query against PubMed.
 
             Parameters:
-                - query     String, the GraphQL query to execute against the schema.
+                - query         Str, query to be executed against the PubMed database.
+                - max_results   Int, the maximum number of results to retrieve.
+                - reldate       Int, only return articles from the last reldate days.
 
             Returns:
-                - result    ExecutionResult, GraphQL object that contains the result
-                            in the "data" attribute.
+                - articles      Iterator of PubMedArticle / PubMedBookArticle objects;
+                                the articles are downloaded as the iterator is consumed.
         """
 
         # Retrieve the article IDs for the query
         article_ids = self._getArticleIds(query=query, max_results=max_results, reldate=reldate)
 
         # Get the articles themselves
-        articles = list(
-            [
-                self._getArticles(article_ids=batch)
-                for batch in batches(article_ids, 250)
-            ]
-        )
-
-        # Chain the batches back together and return the list
-        return itertools.chain.from_iterable(articles)
+        return self._iterate(self._client._iterArticles(article_ids))
 
     def getTotalResultsCount(self: object, query: str) -> int:
         """ Helper method that returns the total number of results that match the query.
@@ -82,34 +97,46 @@ class PubMed(object):
                 - total_results_count   Int, total number of results for the query in PubMed
         """
 
-        # Get the default parameters
-        parameters = self.parameters.copy()
+        return self._run(self._client.getTotalResultsCount(query))
 
-        # Add specific query parameters
-        parameters["term"] = query
-        parameters["retmax"] = 1
+    def getLinks(self: object, article_ids: list, related: int = 5) -> dict:
+        """ Method that retrieves the citing and related articles of articles.
 
-        # Make the request (request a single article ID for this search)
-        response = self._get(url="/entrez/eutils/esearch.fcgi", parameters=parameters)
+            Parameters:
+                - article_ids   List, article IDs.
+                - related       Int, maximum number of related articles per article.
 
-        # Get from the returned meta data the total number of available results for the query
-        total_results_count = int(response.get("esearchresult", {}).get("count"))
+            Returns:
+                - links         Dict, article ID -> {"cited_by": list, "related": list}
+                                (see AsyncPubMed.getLinks).
+        """
 
-        # Return the total number of results (without retrieving them)
-        return total_results_count
-    
-    def _exceededRateLimit(self) -> bool:
-        """ Helper method to check if we've exceeded the rate limit.
+        return self._run(self._client.getLinks(article_ids, related=related))
 
-            Returns:
-                - exceeded      Bool, Whether or not the rate limit is exceeded.
+    def _run(self: object, coroutine):
+        """ Helper method that runs a coroutine to completion on the private event loop.
         """
 
-        # Remove requests from the list that are longer than 1 second ago
-        self._requestsMade = [requestTime for requestTime in self._requestsMade if requestTime > datetime.datetime.now() - datetime.timedelta(seconds=1)]
+        return self._loop.run_until_complete(coroutine)
+
+    def _iterate(self: object, async_iterator) -> Iterator:
+        """ Helper method that turns an async iterator into a regular iterator.
 
-        # Return whether we've made more requests in the last second, than the rate limit
-        return len(self._requestsMade) > self._rateLimit
+            If the caller stops early (a break, an exception, or dropping the iterator), the
+            async iterator is closed on the private event loop, so its cleanup (e.g. cancelling
+            fetches in flight) still runs.
+        """
+
+        try:
+            while True:
+                try:
+                    item = self._run(async_iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            if not self._loop.is_closed() and not self._loop.is_running():
+                self._run(async_iterator.aclose())
 
     def _get(
         self: object, url: str, parameters: dict, output: str = "json"
@@ -129,56 +156,19 @@ class PubMed(object):
                                 returend
         """
 
-        # Make sure the rate limit is not exceeded
-        while self._exceededRateLimit():
-            pass
-
-        # Set the response mode
-        parameters["retmode"] = output
+        return self._run(self._client._get(url=url, parameters=parameters, output=output))
 
-        # Make the request to PubMed
-        response = requests.get(f"{BASE_URL}{url}", params=parameters)
-        print(response.request.url)
-
-        # Check for any errors
-        response.raise_for_status()
-
-        # Add this request to the list of requests made
-        self._requestsMade.append(datetime.datetime.now())
-
-        # Return the response
-        if output == "json":
-            return response.json()
-        else:
-            return response.text
-
-    def _getArticles(self: object, article_ids: list) -> list:
-        """ Helper method that batches a list of article IDs and retrieves the content.
+    def _getArticles(self: object, article_ids: list) -> Iterator:
+        """ Helper method that retrieves the content of a batch of article IDs.
 
             Parameters:
                 - article_ids   List, article IDs.
 
             Returns:
-                - articles      List, article objects.
+                - articles      Iterator, article objects.
         """
 
-        # Get the default parameters
-        parameters = self.parameters.copy()
-        parameters["id"] = article_ids
-
-        # Make the request
-        response = self._get(
-            url="/entrez/eutils/efetch.fcgi", parameters=parameters, output="xml"
-        )
-
-        # Parse as XML
-        root = xml.fromstring(response)
-
-        # Loop over the articles and construct article objects
-        for article in root.iter("PubmedArticle"):
-            yield PubMedArticle(xml_element=article)
-        for book in root.iter("PubmedBookArticle"):
-            yield PubMedBookArticle(xml_element=book)
+        return self._iterate(self._client._getArticles(article_ids))
 
     def _getArticleIds(self: object, query: str, max_results: int, reldate : int = None) -> list:
         """ Helper method to retrieve the article IDs for a query.
@@ -191,56 +181,6 @@ class PubMed(object):
                 - article_ids   List, article IDs as a list.
         """
 
-        # Create a placeholder for the retrieved IDs
-        article_ids = []
-
-        # Get the default parameters
-        parameters = self.parameters.copy()
-
-        # Add specific query parameters
-        parameters["term"] = query
-        parameters["retmax"] = 50000
-        if reldate is not None:
-            parameters["reldate"] = reldate
-
-        # Calculate a cut off point based on the max_results parameter
-        if max_results < parameters["retmax"]:
-            parameters["retmax"] = max_results
-
-        # Make the first request to PubMed
-        response = self._get(url="/entrez/eutils/esearch.fcgi", parameters=parameters)
-
-        # Add the retrieved IDs to the list
-        article_ids += response.get("esearchresult", {}).get("idlist", [])
-
-        # Get information from the response
-        total_result_count = int(response.get("esearchresult", {}).get("count"))
-        retrieved_count = int(response.get("esearchresult", {}).get("retmax"))
-
-        # If no max is provided (-1) we'll try to retrieve everything
-        if max_results == -1:
-            max_results = total_result_count
-
-        # If not all articles are retrieved, continue to make requests untill we have everything
-        while retrieved_count < total_result_count and retrieved_count < max_results:
-
-            # Calculate a cut off point based on the max_results parameter
-            if (max_results - retrieved_count) < parameters["retmax"]:
-                parameters["retmax"] = max_results - retrieved_count
-
-            # Start the collection from the number of already retrieved articles
-            parameters["retstart"] = retrieved_count
-
-            # Make a new request
-            response = self._get(
-                url="/entrez/eutils/esearch.fcgi", parameters=parameters
-            )
-
-            # Add the retrieved IDs to the list
-            article_ids += response.get("esearchresult", {}).get("idlist", [])
-
-            # Get information from the response
-            retrieved_count += int(response.get("esearchresult", {}).get("retmax"))
-
-        # Return the response
-        return article_ids
+        return self._run(
+            self._client._getArticleIds(query=query, max_results=max_results, reldate=reldate)
+        )
@@ -1,12 +1,16 @@
 import json
+import logging
 import datetime
 
 from xml.etree.ElementTree import Element
 from typing import TypeVar
 from typing import Optional
 
+from .author import Author
 from .helpers import getContent, getStructuredAbstractContent
 
+logger = logging.getLogger(__name__)
+
 
 class PubMedArticle(object):
     """ Data class that contains a PubMed article.
@@ -18,6 +22,7 @@ class PubMedArticle(object):
         "abstract",
         "structuredAbstract",
         "keywords",
+        "mesh_terms",
         "journal",
         "publication_date",
         "authors",
@@ -27,6 +32,7 @@ class PubMedArticle(object):
         "copyrights",
         "doi",
         "xml",
+        "links",
     )
 
     def __init__(
@@ -66,6 +72,12 @@ class PubMedArticle(object):
             keyword.text for keyword in xml_element.findall(path) if keyword is not None
         ]
 
+    def _extractMeshTerms(self: object, xml_element: TypeVar("Element")) -> list:
+        path = ".//MeshHeading/DescriptorName"
+        return [
+            descriptor.text for descriptor in xml_element.findall(path) if descriptor.text is not None
+        ]
+
     def _extractJournal(self: object, xml_element: TypeVar("Element")) -> str:
         path = ".//Journal/Title"
         return getContent(element=xml_element, path=path)
@@ -117,17 +129,17 @@ class PubMedArticle(object):
 
         # Unable to parse the datetime
         except Exception as e:
-            print(e)
+            logger.debug("Unable to parse the publication date: %s", e)
             return None
 
     def _extractAuthors(self: object, xml_element: TypeVar("Element")) -> list:
         return [
-            {
-                "lastname": getContent(author, ".//LastName", None),
-                "firstname": getContent(author, ".//ForeName", None),
-                "initials": getContent(author, ".//Initials", None),
-                "affiliation": getContent(author, ".//AffiliationInfo/Affiliation", None),
-            }
+            Author(
+                lastname=getContent(author, ".//LastName", None),
+                firstname=getContent(author, ".//ForeName", None),
+                initials=getContent(author, ".//Initials", None),
+                affiliation=getContent(author, ".//AffiliationInfo/Affiliation", None),
+            )
             for author in xml_element.findall(".//Author")
         ]
 
@@ -139,6 +151,7 @@ class PubMedArticle(object):
         self.pubmed_id = self._extractPubMedId(xml_element)
         self.title = self._extractTitle(xml_element)
         self.keywords = self._extractKeywords(xml_element)
+        self.mesh_terms = self._extractMeshTerms(xml_element)
         self.journal = self._extractJournal(xml_element)
         self.abstract = self._extractAbstract(xml_element)
         self.structuredAbstract = self._extractStructuredAbstract(xml_element)
@@ -150,6 +163,7 @@ class PubMedArticle(object):
         self.publication_date = self._extractPublicationDate(xml_element)
         self.authors = self._extractAuthors(xml_element)
         self.xml = xml_element
+        self.links = None
 
     def toDict(self: object) -> dict:
         """ Helper method to convert the parsed information to a Python dict.
@@ -168,4 +182,5 @@ class PubMedArticle(object):
             },
             sort_keys=True,
             indent=4,
+            default=lambda value: value.toDict() if isinstance(value, Author) else str(value),
         )
@@ -0,0 +1,98 @@
+import sys
+
+from typing import Optional
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """ Helper method that returns the shared copy of a string (None stays None).
+    """
+
+    return None if value is None else sys.intern(value)
+
+
+class Author(object):
+    """ Compact, immutable record of an article author.
+
+        Names and affiliations are interned, so an investigator or an affiliation that
+        appears on many articles (or many times on a multi-center trial) is stored once.
+        Fields can be read as attributes or, like the dicts used before, by key
+        (author["lastname"], author.get("affiliation")).
+    """
+
+    __slots__ = ("lastname", "firstname", "initials", "affiliation", "collective")
+
+    def __init__(
+        self: object,
+        lastname: Optional[str] = None,
+        firstname: Optional[str] = None,
+        initials: Optional[str] = None,
+        affiliation: Optional[str] = None,
+        collective: Optional[str] = None,
+    ) -> None:
+        """ Initialization of the object.
+
+            Parameters:
+                - lastname      Str, family name.
+                - firstname     Str, given name(s).
+                - initials      Str, initials of the given name(s).
+                - affiliation   Str, first listed affiliation.
+                - collective    Str, name of a group author.
+
+            Returns:
+                - None
+        """
+
+        for field, value in zip(self.__slots__, (lastname, firstname, initials, affiliation, collective)):
+            object.__setattr__(self, field, _intern(value))
+
+    def __setattr__(self: object, name: str, value: object) -> None:
+        raise AttributeError("Author records are immutable")
+
+    def __reduce__(self: object) -> tuple:
+        # Rebuild through __init__, so unpickled records (e.g. from parse workers) are interned again
+        return (Author, tuple(getattr(self, field) for field in self.__slots__))
+
+    def __getitem__(self: object, key: str) -> Optional[str]:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self: object, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def keys(self: object) -> tuple:
+        return self.__slots__
+
+    def __eq__(self: object, other: object) -> bool:
+        return isinstance(other, Author) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__
+        )
+
+    def __hash__(self: object) -> int:
+        return hash(tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self: object) -> str:
+        return f"Author({self.displayName()!r})"
+
+    def displayName(self: object) -> str:
+        """ Return the author the way the digests show it ("Last, First I", or the group name).
+        """
+
+        if self.collective:
+            return self.collective
+        return f"{self.lastname}, {self.firstname} {self.initials}"
+
+    def indexKey(self: object) -> Optional[str]:
+        """ Return the lookup key of the author index, e.g. "smith jd" (None for group authors).
+        """
+
+        if not self.lastname:
+            return None
+        return f"{self.lastname} {self.initials or ''}".strip().lower()
+
+    def toDict(self: object) -> dict:
+        """ Helper method to convert the record to a Python dict.
+        """
+
+        return {field: getattr(self, field) for field in self.__slots__}
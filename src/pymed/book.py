@@ -4,6 +4,7 @@ import datetime
 from typing import TypeVar
 from typing import Optional
 
+from .author import Author
 from .helpers import getContent
 
 
@@ -25,6 +26,7 @@ class PubMedBookArticle(object):
         "sections",
         "publisher",
         "publisher_location",
+        "links",
     )
 
     def __init__(
@@ -91,12 +93,12 @@ class PubMedBookArticle(object):
 
     def _extractAuthors(self: object, xml_element: TypeVar("Element")) -> list:
         return [
-            {
-                "collective": getContent(author, path=".//CollectiveName"),
-                "lastname": getContent(element=author, path=".//LastName"),
-                "firstname": getContent(element=author, path=".//ForeName"),
-                "initials": getContent(element=author, path=".//Initials"),
-            }
+            Author(
+                collective=getContent(author, path=".//CollectiveName"),
+                lastname=getContent(element=author, path=".//LastName"),
+                firstname=getContent(element=author, path=".//ForeName"),
+                initials=getContent(element=author, path=".//Initials"),
+            )
             for author in xml_element.findall(".//Author")
         ]
 
@@ -127,6 +129,7 @@ class PubMedBookArticle(object):
         self.publisher = self._extractPublisher(xml_element)
         self.publisher_location = self._extractPublisherLocation(xml_element)
         self.sections = self._extractSections(xml_element)
+        self.links = None
 
     def toDict(self: object) -> dict:
         """ Helper method to convert the parsed information to a Python dict.
@@ -148,4 +151,5 @@ class PubMedBookArticle(object):
             },
             sort_keys=True,
             indent=4,
+            default=lambda value: value.toDict() if isinstance(value, Author) else str(value),
         )
@@ -0,0 +1,163 @@
+import json
+
+from typing import Optional
+
+from diskcache import Cache
+
+from .codec import CompressedDisk, recompress
+
+
+# Default time-to-live (seconds) per endpoint. Search results change as new articles are indexed, so they are only
+# reused for a short while; the records of a fixed set of PMIDs rarely change.
+DEFAULT_TTLS = {
+    "esearch": 60 * 60,
+    "efetch": 30 * 24 * 60 * 60,
+    "linkset": 24 * 60 * 60,
+}
+
+# Parameters that identify the caller rather than the request
+IGNORED_PARAMETERS = ("tool", "email")
+
+
+class ResponseCache(object):
+    """ Persistent, size-bounded cache of E-utilities responses.
+    """
+
+    def __init__(
+        self: object,
+        directory: str,
+        size_limit: int = 2 ** 30,
+        ttls: dict = None,
+        compression_level: int = 3,
+        metrics: object = None,
+    ) -> None:
+        """ Initialization of the object.
+
+            Parameters:
+                - directory     Str, directory of the on-disk cache.
+                - size_limit    Int, approximate maximum size of the cache in bytes; the least
+                                recently used responses are evicted beyond it.
+                - ttls          Dict, time-to-live in seconds per endpoint name (e.g. "esearch").
+                                Endpoints without a TTL are not cached. The link sets of
+                                articles are cached per article under "linkset" (elink
+                                responses themselves are not cached: their keys depend on
+                                the whole batch of IDs).
+                - compression_level Int, level of the compression of stored responses (see
+                                    codec.StorageCodec).
+                - metrics           Object, optional metrics registry providing
+                                    increment(name, value); the bytes of the responses stored
+                                    and of their compressed form are counted as
+                                    "pymed_cache_raw_bytes" and "pymed_cache_stored_bytes".
+
+            Returns:
+                - None
+        """
+
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._cache = Cache(
+            directory,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+            disk=CompressedDisk,
+            disk_codec_level=compression_level,
+        )
+        if metrics is not None:
+            self._cache.disk.codec.instrument(metrics, "pymed_cache")
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        """ Helper method that returns the endpoint name of a URL, e.g. "esearch".
+        """
+
+        return url.rsplit("/", 1)[-1].split(".")[0]
+
+    @staticmethod
+    def key(url: str, parameters: list) -> str:
+        """ Helper method that normalizes a request into a cache key.
+
+            Parameters:
+                - url           Str, last part of the requested URL.
+                - parameters    List, (name, value) pairs of the request.
+
+            Returns:
+                - key           Str, the URL followed by the parameters sorted by name (the
+                                order of repeated parameters, such as IDs, is kept).
+        """
+
+        pairs = sorted(
+            ((name, str(value)) for name, value in parameters if name not in IGNORED_PARAMETERS),
+            key=lambda pair: pair[0],
+        )
+        return url + "?" + "&".join(f"{name}={value}" for name, value in pairs)
+
+    def get(self: object, url: str, parameters: list) -> Optional[bytes]:
+        """ Return the cached response body for a request, or None.
+        """
+
+        if self.endpoint(url) not in self.ttls:
+            return None
+
+        return self._cache.get(self.key(url, parameters))
+
+    def set(self: object, url: str, parameters: list, body: bytes) -> None:
+        """ Store the response body of a request (compressed) with the endpoint's TTL.
+        """
+
+        ttl = self.ttls.get(self.endpoint(url))
+        if ttl is None:
+            return
+
+        self._cache.set(self.key(url, parameters), body, expire=ttl)
+
+    def getLinks(self: object, article_id: str) -> Optional[dict]:
+        """ Return the cached link set of an article, or None.
+        """
+
+        if "linkset" not in self.ttls:
+            return None
+
+        stored = self._cache.get(f"linkset:{article_id}")
+        return None if stored is None else json.loads(stored)
+
+    def setLinks(self: object, article_id: str, links: dict) -> None:
+        """ Store the link set of an article with the "linkset" TTL.
+        """
+
+        ttl = self.ttls.get("linkset")
+        if ttl is None:
+            return
+
+        self._cache.set(f"linkset:{article_id}", json.dumps(links).encode("utf-8"), expire=ttl)
+
+    def cull(self: object) -> int:
+        """ Remove expired responses, then evict responses beyond the size limit.
+
+            Returns:
+                - removed       Int, number of responses removed.
+        """
+
+        return self._cache.expire() + self._cache.cull()
+
+    def recompress(self: object) -> dict:
+        """ Rewrite the cached responses in the current compression format (see codec.recompress).
+        """
+
+        return recompress(self._cache)
+
+    def compressionRatio(self: object) -> Optional[float]:
+        """ Return the compression ratio of the responses stored since the cache was opened, or None.
+        """
+
+        return self._cache.disk.codec.ratio()
+
+    def volume(self: object) -> int:
+        """ Return the estimated size of the cache on disk in bytes.
+        """
+
+        return self._cache.volume()
+
+    def clear(self: object) -> None:
+        self._cache.clear()
+
+    def close(self: object) -> None:
+        self._cache.close()
@@ -0,0 +1,331 @@
+import io
+import json
+import os
+import time
+import zlib
+
+from typing import Optional, Union
+
+from diskcache import Disk, UNKNOWN
+from diskcache.core import MODE_BINARY, MODE_RAW
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# First byte of a stored record: how the rest is compressed, plus TEXT when the record is a string
+RAW, ZLIB, ZSTD = 0x00, 0x01, 0x02
+TEXT = 0x10
+
+# Records stored before the codec existed are bare zlib streams (E-utilities responses), whose first byte is 0x78, or
+# plain strings (summaries); both are still read as they are
+LEGACY_ZLIB = 0x78
+
+# Size of a trained zstd dictionary, and how many small records are sampled to train it
+DICTIONARY_SIZE = 64 * 1024
+DICTIONARY_SAMPLES = 5000
+DICTIONARY_MIN_SAMPLES = 100
+
+# Chunk size of streamed compression and decompression
+CHUNK_SIZE = 2 ** 20
+
+# Name of the file (in the cache directory) that records the format its entries were last rewritten in
+FORMAT_FILE = "codec.json"
+
+
+class StorageCodec(object):
+    """ Compression of cached records (bytes or strings).
+
+        Small records are compressed with zstd and a dictionary trained on the records of the
+        cache, as far as there is one; records of stream_threshold bytes or more are compressed
+        in chunks without a dictionary. Without the optional zstandard package, records are
+        compressed with zlib. Every record starts with a header byte naming its format, so
+        records written in any format (including those written before the codec) stay readable.
+    """
+
+    def __init__(
+        self: object, directory: str = None, level: int = 3, stream_threshold: int = 2 ** 16
+    ) -> None:
+        """ Initialization of the object.
+
+            Parameters:
+                - directory         Str, cache directory; trained dictionaries are kept in its
+                                    "dictionaries" subdirectory. Without one, no dictionary is
+                                    used.
+                - level             Int, compression level (zstd levels also suit zlib).
+                - stream_threshold  Int, size in bytes from which records are compressed in
+                                    chunks (and without a dictionary).
+
+            Returns:
+                - None
+        """
+
+        self.level = level
+        self.streamThreshold = stream_threshold
+        self.directory = None if directory is None else os.path.join(directory, "dictionaries")
+        self.dictionaries = {}
+        self.dictionary = None
+
+        # Bytes of the records encoded, and of what was stored for them
+        self.rawBytes = 0
+        self.storedBytes = 0
+        self._metrics = None
+        self._prefix = None
+
+        if zstandard is not None and self.directory is not None and os.path.isdir(self.directory):
+            # The newest dictionary compresses; all of them decompress
+            for name in sorted(os.listdir(self.directory), key=lambda name: os.path.getmtime(os.path.join(self.directory, name))):
+                if name.endswith(".zdict"):
+                    self.dictionary = self._loadDictionary(os.path.join(self.directory, name))
+
+    def instrument(self: object, metrics: object, prefix: str) -> None:
+        """ Count the bytes of encoded records and of their stored form in a metrics registry
+            providing increment(name, value), as "<prefix>_raw_bytes" and "<prefix>_stored_bytes".
+        """
+
+        self._metrics = metrics
+        self._prefix = prefix
+
+    def ratio(self: object) -> Optional[float]:
+        """ Return the compression ratio of the records encoded so far, or None.
+        """
+
+        return None if self.storedBytes == 0 else self.rawBytes / self.storedBytes
+
+    def format(self: object) -> dict:
+        """ Return a description of the format new records are written in.
+        """
+
+        return {
+            "compression": "zlib" if zstandard is None else "zstd",
+            "dictionary": None if self.dictionary is None else self.dictionary.dict_id(),
+        }
+
+    def _loadDictionary(self: object, path: str) -> object:
+        with open(path, "rb") as reader:
+            dictionary = zstandard.ZstdCompressionDict(reader.read())
+        self.dictionaries[dictionary.dict_id()] = dictionary
+        return dictionary
+
+    def _dictionaryById(self: object, dict_id: int) -> object:
+        """ Helper method that returns a dictionary by ID (one trained by another process is
+            loaded when it is first needed).
+        """
+
+        if dict_id not in self.dictionaries and self.directory is not None:
+            path = os.path.join(self.directory, f"{dict_id}.zdict")
+            if os.path.exists(path):
+                self._loadDictionary(path)
+        if dict_id not in self.dictionaries:
+            raise ValueError(f"Cached record needs the unknown zstd dictionary {dict_id}")
+        return self.dictionaries[dict_id]
+
+    def _record(self: object, raw: int, stored: int) -> None:
+        self.rawBytes += raw
+        self.storedBytes += stored
+        if self._metrics is not None:
+            self._metrics.increment(f"{self._prefix}_raw_bytes", raw)
+            self._metrics.increment(f"{self._prefix}_stored_bytes", stored)
+
+    def encode(self: object, record: Union[bytes, str]) -> bytes:
+        """ Return the stored form of a record.
+        """
+
+        text = TEXT if isinstance(record, str) else 0
+        data = record.encode("utf-8") if text else record
+
+        if zstandard is not None:
+            # Dictionaries are trained on, and only help, small records
+            dictionary = self.dictionary if len(data) < self.streamThreshold else None
+            compressed = bytes([ZSTD | text]) + zstandard.ZstdCompressor(level=self.level, dict_data=dictionary).compress(data)
+        else:
+            compressed = bytes([ZLIB | text]) + zlib.compress(data, min(self.level, 9))
+
+        stored = compressed if len(compressed) < len(data) + 1 else bytes([RAW | text]) + data
+        self._record(len(data), len(stored))
+        return stored
+
+    def encodeChunks(self: object, record: Union[bytes, str]) -> object:
+        """ Yield the stored form of a (large) record in chunks, compressing one chunk at a time.
+        """
+
+        text = TEXT if isinstance(record, str) else 0
+        data = memoryview(record.encode("utf-8") if text else record)
+
+        if zstandard is not None:
+            header = ZSTD | text
+            compressor = zstandard.ZstdCompressor(level=self.level).compressobj(size=len(data))
+        else:
+            header = ZLIB | text
+            compressor = zlib.compressobj(min(self.level, 9))
+
+        yield bytes([header])
+        stored = 1
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = compressor.compress(data[start:start + CHUNK_SIZE])
+            stored += len(chunk)
+            yield chunk
+        chunk = compressor.flush()
+        stored += len(chunk)
+        yield chunk
+        self._record(len(data), stored)
+
+    def decode(self: object, stored: Union[bytes, str]) -> Union[bytes, str]:
+        """ Return the record of a stored form.
+        """
+
+        if isinstance(stored, str):
+            return stored
+        return self.decodeFrom(io.BytesIO(stored))
+
+    def decodeFrom(self: object, reader: object) -> Union[bytes, str]:
+        """ Return the record of a stored form read from a binary file, decompressing one chunk
+            at a time.
+        """
+
+        first = reader.read(CHUNK_SIZE)
+        if len(first) == 0:
+            return b""
+        header = first[0]
+
+        if header == LEGACY_ZLIB:
+            decompressor, chunk = zlib.decompressobj(), first
+        else:
+            chunk = first[1:]
+            if header & 0x0F == RAW:
+                decompressor = None
+            elif header & 0x0F == ZLIB:
+                decompressor = zlib.decompressobj()
+            elif header & 0x0F == ZSTD:
+                if zstandard is None:
+                    raise ImportError("Cached record is compressed with zstd, which requires the optional 'zstandard' package")
+                dict_id = zstandard.get_frame_parameters(chunk).dict_id
+                dictionary = self._dictionaryById(dict_id) if dict_id else None
+                decompressor = zstandard.ZstdDecompressor(dict_data=dictionary).decompressobj()
+            else:
+                raise ValueError(f"Unknown cached record format {header}")
+
+        parts = []
+        while len(chunk) > 0:
+            parts.append(chunk if decompressor is None else decompressor.decompress(chunk))
+            chunk = reader.read(CHUNK_SIZE)
+        data = b"".join(parts)
+
+        return data.decode("utf-8") if header != LEGACY_ZLIB and header & TEXT else data
+
+    def trainDictionary(self: object, samples: list) -> Optional[int]:
+        """ Train a dictionary on sample records and compress small records with it from now on.
+
+            Parameters:
+                - samples       List, records (bytes or strings) like the ones to compress.
+
+            Returns:
+                - dict_id       Int, ID of the new dictionary, or None when zstandard is not
+                                installed, there is no cache directory or there are too few
+                                samples.
+        """
+
+        if zstandard is None or self.directory is None or len(samples) < DICTIONARY_MIN_SAMPLES:
+            return None
+
+        samples = [sample.encode("utf-8") if isinstance(sample, str) else sample for sample in samples]
+        dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples, level=self.level)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{dictionary.dict_id()}.zdict")
+        with open(path + ".tmp", "wb") as writer:
+            writer.write(dictionary.as_bytes())
+        os.replace(path + ".tmp", path)
+
+        self.dictionary = self._loadDictionary(path)
+        return self.dictionary.dict_id()
+
+
+class CompressedDisk(Disk):
+    """ diskcache serialization that stores bytes and string values through a StorageCodec.
+
+        Use it as Cache(directory, disk=CompressedDisk); the codec is Cache.disk.codec. Other
+        values (and file-like values) are stored as diskcache stores them.
+    """
+
+    def __init__(
+        self: object, directory: str, codec_level: int = 3, codec_stream_threshold: int = 2 ** 16, **kwargs
+    ) -> None:
+        super().__init__(directory, **kwargs)
+        self.codec = StorageCodec(directory, level=codec_level, stream_threshold=codec_stream_threshold)
+
+    def store(self: object, value: object, read: bool, key: object = UNKNOWN) -> tuple:
+        if read or type(value) not in (bytes, str):
+            return super().store(value, read, key)
+
+        if len(value) < self.codec.streamThreshold:
+            return super().store(self.codec.encode(value), read, key)
+
+        # Large values are compressed into their file as they are written
+        filename, full_path = self.filename(key, value)
+        size = self._write(full_path, self.codec.encodeChunks(value), "xb")
+        return size, MODE_BINARY, filename, None
+
+    def fetch(self: object, mode: int, filename: str, value: object, read: bool) -> object:
+        if read:
+            return super().fetch(mode, filename, value, read)
+        if mode == MODE_BINARY:
+            with open(os.path.join(self._directory, filename), "rb") as reader:
+                return self.codec.decodeFrom(reader)
+
+        fetched = super().fetch(mode, filename, value, read)
+        return self.codec.decode(fetched) if mode == MODE_RAW and isinstance(fetched, bytes) else fetched
+
+
+def recompress(cache: object, train: bool = True) -> dict:
+    """ Rewrite the entries of a cache opened with CompressedDisk in the codec's current format.
+
+        Entries written before the codec, or before the current dictionary was trained, stay
+        readable; this reclaims the space they take. With train, a dictionary is first trained
+        on the small records of the cache if there is none yet. The format the entries were
+        rewritten in is recorded in the cache directory, so a cache already in the current format
+        is left as it is. Entries keep their expiry times.
+
+        Parameters:
+            - cache         diskcache.Cache, opened with disk=CompressedDisk.
+            - train         Bool, whether a dictionary may be trained.
+
+        Returns:
+            - report        Dict, the number of entries rewritten and the format.
+    """
+
+    codec = cache.disk.codec
+    path = os.path.join(cache.directory, FORMAT_FILE)
+    recorded = None
+    if os.path.exists(path):
+        with open(path, "r") as reader:
+            recorded = json.load(reader)
+
+    if train and codec.dictionary is None:
+        samples = []
+        for key in cache.iterkeys():
+            value = cache.get(key, retry=True)
+            if isinstance(value, (bytes, str)) and len(value) < codec.streamThreshold:
+                samples.append(value)
+            if len(samples) >= DICTIONARY_SAMPLES:
+                break
+        codec.trainDictionary(samples)
+
+    if recorded == codec.format():
+        return {"rewritten": 0, "format": recorded}
+
+    rewritten = 0
+    for key in list(cache.iterkeys()):
+        value, expire_time = cache.get(key, expire_time=True, retry=True)
+        if not isinstance(value, (bytes, str)):
+            continue
+        expire = None if expire_time is None else expire_time - time.time()
+        if expire is not None and expire <= 0:
+            continue
+        cache.set(key, value, expire=expire, retry=True)
+        rewritten += 1
+
+    with open(path, "w") as writer:
+        json.dump(codec.format(), writer)
+    return {"rewritten": rewritten, "format": codec.format()}
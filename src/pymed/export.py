@@ -0,0 +1,121 @@
+import datetime
+
+from typing import Iterable
+
+# pyarrow is an optional dependency, only needed for the columnar export
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Supported output formats and their usual file extensions
+FORMATS = {"parquet": ".parquet", "arrow": ".arrows"}
+
+
+def exportAvailable() -> bool:
+    """ Return whether the columnar export can run (the optional pyarrow package is installed).
+    """
+
+    return pyarrow is not None
+
+
+def _schema() -> "pyarrow.Schema":
+    """ Helper method that returns the Arrow schema of the exported table.
+    """
+
+    return pyarrow.schema(
+        [
+            ("pubmed_id", pyarrow.int64()),
+            ("publication_date", pyarrow.date32()),
+            ("journal", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ("doi", pyarrow.string()),
+            ("title", pyarrow.string()),
+            ("abstract", pyarrow.string()),
+            ("authors", pyarrow.list_(pyarrow.string())),
+            ("keywords", pyarrow.list_(pyarrow.string())),
+        ]
+    )
+
+
+def _row(article: object) -> tuple:
+    """ Helper method that extracts the exported columns from an article object.
+    """
+
+    pubmed_id = getattr(article, "pubmed_id", None)
+    publication_date = getattr(article, "publication_date", None)
+
+    return (
+        int(pubmed_id) if pubmed_id is not None and pubmed_id.isdigit() else None,
+        publication_date if isinstance(publication_date, datetime.date) else None,
+        getattr(article, "journal", None),
+        getattr(article, "doi", None),
+        getattr(article, "title", None),
+        getattr(article, "abstract", None),
+        [author.displayName() for author in (getattr(article, "authors", None) or [])],
+        list(getattr(article, "keywords", None) or []),
+    )
+
+
+def _recordBatch(schema: "pyarrow.Schema", rows: list) -> "pyarrow.RecordBatch":
+    """ Helper method that turns a list of row tuples into a typed record batch.
+    """
+
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pyarrow.types.is_dictionary(field.type):
+            arrays.append(pyarrow.array(values, type=pyarrow.string()).dictionary_encode())
+        else:
+            arrays.append(pyarrow.array(values, type=field.type))
+
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def exportArticles(
+    articles: Iterable, path: str, format: str = "parquet", row_group_size: int = 10000
+) -> int:
+    """ Helper method that writes articles to a columnar file, one row group at a time,
+        so only row_group_size articles are held in column buffers at once.
+
+        Parameters:
+            - articles          Iterable, PubMedArticle / PubMedBookArticle objects.
+            - path              Str, output file name.
+            - format            Str, "parquet" or "arrow" (Arrow IPC stream format).
+            - row_group_size    Int, number of articles per row group / record batch.
+
+        Returns:
+            - count             Int, number of articles written.
+    """
+
+    if pyarrow is None:
+        raise ImportError("Columnar export requires the optional 'pyarrow' package")
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {sorted(FORMATS)}")
+
+    schema = _schema()
+    if format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        # The stream format allows each batch to carry its own journal dictionary
+        options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        writer = pyarrow.ipc.new_stream(path, schema, options=options)
+
+    count = 0
+    rows = []
+    try:
+        for article in articles:
+            rows.append(_row(article))
+            if len(rows) >= row_group_size:
+                writer.write_batch(_recordBatch(schema, rows))
+                count += len(rows)
+                rows = []
+
+        if rows:
+            writer.write_batch(_recordBatch(schema, rows))
+            count += len(rows)
+    finally:
+        writer.close()
+
+    return count
@@ -0,0 +1,84 @@
+import xml.etree.ElementTree as xml
+
+from .article import PubMedArticle
+from .book import PubMedBookArticle
+
+
+def parseArticles(response: str) -> list:
+    """ Helper method that parses an efetch response body into article objects.
+
+        Parameters:
+            - response      Str, XML text returned by the efetch endpoint.
+
+        Returns:
+            - articles      List, PubMedArticle and PubMedBookArticle objects.
+    """
+
+    # Parse as XML
+    root = xml.fromstring(response)
+
+    # Loop over the articles and construct article objects
+    articles = [PubMedArticle(xml_element=article) for article in root.iter("PubmedArticle")]
+    articles += [PubMedBookArticle(xml_element=book) for book in root.iter("PubmedBookArticle")]
+
+    return articles
+
+
+# Record layouts used to ship parsed articles between processes. The XML element is
+# dropped so records stay small and picklable.
+_RECORD_FIELDS = {
+    "article": tuple(field for field in PubMedArticle.__slots__ if field != "xml"),
+    "book": PubMedBookArticle.__slots__,
+}
+_RECORD_CLASSES = {"article": PubMedArticle, "book": PubMedBookArticle}
+
+
+def parseArticleRecords(response: str) -> list:
+    """ Helper method that parses an efetch response body into compact records.
+        Intended to run in a worker process.
+
+        Parameters:
+            - response      Str, XML text returned by the efetch endpoint.
+
+        Returns:
+            - records       List, (kind, values) tuples that can be turned back
+                            into article objects with articlesFromRecords.
+    """
+
+    return articleRecords(parseArticles(response))
+
+
+def articleRecords(articles: list) -> list:
+    """ Helper method that turns article objects into compact records.
+
+        Parameters:
+            - articles      List, PubMedArticle and PubMedBookArticle objects.
+
+        Returns:
+            - records       List, (kind, values) tuples that can be turned back
+                            into article objects with articlesFromRecords.
+    """
+
+    records = []
+    for article in articles:
+        kind = "book" if isinstance(article, PubMedBookArticle) else "article"
+        records.append((kind, tuple(getattr(article, field, None) for field in _RECORD_FIELDS[kind])))
+
+    return records
+
+
+def articlesFromRecords(records: list) -> list:
+    """ Helper method that rebuilds article objects from parseArticleRecords output.
+
+        Parameters:
+            - records       List, (kind, values) tuples.
+
+        Returns:
+            - articles      List, PubMedArticle and PubMedBookArticle objects
+                            (without their XML element).
+    """
+
+    return [
+        _RECORD_CLASSES[kind](**dict(zip(_RECORD_FIELDS[kind], values)))
+        for kind, values in records
+    ]
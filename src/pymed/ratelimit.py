@@ -0,0 +1,52 @@
+import asyncio
+import collections
+import time
+
+
+class AsyncRateLimiter(object):
+    """ Sliding-window rate limiter for coroutines sharing one API quota.
+    """
+
+    def __init__(self: object, max_requests: int = 3, period: float = 1.0) -> None:
+        """ Initialization of the object.
+
+            Parameters:
+                - max_requests  Int, number of requests allowed per period.
+                - period        Float, length of the window in seconds.
+
+            Returns:
+                - None
+        """
+
+        self.max_requests = max_requests
+        self.period = period
+
+        # Start times of the requests made within the current window
+        self._requestsMade = collections.deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self: object) -> None:
+        """ Wait until a request can be made without exceeding the rate limit.
+        """
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                # Forget requests that have left the window
+                while self._requestsMade and self._requestsMade[0] <= now - self.period:
+                    self._requestsMade.popleft()
+
+                if len(self._requestsMade) < self.max_requests:
+                    self._requestsMade.append(now)
+                    return
+
+                # Sleep until the oldest request leaves the window (instead of spinning)
+                await asyncio.sleep(self._requestsMade[0] + self.period - now)
+
+    async def __aenter__(self: object) -> "AsyncRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self: object, *exc_info) -> None:
+        return None
@@ -0,0 +1,42 @@
+# Compiles the journals and the ad hoc query chosen in the GUI into a single, flat PubMed search term.
+#
+# Journals become one OR-list ("A"[journal] OR "B"[journal] OR ...) instead of one extra level of parentheses per
+# journal, duplicates are dropped and whitespace is normalized, so the same selection always produces the same term
+# (which also keeps the E-utilities response cache effective).
+
+import re
+
+# Journal names may already carry a field tag, e.g. 'Family medicine"[Journal]'
+JOURNAL_TAG = re.compile(r'\s*"?\s*\[(journal|ta|jour)\]\s*$', re.IGNORECASE)
+
+
+def normalize_whitespace(text):
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def journal_term(journal):
+    name = JOURNAL_TAG.sub('', normalize_whitespace(journal)).strip().strip('"').strip()
+    return f'"{name}"[journal]'
+
+
+def journal_query(journals):
+    # One flat OR-list, keeping the first occurrence of each journal
+    terms = []
+    seen = set()
+    for journal in journals or []:
+        term = journal_term(journal)
+        if term.lower() not in seen and term != '""[journal]':
+            seen.add(term.lower())
+            terms.append(term)
+    return ' OR '.join(terms)
+
+
+def compile_query(journals=None, written_query=None):
+    journals_term = journal_query(journals)
+    written_term = normalize_whitespace(written_query)
+
+    if journals_term == '':
+        return written_term
+    if written_term == '':
+        return journals_term
+    return f'({written_term}) OR ({journals_term})'
@@ -0,0 +1,76 @@
+# The long-lived resources a run uses: the E-utilities client and its response cache, the OpenAI summary cache, the
+# summarizer backend (for a local model, the loaded model) and the per-profile indices.
+#
+# executeMain takes them from a RunResources. A one-off run opens them as it needs them and closes them all when it is
+# done (release). The daemon keeps one RunResources with keep_open=True for its whole life: later runs reuse the open
+# connections, caches and models, release only commits the indices, and everything is closed at shutdown.
+
+import os
+from globalconf import globalconf
+from pymed import PubMed, ResponseCache
+from oai import summarizer_backend, open_cache
+from search_index import SearchIndex
+from dedup import NearDuplicateIndex
+from metrics import METRICS
+
+
+class RunResources:
+    def __init__(self, keep_open=False):
+        self.keep_open = keep_open
+        self._eutils_cache = None
+        self._pubmed = None
+        self._summary_cache = None
+        self._summarizers = {}      # Backend settings -> backend
+        self._indices = {}          # (kind, output directory) -> index
+
+    def pubmed(self):
+        # Repeated searches and fetches are answered from a persistent response cache
+        if self._pubmed is None:
+            self._eutils_cache = ResponseCache(os.path.join(globalconf.CACHEDIR, globalconf.CACHE_EUTILS), size_limit=globalconf.CACHE_EUTILS_SIZE_LIMIT,
+                                               compression_level=globalconf.CACHE_COMPRESSION_LEVEL, metrics=METRICS)
+            self._pubmed = PubMed(tool=globalconf.NLM_TOOL_NAME, email=globalconf.NLM_EMAIL, metrics=METRICS, base_url=globalconf.NLM_BASE_URL, cache=self._eutils_cache)
+        return self._pubmed
+
+    def summary_cache(self):
+        if self._summary_cache is None:
+            self._summary_cache = open_cache()
+        return self._summary_cache
+
+    def summarizer(self, conf):
+        # One backend per distinct summarizer configuration (profiles may use different models or keys)
+        key = (conf.SUMMARIZER, conf.API_KEY, conf.GPT_MODEL, conf.PACKED, conf.LOCAL_MODEL, conf.SUMMARIZER_THREADS)
+        if key not in self._summarizers:
+            self._summarizers[key] = summarizer_backend(conf)
+        return self._summarizers[key]
+
+    def search_index(self, basedir):
+        key = ('search', basedir)
+        if key not in self._indices:
+            self._indices[key] = SearchIndex.for_basedir(basedir)
+        return self._indices[key]
+
+    def dedup_index(self, basedir):
+        key = ('dedup', basedir)
+        if key not in self._indices:
+            self._indices[key] = NearDuplicateIndex.for_basedir(basedir)
+        return self._indices[key]
+
+    def release(self):
+        # The end of a run: commit what it wrote, and close everything unless the resources are kept open
+        if not self.keep_open:
+            self.close()
+            return
+        for index in self._indices.values():
+            index.connection.commit()
+
+    def close(self):
+        for index in self._indices.values():
+            index.close()
+        for summarizer in self._summarizers.values():
+            summarizer.close()
+        if self._summary_cache is not None:
+            self._summary_cache.close()
+        if self._pubmed is not None:
+            self._pubmed.close()
+            self._eutils_cache.close()
+        self.__init__(self.keep_open)
@@ -0,0 +1,163 @@
+# Local full-text index over the articles and summaries that have gone into digests.
+#
+# The index is a SQLite database using the FTS5 extension (bundled with the SQLite that ships with Python). Each
+# article is stored once, keyed by PMID, so re-indexing an article (e.g., with a newer summary) replaces it.
+#
+# The same database holds the author index: one row per author of every indexed article, keyed by "lastname initials"
+# (lowercase, e.g. "smith jd"), so watching investigators is an indexed lookup instead of a PubMed search.
+
+import datetime
+import os
+import re
+import sqlite3
+from globalconf import globalconf
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS documents (
+                pmid INTEGER PRIMARY KEY,
+                title TEXT,
+                journal TEXT,
+                publication_date TEXT,
+                indexed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_publication_date ON documents(publication_date);
+            CREATE TABLE IF NOT EXISTS authors (
+                pmid INTEGER,
+                position INTEGER,
+                author_key TEXT,
+                name TEXT,
+                affiliation TEXT,
+                PRIMARY KEY (pmid, position)
+            );
+            CREATE INDEX IF NOT EXISTS authors_key ON authors(author_key);
+            CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(
+                title, abstract, terms, summary,
+                tokenize = 'porter unicode61'
+            );
+        ''')
+
+    @staticmethod
+    def for_basedir(basedir):
+        # Every output directory (profile) keeps its own index next to its processed PMID file
+        return SearchIndex(os.path.join(basedir, globalconf.SEARCH_INDEX))
+
+    def add_article(self, article, summary=None):
+        # The FTS rowid is the PMID itself, which makes replacing an article a primary-key operation
+        if article.pubmed_id is None or not article.pubmed_id.isdigit():
+            return
+        pmid = int(article.pubmed_id)
+
+        # Index the structured abstract with its section labels, so "RESULTS: ..." is searchable too
+        sections = getattr(article, 'structuredAbstract', None) or []
+        abstract = "\n".join(f'{label}: {text}' if label != "" else text for label, text in sections)
+        if abstract == "" and article.abstract is not None:
+            abstract = article.abstract
+
+        # MeSH headings and author keywords are indexed together as "terms"
+        terms = "; ".join((getattr(article, 'mesh_terms', None) or []) + (getattr(article, 'keywords', None) or []))
+
+        publication_date = article.publication_date
+        if isinstance(publication_date, datetime.date):
+            publication_date = publication_date.isoformat()
+
+        self.connection.execute('DELETE FROM articles WHERE rowid = ?', (pmid,))
+        self.connection.execute(
+            'INSERT INTO articles(rowid, title, abstract, terms, summary) VALUES (?, ?, ?, ?, ?)',
+            (pmid, article.title, abstract, terms, summary)
+        )
+        self.connection.execute('DELETE FROM authors WHERE pmid = ?', (pmid,))
+        self.connection.executemany(
+            'INSERT INTO authors(pmid, position, author_key, name, affiliation) VALUES (?, ?, ?, ?, ?)',
+            [(pmid, position, author.indexKey(), author.displayName(), author.get('affiliation'))
+             for position, author in enumerate(getattr(article, 'authors', None) or [])
+             if author.indexKey() is not None]
+        )
+        self.connection.execute(
+            'INSERT OR REPLACE INTO documents(pmid, title, journal, publication_date, indexed_at) VALUES (?, ?, ?, ?, ?)',
+            (pmid, article.title, getattr(article, 'journal', None), publication_date,
+             datetime.datetime.now().isoformat(timespec='seconds'))
+        )
+
+    def search(self, query, since=None, limit=20):
+        # Rank with BM25, weighting matches in the title and MeSH/keywords above matches in the abstract body
+        sql = '''
+            SELECT d.pmid, d.title, d.journal, d.publication_date,
+                   snippet(articles, -1, '[', ']', '...', 16) AS snippet,
+                   bm25(articles, 10.0, 1.0, 5.0, 2.0) AS score
+            FROM articles JOIN documents d ON d.pmid = articles.rowid
+            WHERE articles MATCH ? AND (? IS NULL OR d.publication_date >= ?)
+            ORDER BY score
+            LIMIT ?
+        '''
+        if isinstance(since, datetime.date):
+            since = since.isoformat()
+
+        try:
+            rows = self.connection.execute(sql, (query, since, since, limit)).fetchall()
+        except sqlite3.OperationalError:
+            # Not valid FTS5 syntax (e.g., "SGLT2-inhibitors"); search for the words as plain terms instead
+            words = re.findall(r'\w+', query)
+            if len(words) == 0:
+                return []
+            plain = " ".join(f'"{w}"' for w in words)
+            rows = self.connection.execute(sql, (plain, since, since, limit)).fetchall()
+
+        return [
+            {'pmid': str(pmid), 'title': title, 'journal': journal, 'publication_date': publication_date,
+             'snippet': snippet, 'score': -score}
+            for pmid, title, journal, publication_date, snippet, score in rows
+        ]
+
+    @staticmethod
+    def author_key(name):
+        # "Smith JD", "Smith, JD" or "smith j" -> "smith jd" / "smith j" (the last word is the initials)
+        words = re.sub(r'[,.]', ' ', name).lower().split()
+        if len(words) < 2:
+            return " ".join(words)
+        return f'{" ".join(words[:-1])} {words[-1]}'
+
+    def articles_by_authors(self, names, since=None, limit=100):
+        # Articles by any of the named authors, newest first. A name matches authors with the same last name whose
+        # initials start with the given ones ("Smith J" matches "Smith JD"); a last name alone matches any initials
+        if isinstance(since, datetime.date):
+            since = since.isoformat()
+
+        conditions = []
+        parameters = []
+        for name in names:
+            key = self.author_key(name)
+            conditions.append('(a.author_key = ? OR a.author_key LIKE ?)')
+            parameters += [key, (key if ' ' in key else key + ' ') + '%']
+
+        rows = self.connection.execute(f'''
+            SELECT d.pmid, d.title, d.journal, d.publication_date, group_concat(a.name, '; ')
+            FROM authors a JOIN documents d ON d.pmid = a.pmid
+            WHERE ({' OR '.join(conditions)}) AND (? IS NULL OR d.publication_date >= ?)
+            GROUP BY d.pmid
+            ORDER BY d.publication_date DESC
+            LIMIT ?
+        ''', parameters + [since, since, limit]).fetchall()
+
+        return [
+            {'pmid': str(pmid), 'title': title, 'journal': journal, 'publication_date': publication_date,
+             'authors': authors}
+            for pmid, title, journal, publication_date, authors in rows
+        ]
+
+    def commit(self):
+        self.connection.commit()
+
+    def optimize(self):
+        # Merge the FTS5 index segments into one and reclaim free pages
+        self.connection.execute("INSERT INTO articles(articles) VALUES('optimize')")
+        self.connection.commit()
+        self.connection.execute('VACUUM')
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
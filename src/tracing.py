@@ -0,0 +1,53 @@
+# Per-run trace of where the time went, as spans in the Chrome trace event format (open the file in chrome://tracing
+# or https://ui.perfetto.dev).
+#
+# Spans come from the same instrumentation as the metrics: every METRICS.timer block (E-utilities requests and
+# parsing in pymed, OpenAI requests and batches, each renderer, ...) is also recorded as a span while tracing is on,
+# with the thread it ran on. Like METRICS, a single TRACER is disabled by default and then records nothing;
+# executeMain enables it with --trace (or --profile) and exports it when the run is done.
+
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    def __init__(self):
+        self.reset(False)
+
+    def reset(self, enabled=None):
+        if enabled is not None:
+            self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.events = []            # Complete ("X") events; list.append is atomic, so threads can add spans freely
+        self.threads = {}           # Thread ident -> name
+
+    def add(self, name, start, end):
+        # A span from start to end (time.perf_counter() seconds); the category is the prefix of the name, e.g. "pymed"
+        if not self.enabled:
+            return
+        thread = threading.current_thread()
+        self.threads[thread.ident] = thread.name
+        self.events.append({
+            'name': name,
+            'cat': name.split('_', 1)[0],
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,     # Microseconds
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        })
+
+    def to_dict(self):
+        thread_names = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}}
+                        for ident, name in self.threads.items()]
+        return {'traceEvents': thread_names + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+
+# The registry shared by the whole program
+TRACER = Tracer()
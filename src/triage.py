@@ -0,0 +1,193 @@
+# Local relevance triage: rank the articles of a digest before they are sent for summarization.
+#
+# The model is TF-IDF over the title, abstract and journal followed by logistic regression, trained on the
+# reviewer's past decisions: every saved DOCX digest in the output directory has an "Importance: ***" line per
+# article, and articles where the reviewer replaced the placeholder with a note count as relevant. Everything is
+# CPU-only NumPy; the sparse matrices are kept as CSR arrays (indptr/indices/data) so scoring a whole digest is a
+# handful of vectorized operations.
+
+import glob
+import os
+import re
+import numpy as np
+from globalconf import globalconf
+
+# Notes that mean the reviewer looked at the article and did not care about it
+NEGATIVE_NOTES = {'', '***', '-', 'none', 'no', 'n/a', 'na', 'skip', '0'}
+FOOTER_PATTERN = re.compile(r'^(\S+) - (.*) - (\d+) - (.*)$')
+# The citing/related articles line that may follow the footer (see formatting.format_links)
+LINKS_PREFIX = 'Cited by '
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+def features(title, abstract, journal):
+    # Title and abstract words are separate features (the same word in a title says more); the journal is one token
+    return ([f't:{w}' for w in tokenize(title)] +
+            [f'a:{w}' for w in tokenize(abstract)] +
+            ([f'j:{journal.lower()}'] if journal else []))
+
+
+def article_features(article):
+    return features(article.title, article.abstract, getattr(article, 'journal', None))
+
+
+class RelevanceModel:
+    def __init__(self, vocabulary, idf, weights, bias):
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        self.idf = idf
+        self.weights = weights
+        self.bias = bias
+
+    def _matrix(self, documents):
+        # TF-IDF (sublinear tf, L2-normalized rows) as CSR arrays; unknown terms are dropped
+        indptr = [0]
+        indices = []
+        data = []
+        for tokens in documents:
+            counts = {}
+            for token in tokens:
+                i = self.vocabulary.get(token)
+                if i is not None:
+                    counts[i] = counts.get(i, 0) + 1
+            row_indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            row_data = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))) * self.idf[row_indices]
+            norm = np.sqrt(np.sum(row_data ** 2))
+            indices.append(row_indices)
+            data.append(row_data / norm if norm > 0 else row_data)
+            indptr.append(indptr[-1] + len(counts))
+
+        return (np.array(indptr, dtype=np.int64),
+                np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+                np.concatenate(data) if data else np.zeros(0))
+
+    @staticmethod
+    def _dot(matrix, weights):
+        # Row-wise sparse dot product
+        indptr, indices, data = matrix
+        products = np.concatenate([[0.0], np.cumsum(data * weights[indices])])
+        return products[indptr[1:]] - products[indptr[:-1]]
+
+    def score(self, articles):
+        # Probability of relevance for every article, in one batch
+        if len(articles) == 0:
+            return np.zeros(0)
+        matrix = self._matrix([article_features(a) for a in articles])
+        return 1.0 / (1.0 + np.exp(-(self._dot(matrix, self.weights) + self.bias)))
+
+    @staticmethod
+    def train(documents, labels, min_df=2, max_features=50000, l2=1e-3, iterations=500, learning_rate=2.0):
+        labels = np.asarray(labels, dtype=np.float64)
+
+        # Vocabulary: terms in at least min_df documents, keeping the most frequent ones
+        document_frequency = {}
+        for tokens in documents:
+            for token in set(tokens):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        vocabulary = sorted((t for t, df in document_frequency.items() if df >= min_df),
+                            key=lambda t: -document_frequency[t])[:max_features]
+        df = np.array([document_frequency[t] for t in vocabulary], dtype=np.float64)
+        idf = np.log((1.0 + len(documents)) / (1.0 + df)) + 1.0
+
+        model = RelevanceModel(vocabulary, idf, np.zeros(len(vocabulary)), 0.0)
+        indptr, indices, data = matrix = model._matrix(documents)
+        row_of_entry = np.repeat(np.arange(len(documents)), np.diff(indptr))
+
+        # Balance the classes: relevant articles are usually a small minority
+        positives = max(labels.sum(), 1.0)
+        negatives = max(len(labels) - labels.sum(), 1.0)
+        sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+
+        # Full-batch gradient descent on the weighted, L2-regularized logistic loss
+        for _ in range(iterations):
+            predictions = 1.0 / (1.0 + np.exp(-(model._dot(matrix, model.weights) + model.bias)))
+            residuals = sample_weights * (predictions - labels) / len(labels)
+            gradient = np.bincount(indices, weights=data * residuals[row_of_entry], minlength=len(vocabulary))
+            model.weights -= learning_rate * (gradient + l2 * model.weights)
+            model.bias -= learning_rate * residuals.sum()
+
+        return model
+
+    def save(self, path):
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, vocabulary=np.array(vocabulary, dtype=str), idf=self.idf, weights=self.weights,
+                                bias=np.array([self.bias]))
+
+    @staticmethod
+    def load(path):
+        stored = np.load(path)
+        return RelevanceModel(list(stored['vocabulary']), stored['idf'], stored['weights'], float(stored['bias'][0]))
+
+    @staticmethod
+    def for_basedir(basedir):
+        # The model for this output directory, or None if none has been trained yet
+        path = os.path.join(basedir, globalconf.TRIAGE_MODEL)
+        return RelevanceModel.load(path) if os.path.exists(path) else None
+
+
+def reviewed_articles(basedir):
+    """Harvest (pmid, features, label) from the reviewed DOCX digests in the output directory."""
+    from docx import Document
+
+    examples = {}
+    for filename in sorted(glob.glob(os.path.join(basedir, globalconf.OUTPUT_DIRECTORY, '*.docx'))):
+        try:
+            paragraphs = [p.text.strip() for p in Document(filename).paragraphs]
+        except Exception:
+            continue
+
+        # Each article runs up to its footer line "date - journal - pmid - doi", which may be followed by a line of
+        # citing and related articles that still belongs to it
+        article_lines = []
+        after_footer = False
+        for text in paragraphs:
+            footer = FOOTER_PATTERN.match(text)
+            if footer is None:
+                if after_footer and text.startswith(LINKS_PREFIX):
+                    continue
+                if text != '':
+                    article_lines.append(text)
+                    after_footer = False
+                continue
+            after_footer = True
+
+            notes = [t for t in article_lines if t.startswith('Importance:')]
+            if len(article_lines) > 0 and len(notes) > 0:
+                note = notes[0][len('Importance:'):].strip()
+                abstract = [t for t in article_lines[2:] if not t.startswith('Importance:') and
+                            not t.startswith('Near-duplicate of:') and 'Summary: ' not in t[:30]]
+                label = 0 if note.lower() in NEGATIVE_NOTES else 1
+                # Later digests win if an article was reviewed more than once
+                examples[footer.group(3)] = (features(article_lines[0], "\n".join(abstract), footer.group(2)), label)
+            article_lines = []
+
+    return [(pmid, tokens, label) for pmid, (tokens, label) in examples.items()]
+
+
+def train_for_basedir(basedir):
+    examples = reviewed_articles(basedir)
+    labels = [label for _, _, label in examples]
+    if len(examples) == 0 or sum(labels) == 0 or sum(labels) == len(labels):
+        return None, examples
+
+    model = RelevanceModel.train([tokens for _, tokens, _ in examples], labels)
+    model.save(os.path.join(basedir, globalconf.TRIAGE_MODEL))
+    return model, examples
+
+
+def triage(model, articles, top_k=None, threshold=None):
+    """Order articles by relevance and choose which ones to summarize.
+
+    Returns the articles sorted by descending score and the set of PMIDs to summarize: the top_k best and/or those
+    scoring at or above threshold (all of them if neither is given).
+    """
+    scores = model.score(articles)
+    order = np.argsort(-scores, kind='stable')
+    selected = order if top_k is None else order[:top_k]
+    if threshold is not None:
+        selected = [i for i in selected if scores[i] >= threshold]
+
+    return [articles[i] for i in order], {articles[i].pubmed_id for i in selected}
@@ -0,0 +1,330 @@
+# Shared work queue for spreading summarization over several worker processes or machines.
+#
+# The coordinating run (executeMain with a work queue configured) enqueues the abstracts it needs summarized and works
+# on them itself; any number of "worker" commands lease batches from the same queue. Rendering the digests and the
+# processed PMID file stay with the coordinator, so there is still a single writer for both.
+#
+#   - A worker leases items for WORK_LEASE_SECONDS and keeps extending the lease (heartbeat) while it works on them.
+#     If it dies, the lease runs out and another worker picks the items up.
+#   - Completing an item is idempotent: the first result committed for a PMID wins, later commits (e.g. from a worker
+#     whose lease had run out) are ignored.
+#   - A worker that fails to summarize an item releases it; after WORK_MAX_ATTEMPTS it is marked failed.
+#
+# There is one queue per model (and instruction set), so a PMID is summarized once for all runs that share the queue.
+# The backend is an SQLite database (local processes) or a Redis-protocol server (several machines); RedisWorkQueue
+# only uses basic commands of a redis-py style client, so any compatible client or stand-in can be passed to it.
+
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from globalconf import globalconf
+
+# redis is optional; it is only needed for redis:// work queues
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+def worker_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def open_work_queue(url, name):
+    # A redis://, rediss:// or unix:// URL, or the path of an SQLite database (optionally as sqlite:///path)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        if redis is None:
+            raise ImportError('Redis work queues require the redis package (pip install redis)')
+        return RedisWorkQueue(redis.Redis.from_url(url), name)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SqliteWorkQueue(url, name)
+
+
+class SqliteWorkQueue:
+    def __init__(self, path, name):
+        self.name = name
+        self.lock = threading.Lock()    # The connection is shared with the heartbeat thread
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS work_items (
+                queue TEXT,
+                pmid TEXT,
+                abstract TEXT,
+                state TEXT,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER DEFAULT 0,
+                result TEXT,
+                PRIMARY KEY (queue, pmid)
+            );
+            CREATE INDEX IF NOT EXISTS work_items_state ON work_items(queue, state, lease_expires);
+        ''')
+
+    def enqueue(self, items):
+        # Add (pmid, abstract) items; items already queued are left as they are, except that failed ones are retried
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO work_items(queue, pmid, abstract, state) VALUES (?, ?, ?, ?)',
+                [(self.name, pmid, abstract, PENDING) for pmid, abstract in items])
+            self.connection.executemany(
+                'UPDATE work_items SET state = ?, attempts = 0 WHERE queue = ? AND pmid = ? AND state = ?',
+                [(PENDING, self.name, pmid, FAILED) for pmid, _ in items])
+            self.connection.execute('COMMIT')
+
+    def lease(self, worker, count, seconds):
+        # Take up to 'count' pending items (or items whose lease ran out); returns (pmid, abstract) pairs
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            items = self.connection.execute(
+                'SELECT pmid, abstract FROM work_items WHERE queue = ? AND (state = ? OR (state = ? AND lease_expires < ?)) '
+                'ORDER BY rowid LIMIT ?', (self.name, PENDING, LEASED, now, count)).fetchall()
+            self.connection.executemany(
+                'UPDATE work_items SET state = ?, worker = ?, lease_expires = ? WHERE queue = ? AND pmid = ?',
+                [(LEASED, worker, now + seconds, self.name, pmid) for pmid, _ in items])
+            self.connection.execute('COMMIT')
+        return items
+
+    def heartbeat(self, worker, pmids, seconds):
+        with self.lock:
+            self.connection.executemany(
+                'UPDATE work_items SET lease_expires = ? WHERE queue = ? AND pmid = ? AND worker = ? AND state = ?',
+                [(time.time() + seconds, self.name, pmid, worker, LEASED) for pmid in pmids])
+
+    def complete(self, worker, pmid, result):
+        # Returns True if this was the first result committed for the item
+        with self.lock:
+            cursor = self.connection.execute(
+                'UPDATE work_items SET state = ?, result = ?, worker = ? WHERE queue = ? AND pmid = ? AND state != ?',
+                (DONE, result, worker, self.name, pmid, DONE))
+        return cursor.rowcount == 1
+
+    def release(self, worker, pmid):
+        # Give up on an item; it is retried by any worker until it has failed WORK_MAX_ATTEMPTS times
+        with self.lock:
+            self.connection.execute(
+                'UPDATE work_items SET state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, attempts = attempts + 1, '
+                'worker = NULL WHERE queue = ? AND pmid = ? AND worker = ? AND state = ?',
+                (globalconf.WORK_MAX_ATTEMPTS, FAILED, PENDING, self.name, pmid, worker, LEASED))
+
+    def status(self, pmid):
+        # (state, result) of an item, or (None, None) if it was never queued
+        with self.lock:
+            row = self.connection.execute('SELECT state, result FROM work_items WHERE queue = ? AND pmid = ?',
+                                          (self.name, pmid)).fetchone()
+        return row if row is not None else (None, None)
+
+    def outstanding(self):
+        # Number of items still pending or leased
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM work_items WHERE queue = ? AND state IN (?, ?)',
+                                           (self.name, PENDING, LEASED)).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class RedisWorkQueue:
+    # Keys, all prefixed with "pyjournalwatch:<name>:":
+    #   abstracts   hash  pmid -> abstract (every item ever queued)
+    #   pending     list  pmids waiting for a worker
+    #   leases      zset  pmid -> lease expiry time
+    #   owners      hash  pmid -> worker holding the lease
+    #   attempts    hash  pmid -> failed attempts
+    #   results     hash  pmid -> summary (HSETNX, so the first result wins)
+    #   failed      set   pmids that failed WORK_MAX_ATTEMPTS times
+    # Each step is a single atomic command, so no scripting support is needed.
+    def __init__(self, client, name):
+        self.client = client
+        self.prefix = f'pyjournalwatch:{name}:'
+
+    def _key(self, name):
+        return self.prefix + name
+
+    @staticmethod
+    def _text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def enqueue(self, items):
+        for pmid, abstract in items:
+            if self.client.hsetnx(self._key('abstracts'), pmid, abstract):
+                self.client.rpush(self._key('pending'), pmid)
+            elif self.client.srem(self._key('failed'), pmid):
+                self.client.hdel(self._key('attempts'), pmid)
+                self.client.rpush(self._key('pending'), pmid)
+
+    def lease(self, worker, count, seconds):
+        now = time.time()
+        pmids = []
+        # Items whose lease ran out first; ZREM succeeds for exactly one of the workers trying to take one over
+        for pmid in self.client.zrangebyscore(self._key('leases'), '-inf', now, start=0, num=count):
+            if self.client.zrem(self._key('leases'), pmid):
+                pmids.append(self._text(pmid))
+        while len(pmids) < count:
+            pmid = self.client.lpop(self._key('pending'))
+            if pmid is None:
+                break
+            pmids.append(self._text(pmid))
+
+        items = []
+        for pmid in pmids:
+            if self.client.hexists(self._key('results'), pmid):
+                continue    # Completed by a worker whose lease had run out
+            self.client.zadd(self._key('leases'), {pmid: now + seconds})
+            self.client.hset(self._key('owners'), pmid, worker)
+            items.append((pmid, self._text(self.client.hget(self._key('abstracts'), pmid))))
+        return items
+
+    def heartbeat(self, worker, pmids, seconds):
+        for pmid in pmids:
+            if self._text(self.client.hget(self._key('owners'), pmid)) == worker:
+                self.client.zadd(self._key('leases'), {pmid: time.time() + seconds}, xx=True)
+
+    def complete(self, worker, pmid, result):
+        won = bool(self.client.hsetnx(self._key('results'), pmid, result))
+        self.client.zrem(self._key('leases'), pmid)
+        self.client.hdel(self._key('owners'), pmid)
+        return won
+
+    def release(self, worker, pmid):
+        if self._text(self.client.hget(self._key('owners'), pmid)) != worker:
+            return
+        self.client.hdel(self._key('owners'), pmid)
+        if not self.client.zrem(self._key('leases'), pmid):
+            return
+        if self.client.hincrby(self._key('attempts'), pmid, 1) >= globalconf.WORK_MAX_ATTEMPTS:
+            self.client.sadd(self._key('failed'), pmid)
+        else:
+            self.client.rpush(self._key('pending'), pmid)
+
+    def status(self, pmid):
+        result = self.client.hget(self._key('results'), pmid)
+        if result is not None:
+            return DONE, self._text(result)
+        if self.client.sismember(self._key('failed'), pmid):
+            return FAILED, None
+        if self.client.zscore(self._key('leases'), pmid) is not None:
+            return LEASED, None
+        if self.client.hexists(self._key('abstracts'), pmid):
+            return PENDING, None
+        return None, None
+
+    def outstanding(self):
+        return self.client.llen(self._key('pending')) + self.client.zcard(self._key('leases'))
+
+    def close(self):
+        self.client.close()
+
+
+@contextlib.contextmanager
+def heartbeat(work_queue, worker, pmids, seconds=None):
+    # Keep extending the leases on 'pmids' while the with-block runs
+    seconds = seconds or globalconf.WORK_LEASE_SECONDS
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(seconds / 3):
+            work_queue.heartbeat(worker, pmids, seconds)
+
+    thread = threading.Thread(target=beat, name='heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_leased(work_queue, worker, items, summarize):
+    # Summarize leased (pmid, abstract) items with summarize(items) -> iterable of (pmid, summary or None), committing
+    # every result (or releasing the item) as it comes back
+    with heartbeat(work_queue, worker, [pmid for pmid, _ in items]):
+        for pmid, summary in summarize(items):
+            if summary is None:
+                work_queue.release(worker, pmid)
+            else:
+                work_queue.complete(worker, pmid, summary)
+
+
+def run_worker(work_queue, summarize, batch_size, idle_seconds, worker=None):
+    # Work on the queue until it has had nothing to lease for idle_seconds; returns the number of items processed
+    worker = worker or worker_name()
+    processed = 0
+    idle_since = time.time()
+    while True:
+        items = work_queue.lease(worker, batch_size, globalconf.WORK_LEASE_SECONDS)
+        if len(items) > 0:
+            process_leased(work_queue, worker, items, summarize)
+            processed += len(items)
+            idle_since = time.time()
+        elif time.time() - idle_since > idle_seconds:
+            return processed
+        else:
+            time.sleep(globalconf.WORK_POLL_SECONDS)
+
+
+def summaries_from_queue(work_queue, items, summarize, batch_size, failure, worker=None, lookup=None, store=None):
+    # The coordinator's side: enqueue (pmid, abstract) items and yield (pmid, summary) pairs in their order, working on
+    # the queue while waiting for other workers; items that failed on every attempt yield 'failure'. With a local
+    # summary cache (lookup(pmid) -> summary or None, store(pmid, summary)), items it holds are not enqueued and the
+    # summaries read back from the queue are stored in it
+    worker = worker or worker_name()
+    cached = {}
+    if lookup is not None:
+        for pmid, _ in items:
+            summary = lookup(pmid)
+            if summary is not None:
+                cached[pmid] = summary
+    work_queue.enqueue([(pmid, abstract) for pmid, abstract in items if pmid not in cached])
+    for pmid, _ in items:
+        if pmid in cached:
+            yield pmid, cached[pmid]
+            continue
+        while True:
+            state, result = work_queue.status(pmid)
+            if state == DONE:
+                if store is not None:
+                    store(pmid, result)
+                yield pmid, result
+                break
+            if state == FAILED:
+                yield pmid, failure
+                break
+            leased = work_queue.lease(worker, batch_size, globalconf.WORK_LEASE_SECONDS)
+            if len(leased) > 0:
+                process_leased(work_queue, worker, leased, summarize)
+            else:
+                time.sleep(globalconf.WORK_POLL_SECONDS)
+
+
+@contextlib.contextmanager
+def profile_lock(basedir, stale_seconds=600):
+    # Exclusive lock on an output directory (e.g. around appending to its processed PMID file), held by creating a
+    # lock file; a lock file older than stale_seconds is assumed to be left over from a crashed run
+    path = os.path.join(basedir, '.lock')
+    while True:
+        try:
+            descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_seconds:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.1)
+    try:
+        os.write(descriptor, worker_name().encode('utf-8'))
+        os.close(descriptor)
+        yield
+    finally:
+        os.remove(path)